@@ -0,0 +1,86 @@
+"""
+Benchmark del downloader contra el API simulado (bench.mock_api).
+
+    python -m bench.download_bench --files 60 --size-mb 2 --file-latency 0.1 --error-rate 0.05
+
+Reporta páginas/s, archivos/s, MB/s y reintentos de un crawl completo.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+import downloader
+from bench.mock_api import MockOSCE
+
+
+def run_bench(args) -> dict:
+    base_cfg = yaml.safe_load((Path(__file__).resolve().parents[1] / "config.yaml").read_text(encoding="utf-8"))
+    with MockOSCE(sources=args.sources, files=args.files, per_page=args.per_page,
+                  size_mb=args.size_mb, page_latency=args.page_latency,
+                  file_latency=args.file_latency, error_rate=args.error_rate) as mock, \
+         tempfile.TemporaryDirectory(prefix="osce_bench_") as root:
+        cfg = dict(base_cfg,
+                   root_dir=root,
+                   api_endpoint=mock.endpoint,
+                   sources=args.sources,
+                   retry_backoff=args.backoff,
+                   retry_backoff_max=args.backoff * 8)
+        if args.workers:
+            cfg["max_workers"] = args.workers
+
+        t0 = time.perf_counter()
+        new_ids = downloader.run_download(365000, full=True, cfg=cfg)
+        secs = time.perf_counter() - t0
+
+    st = downloader.STATS.as_dict()
+    return {
+        "files_expected": args.files * len(args.sources),
+        "files_ok":       len(new_ids),
+        "seconds":        round(secs, 3),
+        "pages_s":        round(st["pages"] / secs, 2),
+        "files_s":        round(st["files"] / secs, 2),
+        "mb_s":           round(st["bytes"] / 1024 / 1024 / secs, 2),
+        "retries":        st["retries"],
+        "page_retries":   st["page_retries"],
+        "failed":         st["failed"],
+        "throttled":      st["throttled"],
+        "server":         mock.requests,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark del downloader contra un API OSCE simulado")
+    ap.add_argument("--sources", nargs="+", default=["seace_v3", "seace_v2"])
+    ap.add_argument("--files", type=int, default=24, help="archivos por fuente")
+    ap.add_argument("--per-page", type=int, default=10)
+    ap.add_argument("--size-mb", type=float, default=1.0, help="tamaño de cada ZIP")
+    ap.add_argument("--page-latency", type=float, default=0.05, help="segundos por página")
+    ap.add_argument("--file-latency", type=float, default=0.05, help="segundos hasta la cabecera del ZIP")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 503")
+    ap.add_argument("--workers", type=int, default=None, help="override de max_workers")
+    ap.add_argument("--backoff", type=float, default=0.1, help="retry_backoff para el benchmark")
+    ap.add_argument("--json", action="store_true", help="salida JSON")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    res = run_bench(args)
+    if args.json:
+        print(json.dumps(res, indent=2))
+        return
+    print(f"{res['files_ok']}/{res['files_expected']} archivos en {res['seconds']} s")
+    print(f"  páginas/s : {res['pages_s']}")
+    print(f"  archivos/s: {res['files_s']}")
+    print(f"  MB/s      : {res['mb_s']}")
+    print(f"  reintentos: {res['retries']} archivos · {res['page_retries']} páginas "
+          f"· {res['failed']} fallidos · {res['throttled']} frenadas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Benchmark de punta a punta de normalizer → consolidator → vistas NL2SQL
+sobre datos sintéticos (bench.synth_ocds) a varias escalas.
+
+    python -m bench.etl_bench                          # 1x, 10x, 100x
+    python -m bench.etl_bench --scales 1 10 --rows 200 --months 3
+    python -m bench.etl_bench --set consolidation_engine=pandas --out pandas.json
+    python -m bench.etl_bench --compare base.json nuevo.json
+
+Cada etapa corre en un proceso nuevo para medir su propio pico de memoria
+(el proceso y el mayor de sus hijos, p.ej. el pool de normalización).  El
+resultado (tiempos, filas/s, MB/s, pico de RSS, versiones y configuración)
+se escribe como JSON para comparar corridas.
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+from bench import synth_ocds
+
+STAGES = ("normalize", "consolidate", "views")
+
+
+# ── etapas (cada una en su propio proceso) ──────────────────
+def _stage_normalize(cfg: dict) -> dict:
+    import normalizer
+    res = normalizer.run_normalization(None, cfg)
+    return {"tasks":  len(res),
+            "errors": sum(r["status"] != "ok" for r in res),
+            "rows":   sum(r["rows"] for r in res),
+            "bytes":  sum(r.get("bytes", 0) for r in res)}
+
+def _stage_consolidate(cfg: dict) -> dict:
+    import consolidator, metrics
+    m = metrics.RunMetrics(cfg["root_dir"])
+    consolidator.run_consolidation(None, cfg, metrics=m)
+    tables = m.record["tables"].values()
+    size   = sum(f.stat().st_size for f in (Path(cfg["root_dir"]) / "processed").rglob("*.parquet"))
+    return {"tables":       len(m.record["tables"]),
+            "bytes":        size,
+            "rows":         sum(t.get("rows_read", 0) for t in tables),
+            "duplicates":   sum(t.get("duplicates", 0) for t in tables),
+            "rows_written": sum(t.get("rows_written", 0) for t in tables),
+            **m.record["extra"]}
+
+def _stage_views(cfg: dict) -> dict:
+    import duckdb
+    from nl2sql.sql_schema import build_views, current_snapshot
+    final = Path(cfg["root_dir"]) / "final"
+    con   = duckdb.connect()
+    t0    = time.perf_counter()
+    schema = build_views(con, final)
+    views_s = time.perf_counter() - t0
+    # recorrido completo de cada vista: lo que paga una consulta sin filtros
+    rows = sum(con.sql(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in schema)
+    con.close()
+    size = sum(f.stat().st_size for f in current_snapshot(final).glob("*.parquet"))
+    return {"views": len(schema), "build_views_s": round(views_s, 3), "rows": rows, "bytes": size}
+
+_RUNNERS = {"normalize": _stage_normalize, "consolidate": _stage_consolidate,
+            "views": _stage_views}
+
+def _run_stage(stage: str, cfg: dict) -> dict:
+    import metrics
+    logging.basicConfig(level=logging.ERROR)
+    t0  = time.perf_counter()
+    out = _RUNNERS[stage](cfg)
+    out["seconds"] = round(time.perf_counter() - t0, 3)
+    out["peak_rss_mb"] = metrics.peak_rss_mb()
+    return out
+
+def _in_child(stage: str, cfg: dict) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(_run_stage, stage, cfg).result()
+
+
+# ── benchmark ───────────────────────────────────────────────
+def _versions() -> dict:
+    import duckdb, numpy, pandas, pyarrow
+    return {"python": platform.python_version(), "pyarrow": pyarrow.__version__,
+            "duckdb": duckdb.__version__, "pandas": pandas.__version__, "numpy": numpy.__version__}
+
+def run_scale(scale: int, args, base_cfg: dict) -> dict:
+    root = Path(tempfile.mkdtemp(prefix=f"osce_etl_{scale}x_", dir=args.workdir))
+    try:
+        t0   = time.perf_counter()
+        ids  = synth_ocds.generate(root, args.months, args.rows * scale, seed=args.seed,
+                                   dup_rate=args.dup_rate, drift=not args.no_drift)
+        gen_s = time.perf_counter() - t0
+        csv_bytes = sum(f.stat().st_size for f in (root / "extracted_csv").rglob("*.csv"))
+        cfg = dict(base_cfg, root_dir=str(root))
+
+        res = {"scale": scale, "files": len(ids), "rows_per_file": args.rows * scale,
+               "csv_mb": round(csv_bytes / (1 << 20), 2), "generate_s": round(gen_s, 3),
+               "stages": {}}
+        for stage in STAGES:
+            out = _in_child(stage, cfg)
+            secs = out["seconds"] or 1e-9
+            out["rows_s"] = round(out.get("rows", 0) / secs, 1)
+            out["mb_s"]   = round(out.get("bytes", 0) / (1 << 20) / secs, 2)
+            res["stages"][stage] = out
+            logging.info(f"{scale}x {stage}: {out['seconds']} s, {out['rows_s']:,} filas/s, "
+                         f"pico {out['peak_rss_mb']}")
+        return res
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+def run_bench(args) -> dict:
+    base_cfg = yaml.safe_load((Path(__file__).resolve().parents[1] / "config.yaml")
+                              .read_text(encoding="utf-8"))
+    for kv in args.set or []:
+        k, v = kv.split("=", 1)
+        base_cfg[k] = yaml.safe_load(v)
+    return {
+        "started":  datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "machine":  {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "versions": _versions(),
+        "params":   {"months": args.months, "rows": args.rows, "seed": args.seed,
+                     "dup_rate": args.dup_rate, "drift": not args.no_drift},
+        "config":   {k: base_cfg.get(k) for k in (
+                        "normalize_engine", "normalize_workers", "typed_columns", "row_hash",
+                        "processed_layout", "consolidation_engine", "duckdb_memory_limit",
+                        "final_sort_keys", "final_row_group_rows", "serving_db")},
+        "results":  [run_scale(s, args, base_cfg) for s in args.scales],
+    }
+
+def compare(old: dict, new: dict) -> None:
+    """Tiempo nuevo / viejo por escala y etapa (<1 ⇒ más rápido)."""
+    olds = {r["scale"]: r for r in old["results"]}
+    for r in new["results"]:
+        o = olds.get(r["scale"])
+        if o is None:
+            continue
+        for stage in STAGES:
+            a, b = o["stages"][stage], r["stages"][stage]
+            print(f"{r['scale']:>4}x {stage:<12} {a['seconds']:>9.2f} s → {b['seconds']:>9.2f} s  "
+                  f"(×{b['seconds'] / (a['seconds'] or 1e-9):.2f})  "
+                  f"RSS {_peak(a)} → {_peak(b)} MB")
+
+def _peak(stage: dict):
+    return max((v for v in (stage.get("peak_rss_mb") or {}).values() if v is not None), default=None)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark del ETL con datos OCDS sintéticos")
+    ap.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100])
+    ap.add_argument("--rows", type=int, default=200, help="filas de records.csv por archivo a 1x")
+    ap.add_argument("--months", type=int, default=6, help="archivos (meses) por escala")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--dup-rate", type=float, default=0.02)
+    ap.add_argument("--no-drift", action="store_true")
+    ap.add_argument("--set", action="append", metavar="CLAVE=VALOR",
+                    help="override de config.yaml (repetible), p.ej. consolidation_engine=pandas")
+    ap.add_argument("--workdir", default=None, help="directorio para los datos temporales")
+    ap.add_argument("--keep", action="store_true", help="no borra los datos generados")
+    ap.add_argument("--out", type=Path, default=None, help="JSON de salida")
+    ap.add_argument("--compare", nargs=2, type=Path, metavar=("VIEJO", "NUEVO"),
+                    help="compara dos JSON de resultados y termina")
+    args = ap.parse_args()
+
+    if args.compare:
+        old, new = (json.loads(p.read_text(encoding="utf-8")) for p in args.compare)
+        compare(old, new)
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    res = run_bench(args)
+    out = args.out or Path(f"etl_bench_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    out.write_text(json.dumps(res, indent=2, ensure_ascii=False), encoding="utf-8")
+    for r in res["results"]:
+        print(f"{r['scale']:>4}x  {r['files']} archivos · {r['csv_mb']} MB de CSV")
+        for stage, s in r["stages"].items():
+            print(f"      {stage:<12} {s['seconds']:>9.2f} s  {s['rows_s']:>12,.0f} filas/s  "
+                  f"{s['mb_s']:>8.2f} MB/s  pico {_peak(s)} MB")
+    print(f"Resultados en {out}")
+
+
+if __name__ == "__main__":
+    main()
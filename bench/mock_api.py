@@ -0,0 +1,154 @@
+"""
+Servidor local que imita el contrato de /api/v1/files de OSCE:
+
+    GET /api/v1/files?page=N&source=S
+        → {"results": [{"id", "timestamp", "files": {"csv": url}}, …],
+           "pagination": {"has_next", "next_page_number"}}
+    GET /zip/<file_id>
+        → ZIP sintético de tamaño configurable (con ETag y soporte de Range)
+
+Latencia y tasa de errores (503) inyectables para medir el downloader.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockOSCE:
+    def __init__(self, sources=("seace_v3", "seace_v2"), files=24, per_page=10,
+                 size_mb=1.0, page_latency=0.0, file_latency=0.0, error_rate=0.0,
+                 seed=0):
+        self.sources      = list(sources)
+        self.files        = files              # archivos por fuente
+        self.per_page     = per_page
+        self.page_latency = page_latency
+        self.file_latency = file_latency
+        self.error_rate   = error_rate
+        self._rng         = random.Random(seed)
+        self._rng_lock    = threading.Lock()
+        self._blob        = random.Random(seed).randbytes(int(size_mb * 1024 * 1024))
+        self._zips: dict[str, tuple[bytes, str]] = {}
+        self._zips_lock   = threading.Lock()
+        self.requests     = {"pages": 0, "files": 0, "errors": 0}
+        self._server: ThreadingHTTPServer | None = None
+
+    # -- datos sintéticos -------------------------------------
+    def file_ids(self, source):
+        # seace_v3-2000-01, seace_v3-2000-02, …  (más nuevo primero, como crawl_order: desc)
+        ids = [f"{source}-{2000 + i // 12}-{i % 12 + 1:02d}" for i in range(self.files)]
+        return ids[::-1]
+
+    def _zip(self, file_id):
+        with self._zips_lock:
+            if file_id not in self._zips:
+                buf = io.BytesIO()
+                with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:
+                    z.writestr("records.csv", f"ocid,compiledRelease/date\nocds-{file_id},2020-01-01\n")
+                    z.writestr("payload.bin", self._blob)
+                data = buf.getvalue()
+                self._zips[file_id] = (data, '"%s"' % hashlib.md5(data).hexdigest())
+            return self._zips[file_id]
+
+    def _fail(self):
+        if not self.error_rate:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < self.error_rate
+
+    # -- servidor ---------------------------------------------
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def endpoint(self):
+        return f"{self.url}/api/v1/files"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _handler(mock: MockOSCE):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=b"", headers=None):
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if mock._fail():
+                mock.requests["errors"] += 1
+                return self._send(503, headers={"Retry-After": "0"})
+            if url.path == "/api/v1/files":
+                return self._page(parse_qs(url.query))
+            if url.path.startswith("/zip/"):
+                return self._file(url.path.rsplit("/", 1)[1])
+            self._send(404)
+
+        def _page(self, q):
+            time.sleep(mock.page_latency)
+            mock.requests["pages"] += 1
+            page   = int(q.get("page", ["1"])[0])
+            source = q.get("source", [mock.sources[0]])[0]
+            ids    = mock.file_ids(source)
+            chunk  = ids[(page - 1) * mock.per_page: page * mock.per_page]
+            results = [{
+                "id": fid,
+                "timestamp": f"2024-01-01T00:00:{i % 60:02d}Z",
+                "files": {"csv": f"{mock.url}/zip/{fid}"},
+            } for i, fid in enumerate(chunk)]
+            has_next = page * mock.per_page < len(ids)
+            body = json.dumps({
+                "results": results,
+                "pagination": {"has_next": has_next, "next_page_number": page + 1 if has_next else None},
+            }).encode()
+            self._send(200, body, {"Content-Type": "application/json"})
+
+        def _file(self, file_id):
+            time.sleep(mock.file_latency)
+            mock.requests["files"] += 1
+            data, etag = mock._zip(file_id)
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+            rng = self.headers.get("Range")
+            if rng and self.headers.get("If-Range") == etag:
+                start = int(rng.split("=")[1].split("-")[0])
+                return self._send(206, data[start:], {
+                    "ETag": etag,
+                    "Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}",
+                })
+            self._send(200, data, {"ETag": etag, "Content-Type": "application/zip"})
+
+    return Handler
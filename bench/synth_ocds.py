@@ -0,0 +1,294 @@
+"""
+Generador de datos OCDS sintéticos con la forma de los CSV del API de OSCE.
+
+Escribe extracted_csv/<version>-<año>-<mes>/ con los 22 CSV de
+normalizer.EXPECTED (columnas aplanadas tipo compiledRelease/awards/0/id,
+mismos ocid entre tablas para que los joins tengan sentido) e incluye lo
+que complica al ETL real:
+
+  * deriva de esquema: columnas que aparecen o desaparecen a partir de
+    cierto mes (firmas distintas por tabla) y orden de columnas variable;
+  * valores que rompen el tipo inferido (un importe "N/A" de vez en cuando);
+  * filas duplicadas dentro de cada archivo (`dup_rate`);
+  * nulos en columnas opcionales.
+
+    python -m bench.synth_ocds D:/osce_synth --months 12 --rows 5000
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from normalizer import EXPECTED
+
+CR = "compiledRelease"
+
+# Columnas por CSV: (ruta aplanada, tipo de valor).  Los tipos los resuelve
+# _values; "drift+N" / "drift-N" = la columna aparece / desaparece a partir
+# del mes N del rango generado.
+_AWD  = (f"{CR}/awards/0/id", "award_id")
+_CON  = (f"{CR}/contracts/0/id", "contract_id")
+_PAR  = (f"{CR}/parties/0/id", "party_id")
+
+def _items(base, parent):
+    return [parent,
+            (f"{base}/items/0/id", "item_id"),
+            (f"{base}/items/0/description", "item_text"),
+            (f"{base}/items/0/classification/id", "cpv"),
+            (f"{base}/items/0/classification/description", "item_text"),
+            (f"{base}/items/0/quantity", "quantity"),
+            (f"{base}/items/0/unit/name", "unit"),
+            (f"{base}/items/0/totalValue/amount", "amount"),
+            (f"{base}/items/0/totalValue/currency", "currency"),
+            (f"{base}/items/0/status", "drift+3:item_status")]
+
+def _add_class(base, parent):
+    return [parent, (f"{base}/items/0/id", "item_id"),
+            (f"{base}/items/0/additionalClassifications/0/id", "cpv"),
+            (f"{base}/items/0/additionalClassifications/0/scheme", "scheme"),
+            (f"{base}/items/0/additionalClassifications/0/description", "item_text")]
+
+def _rates(prefix, parent, item=None):
+    cols = [parent] + ([item] if item else [])
+    return cols + [(f"{prefix}/exchangeRates/0/rate", "rate"),
+                   (f"{prefix}/exchangeRates/0/currency", "currency"),
+                   (f"{prefix}/exchangeRates/0/date", "date"),
+                   (f"{prefix}/exchangeRates/0/source", "drift-4:rate_source")]
+
+def _docs(base, parent=None):
+    return ([parent] if parent else []) + [
+        (f"{base}/documents/0/id", "doc_id"),
+        (f"{base}/documents/0/documentType", "doc_type"),
+        (f"{base}/documents/0/title", "doc_title"),
+        (f"{base}/documents/0/url", "url"),
+        (f"{base}/documents/0/datePublished", "date"),
+        (f"{base}/documents/0/format", "drift+2:doc_format")]
+
+_A, _C, _T = f"{CR}/awards/0", f"{CR}/contracts/0", f"{CR}/tender"
+
+# csv → (filas por cada fila de records.csv, columnas)
+TABLES = {
+    "records.csv": (1.0, [
+        (f"{CR}/id", "release_id"), (f"{CR}/date", "date"), (f"{CR}/tag", "tag"),
+        (f"{_T}/id", "tender_id"), (f"{_T}/title", "tender_title"),
+        (f"{_T}/description", "item_text"), (f"{_T}/status", "tender_status"),
+        (f"{_T}/procuringEntity/id", "party_id"), (f"{_T}/procuringEntity/name", "entity"),
+        (f"{_T}/value/amount", "amount"), (f"{_T}/value/currency", "currency"),
+        (f"{_T}/procurementMethod", "method"), (f"{_T}/procurementMethodDetails", "method_details"),
+        (f"{_T}/mainProcurementCategory", "category"),
+        (f"{_T}/tenderPeriod/startDate", "date"), (f"{_T}/tenderPeriod/endDate", "date"),
+        (f"{_T}/officialNumber", "drift+2:official_number"),
+        (f"{_T}/numberOfTenderers", "drift-5:quantity")]),
+    "releases.csv": (1.2, [
+        ("id", "release_id"), ("date", "date"), ("tag", "tag"), ("initiationType", "initiation"),
+        ("language", "language"), ("tender/id", "tender_id"), ("tender/title", "tender_title"),
+        ("buyer/id", "drift+3:party_id"), ("buyer/name", "drift+3:entity")]),
+    "com_awards.csv": (0.8, [
+        _AWD, (f"{_A}/title", "tender_title"), (f"{_A}/status", "award_status"),
+        (f"{_A}/date", "date"), (f"{_A}/value/amount", "amount"),
+        (f"{_A}/value/currency", "currency"), (f"{_A}/description", "drift+4:item_text")]),
+    "com_awa_items.csv":                 (1.6, _items(_A, _AWD)),
+    "com_awa_ite_additionalClassific.csv": (0.6, _add_class(_A, _AWD)),
+    "com_awa_ite_tot_exchangeRates.csv": (0.2, _rates(f"{_A}/items/0/totalValue", _AWD,
+                                                      (f"{_A}/items/0/id", "item_id"))),
+    "com_awa_suppliers.csv": (0.9, [
+        _AWD, (f"{_A}/suppliers/0/id", "supplier_id"), (f"{_A}/suppliers/0/name", "supplier")]),
+    "com_awa_val_exchangeRates.csv":     (0.2, _rates(f"{_A}/value", _AWD)),
+    "com_contracts.csv": (0.7, [
+        _CON, (f"{_C}/awardID", "award_id"), (f"{_C}/title", "tender_title"),
+        (f"{_C}/status", "contract_status"), (f"{_C}/dateSigned", "date"),
+        (f"{_C}/value/amount", "amount"), (f"{_C}/value/currency", "currency"),
+        (f"{_C}/period/startDate", "date"), (f"{_C}/period/endDate", "date"),
+        (f"{_C}/period/durationInDays", "drift+3:quantity")]),
+    "com_con_documents.csv":             (0.7, _docs(_C, _CON)),
+    "com_con_items.csv":                 (1.4, _items(_C, _CON)),
+    "com_con_ite_additionalClassific.csv": (0.5, _add_class(_C, _CON)),
+    "com_con_ite_tot_exchangeRates.csv": (0.2, _rates(f"{_C}/items/0/totalValue", _CON,
+                                                      (f"{_C}/items/0/id", "item_id"))),
+    "com_con_val_exchangeRates.csv":     (0.2, _rates(f"{_C}/value", _CON)),
+    "com_parties.csv": (2.0, [
+        _PAR, (f"{CR}/parties/0/name", "supplier"), (f"{CR}/parties/0/roles", "roles"),
+        (f"{CR}/parties/0/identifier/scheme", "scheme"), (f"{CR}/parties/0/identifier/id", "ruc"),
+        (f"{CR}/parties/0/address/region", "region"),
+        (f"{CR}/parties/0/address/countryName", "country"),
+        (f"{CR}/parties/0/contactPoint/email", "drift+2:email")]),
+    "com_par_additionalIdentifiers.csv": (0.5, [
+        _PAR, (f"{CR}/parties/0/additionalIdentifiers/0/id", "ruc"),
+        (f"{CR}/parties/0/additionalIdentifiers/0/scheme", "scheme"),
+        (f"{CR}/parties/0/additionalIdentifiers/0/legalName", "supplier")]),
+    "com_sources.csv": (1.0, [
+        (f"{CR}/sources/0/id", "source_id"), (f"{CR}/sources/0/name", "source_name"),
+        (f"{CR}/sources/0/url", "url")]),
+    "com_ten_documents.csv":             (1.5, _docs(_T)),
+    "com_ten_items.csv":                 (2.0, _items(_T, (f"{_T}/id", "tender_id"))),
+    "com_ten_ite_additionalClassific.csv": (0.6, _add_class(_T, (f"{_T}/id", "tender_id"))),
+    "com_ten_ite_tot_exchangeRates.csv": (0.2, _rates(f"{_T}/items/0/totalValue",
+                                                      (f"{_T}/id", "tender_id"),
+                                                      (f"{_T}/items/0/id", "item_id"))),
+    "com_ten_tenderers.csv": (1.8, [
+        (f"{_T}/tenderers/0/id", "supplier_id"), (f"{_T}/tenderers/0/name", "supplier")]),
+}
+assert sorted(TABLES) == sorted(EXPECTED), "TABLES debe cubrir normalizer.EXPECTED"
+
+_WORDS = ("Adquisición", "Contratación", "Servicio", "Suministro", "Ejecución", "Mantenimiento",
+          "Consultoría", "Obra")
+_THINGS = ("de medicamentos", "de equipos de cómputo", "de combustible", "de útiles de oficina",
+           "de la carretera", "de limpieza", "de alimentos", "del sistema de agua potable",
+           "de mobiliario", "de vigilancia")
+_ENTITIES = ("MUNICIPALIDAD METROPOLITANA DE LIMA", "SEGURO SOCIAL DE SALUD - ESSALUD",
+             "MINISTERIO DE SALUD", "GOBIERNO REGIONAL DE CUSCO", "MUNICIPALIDAD DISTRITAL DE ATE",
+             "PROVIAS NACIONAL", "MINISTERIO DE EDUCACIÓN", "HOSPITAL NACIONAL DOS DE MAYO")
+_ENUMS = {
+    "tag": ("compiled",), "language": ("es",), "currency": ("PEN", "PEN", "PEN", "USD"),
+    "tender_status": ("active", "complete", "cancelled", "unsuccessful"),
+    "award_status": ("active", "pending", "cancelled"), "contract_status": ("active", "terminated"),
+    "item_status": ("active", "cancelled"),
+    "method": ("open", "selective", "limited", "direct"),
+    "method_details": ("Licitación Pública", "Adjudicación Simplificada", "Concurso Público",
+                       "Subasta Inversa Electrónica", "Comparación de Precios", "Contratación Directa"),
+    "category": ("goods", "services", "works"), "initiation": ("tender",),
+    "unit": ("UNIDAD", "KILOGRAMO", "SERVICIO", "GALON", "CAJA", "METRO"),
+    "scheme": ("PE-RUC", "UNSPSC", "CUBSO"), "roles": ("buyer", "supplier", "tenderer", "procuringEntity"),
+    "region": ("LIMA", "CUSCO", "AREQUIPA", "PIURA", "LA LIBERTAD", "LORETO", "JUNIN"),
+    "country": ("Perú",), "doc_type": ("tenderNotice", "biddingDocuments", "contractSigned"),
+    "doc_format": ("application/pdf", "application/zip"), "rate_source": ("SBS",),
+    "source_name": ("Sistema Electrónico de Contrataciones del Estado",),
+}
+
+
+def _pick(rng, options, n):
+    return np.asarray(options, dtype=object)[rng.integers(0, len(options), n)]
+
+def _values(kind, n, rng, ctx):
+    """Columna de `n` valores (strings u números) del tipo `kind`."""
+    year, month, prefix, parents = ctx["year"], ctx["month"], ctx["prefix"], ctx["parents"]
+    if kind in _ENUMS:
+        return _pick(rng, _ENUMS[kind], n)
+    if kind == "date":
+        day = rng.integers(1, 29, n)
+        sec = rng.integers(0, 86400, n)
+        return np.array([f"{year}-{month:02d}-{d:02d}T{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}-05:00"
+                         for d, s in zip(day, sec)], dtype=object)
+    if kind == "amount":
+        vals = np.round(rng.lognormal(10, 1.6, n), 2).astype(object)
+        vals[rng.random(n) < 0.001] = "N/A"                 # rompe el tipo inferido
+        return vals
+    if kind == "rate":
+        return np.round(rng.normal(3.75, 0.05, n), 4)
+    if kind == "quantity":
+        return rng.integers(1, 500, n)
+    if kind in ("award_id", "contract_id", "tender_id", "release_id"):
+        # ids del padre (mismo espacio que records.csv ⇒ joins con sentido)
+        return np.array([f"{prefix}-{kind[0]}{i}" for i in parents], dtype=object)
+    if kind in ("item_id", "doc_id", "source_id"):
+        return np.array([str(i) for i in rng.integers(1, 40, n)], dtype=object)
+    if kind in ("party_id", "supplier_id", "ruc"):
+        return np.array([f"PE-RUC-20{i:09d}" for i in rng.integers(0, ctx["suppliers"], n)],
+                        dtype=object)
+    if kind == "official_number":
+        return np.array([f"AS-SM-{i}-{year}" for i in rng.integers(1, 999, n)], dtype=object)
+    if kind == "cpv":
+        return np.array([f"{i:08d}" for i in rng.integers(10_000_000, 99_999_999, n)], dtype=object)
+    if kind in ("tender_title", "item_text", "doc_title"):
+        return np.char.add(np.char.add(_pick(rng, _WORDS, n).astype(str), " "),
+                           _pick(rng, _THINGS, n).astype(str)).astype(object)
+    if kind == "entity":
+        return _pick(rng, _ENTITIES, n)
+    if kind == "supplier":
+        return np.array([f"EMPRESA {i} S.A.C." for i in rng.integers(0, ctx["suppliers"], n)],
+                        dtype=object)
+    if kind == "email":
+        return np.array([f"contacto{i}@empresa.pe" for i in rng.integers(0, ctx["suppliers"], n)],
+                        dtype=object)
+    if kind == "url":
+        return np.array([f"https://prodapp.seace.gob.pe/doc/{i}" for i in rng.integers(0, 10**9, n)],
+                        dtype=object)
+    raise ValueError(f"tipo de valor desconocido: {kind}")
+
+def _present(kind, month_idx, drift):
+    """(¿columna presente en este mes?, tipo real) según su marca de deriva."""
+    if not kind.startswith("drift"):
+        return True, kind
+    spec, kind = kind.split(":", 1)
+    if not drift:
+        return True, kind
+    k = int(spec[6:])
+    return (month_idx >= k if spec[5] == "+" else month_idx < k), kind
+
+def write_file(out_dir: Path, version: str, year: int, month: int, rows: int, month_idx: int,
+               seed: int = 0, dup_rate: float = 0.02, null_rate: float = 0.03,
+               drift: bool = True) -> dict:
+    """Escribe los 22 CSV de un file_id; devuelve {csv: filas} (duplicados incluidos)."""
+    file_id = f"{version}-{year}-{month:02d}"
+    rng     = np.random.default_rng([seed, year, month, zlib.crc32(version.encode())])
+    folder  = out_dir / "extracted_csv" / file_id
+    folder.mkdir(parents=True, exist_ok=True)
+    prefix  = f"ocds-dgv273-{version}-{year}{month:02d}"
+    ctx     = {"year": year, "month": month, "prefix": prefix,
+               "suppliers": max(50, rows // 4)}
+    counts  = {}
+    for csv_name, (ratio, cols) in TABLES.items():
+        n       = max(1, int(rows * ratio))
+        parents = rng.integers(0, rows, n) if csv_name != "records.csv" else np.arange(rows)
+        ctx["parents"] = parents
+        data = {"ocid": np.array([f"{prefix}-{i}" for i in parents], dtype=object)}
+        for path, kind in cols:
+            present, kind = _present(kind, month_idx, drift)
+            if not present:
+                continue
+            col = _values(kind, n, rng, ctx)
+            if null_rate and kind not in ("award_id", "contract_id", "tender_id", "release_id"):
+                col = col.astype(object)
+                col[rng.random(n) < null_rate] = None
+            data[path] = col
+        df = pd.DataFrame(data)
+        if dup_rate:
+            dups = df.sample(frac=dup_rate, random_state=int(rng.integers(0, 2**31)))
+            df   = pd.concat([df, dups], ignore_index=True)
+        if drift and month_idx % 2:
+            df = df[[df.columns[0]] + list(df.columns[1:][::-1])]   # mismo set, otro orden
+        df.to_csv(folder / csv_name, index=False)
+        counts[csv_name] = len(df)
+    return counts
+
+def generate(root, months=3, rows=1000, start=(2023, 1), versions=("seace_v3",), seed=0,
+             dup_rate=0.02, null_rate=0.03, drift=True) -> list[str]:
+    """Genera `months` meses × `versions` en root/extracted_csv; devuelve los file_id."""
+    root = Path(root)
+    ids  = []
+    for version in versions:
+        year, month = start
+        for idx in range(months):
+            write_file(root, version, year, month, rows, idx, seed, dup_rate, null_rate, drift)
+            ids.append(f"{version}-{year}-{month:02d}")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return ids
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Genera extracted_csv/ OCDS sintético")
+    ap.add_argument("root", type=Path, help="root_dir de destino (se crea extracted_csv/)")
+    ap.add_argument("--months", type=int, default=3)
+    ap.add_argument("--rows", type=int, default=1000, help="filas de records.csv por archivo")
+    ap.add_argument("--start", default="2023-01", help="primer mes (AAAA-MM)")
+    ap.add_argument("--versions", nargs="+", default=["seace_v3"])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--dup-rate", type=float, default=0.02, help="fracción de filas duplicadas")
+    ap.add_argument("--null-rate", type=float, default=0.03)
+    ap.add_argument("--no-drift", action="store_true", help="mismo esquema en todos los meses")
+    args = ap.parse_args()
+
+    y, m = (int(x) for x in args.start.split("-"))
+    t0  = time.perf_counter()
+    ids = generate(args.root, args.months, args.rows, (y, m), args.versions, args.seed,
+                   args.dup_rate, args.null_rate, not args.no_drift)
+    print(f"{len(ids)} archivos en {args.root / 'extracted_csv'} ({time.perf_counter() - t0:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
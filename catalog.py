@@ -0,0 +1,487 @@
+"""
+Registro de tipos de columna por (tabla, firma).
+
+La primera vez que el normalizador ve una firma infiere el tipo de cada
+columna (enteros, decimales, fechas, enums de baja cardinalidad → diccionario)
+y lo persiste en root_dir/state/catalog.sqlite; los archivos siguientes de la
+misma firma se escriben con esos mismos tipos.  Si un valor posterior no
+encaja, la columna se ensancha (int64 → float64, timestamp → timestamptz) y
+solo se degrada a string si tampoco así se puede leer.  Las columnas sin
+ningún valor en la muestra (archivo vacío o columna nula) no se registran
+hasta que llegue un archivo que sí las traiga.
+
+El mismo archivo guarda el catálogo de firmas (SignatureCatalog): historial
+de columnas por tabla y el superconjunto con el que se consolida.
+
+    python catalog.py                 # resumen por tabla
+    python catalog.py com_awards      # deriva de firmas de una tabla
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+PARTITION_COLS = ("version", "year", "month")   # siempre string
+HASH_COL       = "_row_hash"                     # hash de contenido por fila (int64)
+
+# ── inferencia ────────────────────────────────────────────────
+_INT_RE   = r"^-?(0|[1-9][0-9]{0,17})$"          # sin ceros a la izquierda (RUC, códigos…)
+# parte entera de hasta 15 dígitos: float64 la guarda sin perder precisión
+_FLOAT_RE = r"^-?(0|[1-9][0-9]{0,14})(\.[0-9]+)?([eE][-+]?[0-9]+)?$"
+_TSTZ_RE  = r"^[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?(Z|[-+][0-9]{2}:[0-9]{2})$"
+_TS_RE    = r"^[0-9]{4}-[0-9]{2}-[0-9]{2}([T ][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?)?$"
+
+DICT_MAX_DISTINCT = 64
+
+# si un valor no encaja en el tipo registrado se prueba este antes que string
+WIDER = {"int64": "float64", "timestamp": "timestamptz"}
+_HAS_TZ_RE = r"(Z|[-+][0-9]{2}:[0-9]{2})$"
+
+ARROW_TYPES = {
+    "string":      pa.string(),
+    "int64":       pa.int64(),
+    "float64":     pa.float64(),
+    "bool":        pa.bool_(),
+    "timestamptz": pa.timestamp("us", tz="UTC"),
+    "timestamp":   pa.timestamp("us"),
+    "dictionary":  pa.dictionary(pa.int32(), pa.string()),
+}
+
+def _all_match(arr: pa.Array, pattern: str) -> bool:
+    return bool(pc.all(pc.match_substring_regex(arr, pattern)).as_py())
+
+def infer_type(arr) -> str | None:
+    """
+    Nombre de tipo (clave de ARROW_TYPES) para una columna de muestra, o
+    None si la muestra no tiene ningún valor (no hay de dónde inferir).
+    """
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if arr.null_count == len(arr):
+        return None
+    t = arr.type
+    if pa.types.is_integer(t):
+        return "int64"
+    if pa.types.is_floating(t):
+        return "float64"
+    if pa.types.is_boolean(t):
+        return "bool"
+    if pa.types.is_timestamp(t):
+        return "timestamptz" if t.tz else "timestamp"
+    if pa.types.is_dictionary(t):
+        return "dictionary"
+    if not (pa.types.is_string(t) or pa.types.is_large_string(t)):
+        return "string"
+
+    vals = pc.utf8_trim_whitespace(pc.drop_null(arr))
+    for name, pattern in (("int64", _INT_RE), ("float64", _FLOAT_RE),
+                          ("timestamptz", _TSTZ_RE), ("timestamp", _TS_RE)):
+        if _all_match(vals, pattern):
+            return name
+    distinct = len(pc.unique(vals))
+    if distinct <= DICT_MAX_DISTINCT and distinct * 2 <= len(vals):
+        return "dictionary"
+    return "string"
+
+def infer_types(table) -> Dict[str, str]:
+    """
+    {columna: tipo} para las columnas de datos de una tabla/batch Arrow; las
+    que no tienen valores en la muestra quedan fuera.
+    """
+    types = {name: infer_type(table.column(i))
+             for i, name in enumerate(table.schema.names) if name not in PARTITION_COLS}
+    return {k: v for k, v in types.items() if v is not None}
+
+def _cast_tstz(arr):
+    """String → timestamptz; los valores sin zona horaria se toman como UTC."""
+    try:
+        return pc.cast(arr, ARROW_TYPES["timestamptz"])
+    except pa.ArrowInvalid:
+        has_tz = pc.match_substring_regex(arr, _HAS_TZ_RE)
+        none   = pa.scalar(None, arr.type)
+        aware  = pc.cast(pc.if_else(has_tz, arr, none), ARROW_TYPES["timestamptz"])
+        naive  = pc.cast(pc.cast(pc.if_else(has_tz, none, arr), ARROW_TYPES["timestamp"]),
+                         ARROW_TYPES["timestamptz"])
+        return pc.if_else(has_tz, aware, naive)
+
+_NUMERIC_RE = {"int64": _INT_RE, "float64": _FLOAT_RE}
+
+def _cast(arr, type_name: str):
+    target = ARROW_TYPES[type_name]
+    if arr.type == target:
+        return arr
+    if pa.types.is_dictionary(arr.type):
+        arr = arr.cast(pa.string())
+    if type_name in ("int64", "float64", "timestamptz", "timestamp") and \
+            (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+        arr = pc.utf8_trim_whitespace(arr)
+        # pc.cast acepta "010101" o enteros de 20 dígitos y los altera: se
+        # exige lo mismo que en infer_type para que el cast nunca cambie un valor
+        pattern = _NUMERIC_RE.get(type_name)
+        if pattern and not _all_match(pc.drop_null(arr), pattern):
+            raise pa.ArrowInvalid(f"valores que no encajan en {type_name}")
+        if type_name == "timestamptz":
+            return _cast_tstz(arr)
+    return pc.cast(arr, target)
+
+def apply_types(table, types: Dict[str, str]) -> Tuple[pa.Table, Dict[str, str]]:
+    """
+    Castea `table` (Table o RecordBatch) a los tipos registrados.  Una
+    columna que no encaja se ensancha según WIDER y, si tampoco, queda como
+    string; devuelve además {columna: tipo nuevo} de las que cambiaron.
+    """
+    arrays, fields, changed = [], [], {}
+    for i, field in enumerate(table.schema):
+        arr = table.column(i)
+        type_name = "string" if field.name in PARTITION_COLS else types.get(field.name, "string")
+        while True:
+            try:
+                arr = _cast(arr, type_name)
+                break
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                type_name = WIDER.get(type_name, "string")
+                changed[field.name] = type_name
+        arrays.append(arr)
+        fields.append(pa.field(field.name, arr.type))
+    schema = pa.schema(fields)
+    if isinstance(table, pa.RecordBatch):
+        return pa.RecordBatch.from_arrays(arrays, schema=schema), changed
+    return pa.Table.from_arrays(arrays, schema=schema), changed
+
+def _type_for(name: str, types: Dict[str, str]) -> str:
+    if name == HASH_COL:
+        return "int64"
+    return "string" if name in PARTITION_COLS else types.get(name, "string")
+
+def target_schema(names: List[str], types: Dict[str, str]) -> pa.Schema:
+    """Esquema Arrow de salida para `names` según el registro."""
+    return pa.schema([pa.field(n, ARROW_TYPES[_type_for(n, types)]) for n in names])
+
+def row_hash(table) -> pa.Array:
+    """
+    Hash de contenido (int64) de cada fila de `table`: pares columna=valor
+    de las columnas de datos en orden alfabético, omitiendo los nulos, de
+    modo que no depende del orden de columnas ni de la firma (una columna
+    ausente equivale a una nula).  Las columnas de partición no entran.
+    """
+    names = sorted(n for n in table.schema.names if n not in PARTITION_COLS and n != HASH_COL)
+    pairs = []
+    for n in names:
+        col = table.column(table.schema.get_field_index(n))
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(col.type.value_type)
+        pairs.append(pc.binary_join_element_wise(n, pc.cast(col, pa.string()), "\x1f"))
+    if not pairs:
+        return pa.array([0] * table.num_rows, pa.int64())
+    joined = pc.binary_join_element_wise(*pairs, "\x1e", null_handling="skip")
+    joined = joined.to_numpy(zero_copy_only=False) if isinstance(joined, pa.Array) \
+             else joined.combine_chunks().to_numpy(zero_copy_only=False)
+    return pa.array(pd.util.hash_array(joined, categorize=False).view("int64"))
+
+def unify_schemas(schemas: List[pa.Schema]) -> pa.Schema:
+    """
+    Superconjunto de columnas (en orden de aparición).  Si una columna tiene
+    tipos distintos según el archivo se promociona: enteros/decimales →
+    float64, fechas con y sin zona → timestamptz, cualquier otra mezcla →
+    string (los diccionarios cuentan como string).
+    """
+    types: Dict[str, list] = {}
+    for sch in schemas:
+        for f in sch:
+            t = f.type.value_type if pa.types.is_dictionary(f.type) else f.type
+            types.setdefault(f.name, [])
+            if t not in types[f.name] and not pa.types.is_null(t):
+                types[f.name].append(t)
+    fields = []
+    for name, ts in types.items():
+        if not ts:
+            t = pa.string()
+        elif len(ts) == 1:
+            t = ts[0]
+        elif all(pa.types.is_integer(x) or pa.types.is_floating(x) for x in ts):
+            t = pa.float64()
+        elif all(pa.types.is_timestamp(x) for x in ts):
+            t = ARROW_TYPES["timestamptz"]
+        else:
+            t = pa.string()
+        fields.append(pa.field(name, t))
+    return pa.schema(fields)
+
+# ── persistencia ──────────────────────────────────────────────
+class TypeRegistry:
+    """
+    Tipos por (tabla, firma) en SQLite (WAL, apto para varios procesos).
+    El primer proceso que registra una columna fija su tipo; después solo
+    se ensancha (widen).
+    """
+    def __init__(self, db_path):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS column_types(
+            tbl       TEXT,
+            signature TEXT,
+            types     TEXT,
+            PRIMARY KEY(tbl, signature)
+        )""")
+        self.conn.commit()
+
+    def get(self, tbl: str, sig: str) -> Dict[str, str] | None:
+        row = self.conn.execute(
+            "SELECT types FROM column_types WHERE tbl=? AND signature=?", (tbl, sig)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _update(self, tbl: str, sig: str, merge) -> Dict[str, str]:
+        with self.conn:                            # transacción: lee-modifica-escribe
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute(
+                "SELECT types FROM column_types WHERE tbl=? AND signature=?", (tbl, sig)
+            ).fetchone()
+            types = json.loads(row[0]) if row else {}
+            merge(types)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO column_types(tbl, signature, types) VALUES(?,?,?)",
+                (tbl, sig, json.dumps(types, sort_keys=True))
+            )
+        return types
+
+    def register(self, tbl: str, sig: str, types: Dict[str, str]) -> Dict[str, str]:
+        """Añade las columnas de `types` aún sin registrar y devuelve los tipos vigentes."""
+        def merge(cur):
+            for c, t in types.items():
+                cur.setdefault(c, t)
+        return self._update(tbl, sig, merge)
+
+    def widen(self, tbl: str, sig: str, changes: Dict[str, str]) -> Dict[str, str]:
+        """Ensancha las columnas de `changes` ({columna: tipo}) y devuelve los tipos actualizados."""
+        def merge(cur):
+            for c, t in changes.items():
+                cur[c] = merge_type(cur.get(c), t)
+        return self._update(tbl, sig, merge)
+
+    def close(self):
+        self.conn.close()
+
+def catalog_path(root_dir) -> Path:
+    return Path(root_dir) / "state" / "catalog.sqlite"
+
+# ── catálogo de firmas ────────────────────────────────────────
+def type_name(t: pa.DataType) -> str:
+    """Clave de ARROW_TYPES para un tipo Arrow ya escrito."""
+    for name, arrow_type in ARROW_TYPES.items():
+        if t == arrow_type:
+            return name
+    if pa.types.is_dictionary(t):
+        return "dictionary"
+    if pa.types.is_integer(t):
+        return "int64"
+    if pa.types.is_floating(t):
+        return "float64"
+    return "string"
+
+def merge_type(a: str | None, b: str) -> str:
+    """
+    Tipo del superconjunto cuando dos firmas difieren (mismas reglas que
+    unify_schemas).  "null" es una columna que hasta ahora solo vino vacía:
+    cede ante cualquier otro tipo.
+    """
+    if a is None or a == "null" or a == b:
+        return b
+    if b == "null":
+        return a
+    if {a, b} <= {"int64", "float64"}:
+        return "float64"
+    if {a, b} <= {"timestamp", "timestamptz"}:
+        return "timestamptz"
+    return "string"
+
+def _file_key(file_id: str):
+    """Orden cronológico de un file_id (seace_v3-2025-03 → 2025, 03, seace_v3)."""
+    parts = file_id.split("-")
+    return (parts[1:], parts[0]) if len(parts) == 3 else ([file_id], "")
+
+class SignatureCatalog:
+    """
+    Historial de firmas por tabla en el mismo SQLite que TypeRegistry:
+
+    * signatures       columnas y tipos de cada firma, primera/última vez vista
+    * signature_files  firma y nº de filas de cada (tabla, file_id)
+    * table_schemas    superconjunto de columnas de la tabla (orden de
+                       aparición, tipos promocionados) que usa la consolidación
+
+    Los procesos del normalizador registran cada archivo escrito con `record`.
+    """
+    def __init__(self, db_path):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures(
+                tbl        TEXT,
+                signature  TEXT,
+                columns    TEXT,
+                types      TEXT,
+                first_seen TEXT,
+                last_seen  TEXT,
+                PRIMARY KEY(tbl, signature)
+            );
+            CREATE TABLE IF NOT EXISTS signature_files(
+                tbl       TEXT,
+                file_id   TEXT,
+                signature TEXT,
+                rows      INTEGER,
+                seen      TEXT,
+                PRIMARY KEY(tbl, file_id)
+            );
+            CREATE TABLE IF NOT EXISTS table_schemas(
+                tbl     TEXT PRIMARY KEY,
+                columns TEXT,
+                updated TEXT
+            );
+        """)
+        self.conn.commit()
+
+    def record(self, tbl: str, sig: str, schema: pa.Schema, file_id: str, rows: int,
+               null_cols=()) -> None:
+        """
+        Registra un archivo normalizado y amplía el superconjunto de la tabla.
+        Las `null_cols` (sin ningún valor en el archivo) no fijan su tipo.
+        """
+        cols  = [f for f in schema if f.name not in PARTITION_COLS]
+        types = {f.name: type_name(f.type) for f in cols if f.name != HASH_COL}
+        now   = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "INSERT INTO signatures(tbl, signature, columns, types, first_seen, last_seen) "
+                "VALUES(?,?,?,?,?,?) ON CONFLICT(tbl, signature) DO UPDATE SET "
+                "types=excluded.types, last_seen=excluded.last_seen",
+                (tbl, sig, json.dumps(sorted(types)), json.dumps(types, sort_keys=True), now, now)
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO signature_files(tbl, file_id, signature, rows, seen) "
+                "VALUES(?,?,?,?,?)", (tbl, file_id, sig, rows, now)
+            )
+            row = self.conn.execute(
+                "SELECT columns FROM table_schemas WHERE tbl=?", (tbl,)
+            ).fetchone()
+            superset = dict(json.loads(row[0])) if row else {}
+            merged   = dict(superset)
+            for f in cols:
+                t = "null" if f.name in null_cols else type_name(f.type)
+                merged[f.name] = merge_type(superset.get(f.name), t)
+            if merged != superset:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO table_schemas(tbl, columns, updated) VALUES(?,?,?)",
+                    (tbl, json.dumps(list(merged.items())), now)
+                )
+
+    def table_schema(self, tbl: str) -> pa.Schema | None:
+        """Superconjunto de columnas de datos de `tbl` (None si no hay registro)."""
+        row = self.conn.execute("SELECT columns FROM table_schemas WHERE tbl=?", (tbl,)).fetchone()
+        if not row:
+            return None
+        return pa.schema([pa.field(n, ARROW_TYPES["string" if t == "null" else t])
+                          for n, t in json.loads(row[0])])
+
+    def file_ids(self, tbl: str) -> set:
+        return {r[0] for r in self.conn.execute(
+            "SELECT file_id FROM signature_files WHERE tbl=?", (tbl,))}
+
+    def tables(self) -> List[dict]:
+        """Resumen por tabla: firmas vigentes, archivos, filas y ancho del superconjunto."""
+        out = []
+        for tbl, cols in self.conn.execute("SELECT tbl, columns FROM table_schemas ORDER BY tbl"):
+            n_sig, n_files, rows = self.conn.execute(
+                "SELECT COUNT(DISTINCT signature), COUNT(*), COALESCE(SUM(rows), 0) "
+                "FROM signature_files WHERE tbl=?", (tbl,)
+            ).fetchone()
+            out.append({"table": tbl, "signatures": n_sig, "files": n_files,
+                        "rows": rows, "columns": len(json.loads(cols))})
+        return out
+
+    def history(self, tbl: str) -> List[dict]:
+        """
+        Firmas de `tbl` en orden cronológico (por su primer file_id), con las
+        columnas añadidas/quitadas y los cambios de tipo respecto a la anterior.
+        """
+        files: Dict[str, list] = {}
+        for sig, file_id, rows in self.conn.execute(
+                "SELECT signature, file_id, rows FROM signature_files WHERE tbl=?", (tbl,)):
+            files.setdefault(sig, []).append((file_id, rows))
+        out, prev = [], None
+        sigs = self.conn.execute(
+            "SELECT signature, types, first_seen, last_seen FROM signatures WHERE tbl=?", (tbl,)
+        ).fetchall()
+        for sig, types, first_seen, last_seen in sigs:
+            ids = sorted(files.get(sig, []), key=lambda x: _file_key(x[0]))
+            if not ids:                            # firma sin archivos vigentes
+                continue
+            out.append({"signature": sig, "types": json.loads(types),
+                        "first_file_id": ids[0][0], "last_file_id": ids[-1][0],
+                        "files": len(ids), "rows": sum(r or 0 for _, r in ids),
+                        "first_seen": first_seen, "last_seen": last_seen})
+        out.sort(key=lambda s: _file_key(s["first_file_id"]))
+        for s in out:
+            types = s["types"]
+            if prev is None:
+                s.update(added=sorted(types), removed=[], retyped={})
+            else:
+                s.update(added=sorted(set(types) - set(prev)),
+                         removed=sorted(set(prev) - set(types)),
+                         retyped={c: f"{prev[c]}→{t}" for c, t in sorted(types.items())
+                                  if c in prev and prev[c] != t})
+            prev = types
+        return out
+
+    def close(self):
+        self.conn.close()
+
+# ── CLI ───────────────────────────────────────────────────────
+def main(argv=None) -> None:
+    import argparse, yaml
+    ap = argparse.ArgumentParser(description="Catálogo de firmas: deriva de esquema por tabla")
+    ap.add_argument("table", nargs="?", help="tabla a detallar (sin argumento: resumen)")
+    ap.add_argument("--json", action="store_true", help="salida JSON")
+    args = ap.parse_args(argv)
+
+    cfg = yaml.safe_load((Path(__file__).resolve().parent / "config.yaml").read_text(encoding="utf-8"))
+    path = catalog_path(cfg["root_dir"])
+    if not path.exists():
+        print(f"No existe el catálogo {path}")
+        return
+    cat = SignatureCatalog(path)
+    try:
+        rows = cat.history(args.table) if args.table else cat.tables()
+    finally:
+        cat.close()
+    if args.json:
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+        return
+    if not args.table:
+        for t in rows:
+            print(f"{t['table']:<40} {t['signatures']:>3} firmas  {t['files']:>5} archivos  "
+                  f"{t['rows']:>12,} filas  {t['columns']:>3} columnas")
+        return
+    for s in rows:
+        print(f"{s['signature'][:8]}  {s['first_file_id']} → {s['last_file_id']}  "
+              f"{s['files']} archivos, {s['rows']:,} filas")
+        if s["added"]:
+            print(f"    + {', '.join(s['added'])}")
+        if s["removed"]:
+            print(f"    - {', '.join(s['removed'])}")
+        for c, change in s["retyped"].items():
+            print(f"    ~ {c}: {change}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
-import pandas as pd, logging
+import pandas as pd, logging, os, inspect, itertools, shutil, time
+import pyarrow as pa, pyarrow.parquet as pq, pyarrow.dataset as ds, pyarrow.compute as pc
 from pathlib import Path
-import yaml, datetime   # solo para logging con fecha
+import yaml, datetime
+
+import catalog
 
 def _unite(dir_with_parquets: Path):
     pieces = []
@@ -13,54 +16,661 @@ def _unite(dir_with_parquets: Path):
         return None
     return pd.concat(pieces, ignore_index=True)
 
-def run_consolidation():
-    from pathlib import Path
-    CFG = Path(__file__).resolve().parent / "config.yaml"
-    with open(CFG, encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
-    proc_dir  = Path(cfg["root_dir"]) / "processed" / "signatures"
-    if not proc_dir.is_dir():
-        logging.info(f"No existen datos en {proc_dir}; consolidación omitida.")
+def _catalog_schema(sigcat, tbl: str, files):
+    """
+    Superconjunto registrado de `tbl` si el catálogo conoce todos sus
+    archivos (los `compacted-*` se dan por registrados); si no, None.
+    """
+    if sigcat is None:
+        return None
+    schema = sigcat.table_schema(tbl)
+    if schema is None:
+        return None
+    known = sigcat.file_ids(tbl)
+    if any(Path(f).stem not in known for f in files if not Path(f).name.startswith("compacted-")):
+        logging.info(f"{tbl}: archivos fuera del catálogo de firmas; se leen los esquemas")
+        return None
+    return schema
+
+def table_dataset(table_dir: Path, partitions=("version", "year", "month"), sigcat=None,
+                  hive=True, files=None, schema=None):
+    """
+    Dataset Arrow de una tabla: un único scan sobre todos sus archivos con
+    el esquema unificado entre firmas.  El esquema sale del catálogo de
+    firmas (`sigcat`) si lo cubre todo; si no, de los pies de cada Parquet.
+    En layout hive las columnas `partitions` salen de la ruta (con poda);
+    en layout signatures van dentro de cada archivo.  `files` limita el
+    dataset a esos archivos (None: todos) y `schema` fija el esquema de
+    lectura (None: el unificado).  None si no hay archivos.
+    """
+    if files is None:
+        files = sorted(str(p) for p in table_dir.rglob("*.parquet"))
+    if not files:
+        return None
+    extra  = pa.schema([(k, pa.string()) for k in catalog.PARTITION_COLS])
+    if schema is None:
+        schema = _catalog_schema(sigcat, table_dir.name, files)
+        if schema is not None:
+            schema = catalog.unify_schemas([schema, extra])
+        else:
+            schema = catalog.unify_schemas([pq.read_schema(f) for f in files] + [extra])
+    if not hive:
+        return ds.dataset(files, schema=schema, format="parquet")
+    part_schema = pa.schema([(k, pa.string()) for k in partitions])
+    return ds.dataset(files, schema=schema, format="parquet",
+                      partitioning=ds.partitioning(part_schema, flavor="hive"),
+                      partition_base_dir=str(table_dir))
+
+def _read_signatures(file_name_dir: Path):
+    dfs = []
+    for sig_dir in file_name_dir.iterdir():
+        df = _unite(sig_dir)
+        if df is not None:
+            dfs.append(df)
+    if not dfs:
+        return None
+
+    # Alinear columnas
+    all_cols = set()
+    for d in dfs:
+        all_cols.update(d.columns)
+    dfs = [d.reindex(columns=sorted(all_cols)) for d in dfs]
+
+    return pd.concat(dfs, ignore_index=True)
+
+def _read_table(table_dir: Path, partitions, sigcat=None, hive=True):
+    dataset = table_dataset(table_dir, partitions, sigcat, hive)
+    if dataset is None:
+        return None
+    df = dataset.to_table().to_pandas()
+    return df[sorted(df.columns)]
+
+# ── consolidación incremental ─────────────────────────────────
+SLICE_COLS = ("version", "year", "month")
+
+def _slices(file_ids):
+    """{(version, year, month)} de los file_ids (ej. seace_v3-2025-03)."""
+    out = set()
+    for fid in file_ids:
+        parts = fid.split("-")
+        if len(parts) == 3:
+            out.add(tuple(parts))
+        else:
+            logging.warning(f"Formato de id desconocido: {fid}")
+    return out
+
+def _slice_mask(table, slices):
+    """Máscara de las filas de `table` que pertenecen a alguna de las `slices`."""
+    cols = [table.column(k).cast(pa.string()) for k in SLICE_COLS]
+    mask = None
+    for sl in slices:
+        m = None
+        for col, v in zip(cols, sl):
+            e = pc.equal(col, v)
+            m = e if m is None else pc.and_(m, e)
+        mask = m if mask is None else pc.or_(mask, m)
+    return pc.fill_null(mask, False)
+
+def _slice_expr(slices):
+    """Filtro Arrow (para el scan) equivalente a _slice_mask."""
+    expr = None
+    for sl in slices:
+        e = None
+        for k, v in zip(SLICE_COLS, sl):
+            e = (ds.field(k) == v) if e is None else e & (ds.field(k) == v)
+        expr = e if expr is None else expr | e
+    return expr
+
+def _slice_sql(slices) -> str:
+    """Predicado SQL (DuckDB) equivalente a _slice_mask."""
+    return " OR ".join(
+        "(" + " AND ".join(f"{k} = '{v.replace(chr(39), chr(39) * 2)}'"
+                           for k, v in zip(SLICE_COLS, sl)) + ")"
+        for sl in sorted(slices)
+    )
+
+def _slice_files(table_dir: Path, slices, layout, partitions):
+    """Archivos procesados que pueden contener filas de las `slices`."""
+    files = set()
+    for sl in slices:
+        values = dict(zip(SLICE_COLS, sl))
+        if layout == "hive":
+            part_dir = table_dir
+            for k in partitions:
+                part_dir = part_dir / f"{k}={values[k]}"
+            if part_dir.is_dir():
+                files.update(str(p) for p in part_dir.glob("*.parquet"))
+        else:
+            files.update(str(p) for p in table_dir.glob(f"signature_*/{'-'.join(sl)}.parquet"))
+    return sorted(files)
+
+def _align(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """`table` con las columnas de `schema` (las que falten, nulas)."""
+    n = table.num_rows
+    arrays = [table.column(f.name).cast(f.type) if f.name in table.schema.names
+              else pa.nulls(n, f.type) for f in schema]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def _prev_runs(old: pq.ParquetFile, slices):
+    """Row groups del consolidado anterior sin las filas de las `slices` (un tramo por row group)."""
+    for i in range(old.num_row_groups):
+        rg = old.read_row_group(i)
+        yield [rg.filter(pc.invert(_slice_mask(rg, slices)))]
+
+def _replace_slices(file_name_dir: Path, prev: Path, out: Path, slices, layout, parts, sigcat,
+                    fopts):
+    """
+    Escribe en `out` el consolidado `prev` con solo las filas de las `slices`
+    reemplazadas: copia por row groups el resto y añade las filas nuevas de
+    esas particiones (deduplicadas).  Sin pandas sobre el histórico.
+    Devuelve las cifras de la tabla (ver _table_stats) o None.
+    """
+    name  = file_name_dir.name
+    files = _slice_files(file_name_dir, slices, layout, parts)
+    if not files:
         return
+    dataset = table_dataset(file_name_dir, parts, sigcat, hive=layout == "hive", files=files)
+    table   = dataset.to_table()
+    table   = table.filter(_slice_mask(table, slices))
+    read    = table.num_rows
+    fresh   = _sort(_clean(table.to_pandas(), name), fopts)
+    fresh   = pa.Table.from_pandas(fresh[sorted(fresh.columns)], preserve_index=False)
 
-    final_dir = Path(cfg["root_dir"]) / "final"
-    final_dir.mkdir(exist_ok=True)
+    old = pq.ParquetFile(prev)
+    try:
+        schema = catalog.unify_schemas([old.schema_arrow, fresh.schema])
+        schema = pa.schema(sorted(schema, key=lambda f: f.name))
+        rows   = _write_final(out, schema, itertools.chain(_prev_runs(old, slices), [[fresh]]), fopts)
+    finally:
+        old.close()
+    logging.info(f"Consolidado -> {out}  ({len(slices)} particiones: {fresh.num_rows:,} filas "
+                 f"nuevas, {rows - fresh.num_rows:,} conservadas)")
+    return _table_stats(read, fresh.num_rows, rows)
+
+def _table_stats(read, kept, written):
+    # filas leídas de processed/, quitadas por duplicadas y escritas en final/
+    return {"rows_read": read, "duplicates": read - kept, "rows_written": written}
+
+# ── escritura del consolidado ─────────────────────────────────
+_BLOOM_OK = "bloom_filter_options" in inspect.signature(pq.ParquetWriter.__init__).parameters
+
+def final_options(cfg) -> dict:
+    """Opciones de escritura de final/: compresión, row groups, orden y filtros bloom."""
+    opts = {
+        "compression":    cfg.get("parquet_compression", "snappy"),
+        "row_group_size": int(cfg.get("final_row_group_rows", cfg.get("row_group_rows", 1_000_000))),
+        "sort_keys":      list(cfg.get("final_sort_keys") or []),
+        "bloom_columns":  list(cfg.get("final_bloom_columns") or []),
+    }
+    if opts["bloom_columns"] and not _BLOOM_OK:
+        logging.info(f"pyarrow {pa.__version__} no escribe filtros bloom; "
+                     "final/ queda solo con min/max y page index")
+    return opts
+
+def _sort(df: pd.DataFrame, fopts) -> pd.DataFrame:
+    keys = [k for k in fopts["sort_keys"] if k in df.columns]
+    if not keys:
+        return df
+    return df.sort_values(keys, kind="stable", na_position="last", ignore_index=True)
+
+def _write_final(out: Path, schema: pa.Schema, runs, fopts) -> int:
+    """
+    Escribe `out` (vía .tmp + os.replace) con `schema`, estadísticas min/max,
+    page index, `sorting_columns` y filtros bloom en `bloom_columns`.
+
+    `runs` es una secuencia de tramos ya ordenados por `sort_keys` (cada uno,
+    un iterable de Tables/RecordBatches).  Dentro de un tramo los lotes se
+    agrupan en row groups de `row_group_size` filas; un row group nunca
+    mezcla tramos, así cada uno queda ordenado y con rangos estrechos para
+    que DuckDB descarte los que no cumplen el filtro.  Devuelve las filas.
+    """
+    rg   = fopts["row_group_size"]
+    keys = [k for k in fopts["sort_keys"] if k in schema.names]
+    kw   = {"compression": fopts["compression"], "write_statistics": True,
+            "write_page_index": True}
+    if keys:
+        kw["sorting_columns"] = pq.SortingColumn.from_ordering(
+            schema, [(k, "ascending") for k in keys], null_placement="at_end")
+    bloom = [c for c in fopts["bloom_columns"] if c in schema.names]
+    if bloom and _BLOOM_OK:
+        kw["bloom_filter_options"] = {c: {"ndv": rg, "fpp": 0.05} for c in bloom}
+
+    rows, tmp = 0, out.with_name(f".{out.name}.tmp")
+    try:
+        with pq.ParquetWriter(tmp, schema, **kw) as writer:
+            for run in runs:
+                buf, n = [], 0
+                for part in run:
+                    if isinstance(part, pa.RecordBatch):
+                        part = pa.Table.from_batches([part])
+                    if not part.num_rows:
+                        continue
+                    buf.append(_align(part, schema))
+                    n += part.num_rows
+                    if n >= rg:
+                        t, full = pa.concat_tables(buf), n - n % rg
+                        writer.write_table(t.slice(0, full), row_group_size=rg)
+                        buf, n = ([t.slice(full)] if n > full else []), n - full
+                        rows += full
+                if n:
+                    writer.write_table(pa.concat_tables(buf), row_group_size=rg)
+                    rows += n
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, out)
+    return rows
+
+# ── motor DuckDB: memoria acotada ─────────────────────────────
+def _duck_connect(cfg):
+    """
+    Conexión DuckDB en memoria con `duckdb_memory_limit`; lo que no cabe
+    (DISTINCT, UNION) se vuelca a root_dir/state/duckdb_tmp.
+    """
+    import duckdb
+    tmp_dir = Path(cfg["root_dir"]) / "state" / "duckdb_tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit='{cfg.get('duckdb_memory_limit', '2GB')}'")
+    con.execute(f"SET temp_directory='{_sql_str(tmp_dir)}'")
+    con.execute("SET preserve_insertion_order=false")   # permite volcar sin ordenar
+    if cfg.get("duckdb_threads"):
+        con.execute(f"SET threads={int(cfg['duckdb_threads'])}")
+    return con
 
-    for file_name_dir in proc_dir.iterdir():
-        if not file_name_dir.is_dir():
+def _sql_str(path) -> str:
+    return Path(path).as_posix().replace("'", "''")
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _duck_table(con, file_name_dir: Path, prev: Path, out: Path, layout, parts, sigcat, slices,
+                fopts):
+    """
+    Consolida una tabla sin pasar por pandas: Arrow escanea los Parquet con
+    el esquema unificado (union by name entre firmas), DuckDB deduplica y
+    ordena por `sort_keys` (con spill a disco) y el resultado se escribe en
+    streaming a `out`.  Con `slices` se copian tal cual los row groups del
+    consolidado anterior `prev` (sin esas particiones) y se añaden las filas
+    nuevas.  Con catalog.HASH_COL se deduplica por (hash, partición) y la
+    columna no pasa al consolidado.  Devuelve las cifras de la tabla (ver
+    _table_stats) o None.
+    """
+    name  = file_name_dir.name
+    hive  = layout == "hive"
+    files = _slice_files(file_name_dir, slices, layout, parts) if slices else None
+    if slices and not files:
+        return
+    dataset = table_dataset(file_name_dir, parts, sigcat, hive, files)
+    if dataset is None:
+        return
+    schema = dataset.schema
+    if slices:
+        schema  = catalog.unify_schemas([pq.read_schema(prev), schema])
+        dataset = table_dataset(file_name_dir, parts, sigcat, hive, files, schema=schema)
+    names = sorted(n for n in schema.names if n != catalog.HASH_COL)
+    cols  = ", ".join(_ident(n) for n in names)
+    where = _slice_sql(slices) if slices else "TRUE"
+
+    if catalog.HASH_COL in schema.names:
+        # hash de contenido + partición como clave; las filas sin hash
+        # (archivos anteriores a row_hash) se comparan completas
+        keys  = ", ".join(_ident(k) for k in (catalog.HASH_COL, *SLICE_COLS))
+        query = (f"SELECT DISTINCT ON ({keys}) {cols} FROM fresh "
+                 f"WHERE {catalog.HASH_COL} IS NOT NULL AND ({where}) "
+                 f"UNION ALL SELECT DISTINCT {cols} FROM fresh "
+                 f"WHERE {catalog.HASH_COL} IS NULL AND ({where})")
+    else:
+        query = f"SELECT DISTINCT {cols} FROM fresh WHERE {where}"
+    order = [k for k in fopts["sort_keys"] if k in names]
+    if order:
+        query = f"SELECT * FROM ({query}) ORDER BY {', '.join(_ident(k) for k in order)}"
+
+    antes  = dataset.count_rows(filter=_slice_expr(slices) if slices else None)
+    schema = pa.schema([schema.field(n) for n in names])
+    fresh  = [0]
+    def _counted(reader):
+        for batch in reader:
+            fresh[0] += batch.num_rows
+            yield batch
+
+    con.register("fresh", dataset)
+    old = pq.ParquetFile(prev) if slices else None
+    try:
+        reader = _counted(con.execute(query).fetch_record_batch(fopts["row_group_size"]))
+        runs   = [reader] if old is None else itertools.chain(_prev_runs(old, slices), [reader])
+        rows   = _write_final(out, schema, runs, fopts)
+    finally:
+        con.unregister("fresh")
+        if old is not None:
+            old.close()
+    logging.info(f"{name}: eliminadas {antes - fresh[0]:,} filas duplicadas estrictas")
+    if slices:
+        logging.info(f"Consolidado -> {out}  ({len(slices)} particiones: {fresh[0]:,} filas "
+                     f"nuevas, {rows - fresh[0]:,} conservadas)")
+    else:
+        logging.info(f"Consolidado -> {out}  ({rows:,} filas)")
+    return _table_stats(antes, fresh[0], rows)
+
+# ── índice de hashes por tabla ────────────────────────────────
+def _update_row_index(con, file_name_dir: Path, index_dir: Path, layout, parts, sigcat, slices):
+    """
+    Mantiene index_dir/<tabla>.parquet: cada hash de contenido con el
+    file_id que lo aportó primero.  Con `slices` solo se recalculan esos
+    ids (sus entradas previas se descartan); sin ellas se reconstruye.
+    Devuelve {file_id: filas con contenido nuevo} de los ids procesados:
+    hashes que no estaban en el índice anterior, tampoco entre los de la
+    versión previa del mismo file_id (un mes re-descargado con cambios
+    cuenta solo su diferencia).
+    """
+    name = file_name_dir.name
+    idx  = index_dir / f"{name}.parquet"
+    if not idx.exists():
+        slices = None                              # primer índice de la tabla: completo
+    files = _slice_files(file_name_dir, slices, layout, parts) if slices else None
+    if slices and not files:
+        return {}
+    dataset = table_dataset(file_name_dir, parts, sigcat, layout == "hive", files)
+    if dataset is None or catalog.HASH_COL not in dataset.schema.names:
+        return {}
+    index_dir.mkdir(parents=True, exist_ok=True)
+    where = _slice_sql(slices) if slices else "TRUE"
+    h     = catalog.HASH_COL
+
+    con.register("fresh_h", dataset)
+    try:
+        con.execute(f"""CREATE OR REPLACE TEMP TABLE fresh_pairs AS
+            SELECT DISTINCT {h}, version || '-' || year || '-' || month AS file_id
+            FROM fresh_h WHERE {h} IS NOT NULL AND ({where})""")
+        if slices:
+            ids = ", ".join("'" + "-".join(sl).replace("'", "''") + "'" for sl in sorted(slices))
+            con.execute(f"""CREATE OR REPLACE TEMP TABLE prev_idx AS
+                SELECT {h}, file_id FROM read_parquet('{_sql_str(idx)}')
+                WHERE file_id NOT IN ({ids})""")
+            con.execute(f"""CREATE OR REPLACE TEMP TABLE replaced AS
+                SELECT DISTINCT {h} FROM read_parquet('{_sql_str(idx)}')
+                WHERE file_id IN ({ids})""")
+        else:
+            con.execute("CREATE OR REPLACE TEMP TABLE prev_idx AS SELECT * FROM fresh_pairs LIMIT 0")
+            con.execute(f"CREATE OR REPLACE TEMP TABLE replaced AS SELECT {h} FROM prev_idx")
+        con.execute(f"""CREATE OR REPLACE TEMP TABLE added AS
+            SELECT f.{h}, min(f.file_id) AS file_id
+            FROM fresh_pairs f LEFT JOIN prev_idx p ON p.{h} = f.{h}
+            WHERE p.{h} IS NULL GROUP BY f.{h}""")
+        stats = con.execute(f"""
+            SELECT f.file_id, count(*), count(a.{h}) - count(r.{h})
+            FROM fresh_pairs f
+            LEFT JOIN added a    ON a.{h} = f.{h} AND a.file_id = f.file_id
+            LEFT JOIN replaced r ON r.{h} = a.{h}
+            GROUP BY f.file_id ORDER BY f.file_id""").fetchall()
+        tmp = idx.with_name(f".{idx.name}.tmp")
+        con.execute(f"COPY (SELECT * FROM prev_idx UNION ALL SELECT * FROM added) "
+                    f"TO '{_sql_str(tmp)}' (FORMAT PARQUET)")
+        os.replace(tmp, idx)
+    finally:
+        con.unregister("fresh_h")
+        con.execute("DROP TABLE IF EXISTS fresh_pairs")
+        con.execute("DROP TABLE IF EXISTS prev_idx")
+        con.execute("DROP TABLE IF EXISTS replaced")
+        con.execute("DROP TABLE IF EXISTS added")
+
+    for file_id, total, new in stats:
+        logging.info(f"{name}: {file_id} aporta {new:,} filas nuevas de {total:,} distintas")
+    return {file_id: new for file_id, _, new in stats}
+
+def _clean(combined: pd.DataFrame, name: str) -> pd.DataFrame:
+    # “Seguro” extra: elimina filas 100 % idénticas
+    antes = len(combined)
+    if catalog.HASH_COL in combined.columns:
+        # con hash de contenido basta comparar (hash, partición); las filas
+        # sin hash (archivos anteriores a row_hash) se comparan completas
+        keys = [catalog.HASH_COL] + [c for c in SLICE_COLS if c in combined.columns]
+        has  = combined[catalog.HASH_COL].notna()
+        if has.all():
+            combined = combined.drop_duplicates(subset=keys)
+        else:
+            combined = pd.concat([combined[has].drop_duplicates(subset=keys),
+                                  combined[~has].drop_duplicates()], ignore_index=True)
+        combined = combined.drop(columns=catalog.HASH_COL)
+    else:
+        combined = combined.drop_duplicates()
+    logging.info(f"{name}: eliminadas {antes - len(combined):,} filas duplicadas estrictas")
+
+    # Convertir object→string para no perder NAs (las columnas tipadas
+    # por el catálogo —números, fechas, diccionarios— se conservan)
+    for col, dt in combined.dtypes.items():
+        if dt == "object":
+            combined[col] = combined[col].astype("string")
+    return combined
+
+# ── snapshots ─────────────────────────────────────────────────
+def current_snapshot(final_dir: Path) -> Path | None:
+    """
+    Directorio publicado: final/snapshots/<nombre> según final/CURRENT, o
+    final/ mismo si aún tiene el layout anterior (*_latest.parquet sueltos).
+    """
+    ptr = final_dir / "CURRENT"
+    if ptr.exists():
+        snap = final_dir / "snapshots" / ptr.read_text(encoding="utf-8").strip()
+        if snap.is_dir():
+            return snap
+    if any(final_dir.glob("*.parquet")):
+        return final_dir
+    return None
+
+def list_snapshots(final_dir: Path) -> list:
+    snaps = final_dir / "snapshots"
+    return sorted(p.name for p in snaps.iterdir()
+                  if p.is_dir() and not p.name.startswith(".")) if snaps.is_dir() else []
+
+def _new_snapshot(final_dir: Path) -> Path:
+    name = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    snap, k = final_dir / "snapshots" / name, 1
+    while snap.exists():
+        snap, k = final_dir / "snapshots" / f"{name}-{k}", k + 1
+    snap.mkdir(parents=True)
+    return snap
+
+def publish_snapshot(final_dir: Path, name: str) -> None:
+    """Apunta final/CURRENT a `name` de forma atómica (os.replace)."""
+    if not (final_dir / "snapshots" / name).is_dir():
+        raise FileNotFoundError(f"No existe el snapshot {name}")
+    tmp = final_dir / ".CURRENT.tmp"
+    tmp.write_text(name + "\n", encoding="utf-8")
+    os.replace(tmp, final_dir / "CURRENT")
+
+def _prune_snapshots(final_dir: Path, keep: int) -> None:
+    """Borra los snapshots más antiguos (se conservan `keep`); nunca el publicado."""
+    current = (final_dir / "CURRENT").read_text(encoding="utf-8").strip()
+    old = [n for n in list_snapshots(final_dir) if n != current]
+    for name in old[:max(0, len(old) - max(keep - 1, 0))]:
+        # primero se renombra: en Windows falla entero si un lector aún tiene
+        # abierto algo del snapshot, en vez de dejarlo a medio borrar
+        gone = final_dir / "snapshots" / f".{name}.deleted"
+        try:
+            os.replace(final_dir / "snapshots" / name, gone)
+        except OSError as e:
+            logging.warning(f"Snapshot {name} en uso, se conserva hasta la próxima corrida ({e})")
             continue
+        logging.info(f"Snapshot {name} eliminado (retención {keep})")
+    for gone in (final_dir / "snapshots").glob(".*.deleted"):
+        try:
+            shutil.rmtree(gone)
+        except OSError as e:
+            logging.warning(f"No se pudo borrar {gone.name}; se reintenta en la próxima corrida ({e})")
 
-        dfs = []
-        for sig_dir in file_name_dir.iterdir():
-            df = _unite(sig_dir)
-            if df is not None:
-                dfs.append(df)
-        if not dfs:
+def _carry_over(prev_dir: Path, snap_dir: Path) -> None:
+    """Lleva al snapshot nuevo las tablas no tocadas (hardlink; copia si no se puede)."""
+    for f in prev_dir.glob("*_latest.parquet"):
+        dst = snap_dir / f.name
+        if dst.exists():
             continue
+        try:
+            os.link(f, dst)
+        except OSError:
+            shutil.copy2(f, dst)
 
-        # Alinear columnas
-        all_cols = set()
-        for d in dfs:
-            all_cols.update(d.columns)
-        dfs = [d.reindex(columns=sorted(all_cols)) for d in dfs]
+def run_consolidation(file_ids=None, cfg=None, tables=None, progress=None, metrics=None):
+    """
+    Consolida processed/ en un snapshot nuevo final/snapshots/<ts>/ (un
+    <tabla>_latest.parquet por tabla) y lo publica cambiando final/CURRENT
+    de forma atómica; si algo falla, el snapshot se descarta y CURRENT no
+    cambia.  Sin `file_ids` reconstruye todas las tablas; con ellos solo
+    reemplaza sus particiones (version, year, month).  `tables` (iterable,
+    puede ir llegando en streaming) limita la corrida a esas tablas más las
+    nunca consolidadas; el resto se enlaza del snapshot anterior.
+    `progress(hechas, total)` (sin `tables`) y `metrics` (metrics.RunMetrics)
+    reciben el avance y las cifras por tabla.  Devuelve {tabla: {file_id:
+    filas con contenido nuevo}} si `row_index` está activo.
+    """
+    from pathlib import Path
+    if cfg is None:
+        CFG = Path(__file__).resolve().parent / "config.yaml"
+        with open(CFG, encoding="utf-8") as f:
+            cfg = yaml.safe_load(f)
+    layout    = cfg.get("processed_layout", "signatures")
+    parts     = tuple(cfg.get("hive_partitions", ["version", "year", "month"]))
+    proc_dir  = Path(cfg["root_dir"]) / "processed" / ("tables" if layout == "hive" else "signatures")
+    if not proc_dir.is_dir():
+        logging.info(f"No existen datos en {proc_dir}; consolidación omitida.")
+        return {}
 
-        combined = pd.concat(dfs, ignore_index=True)
+    slices = _slices(file_ids) if file_ids is not None else None
+    if slices is not None and not slices:
+        logging.info("No hay IDs para consolidar.")
+        return {}
 
-        # “Seguro” extra: elimina filas 100 % idénticas
-        antes = len(combined)
-        combined = combined.drop_duplicates()
-        logging.info(f"{file_name_dir.name}: eliminadas {antes - len(combined):,} filas duplicadas estrictas")
+    final_dir = Path(cfg["root_dir"]) / "final"
+    final_dir.mkdir(exist_ok=True)
+    prev_dir  = current_snapshot(final_dir)
+    snap_dir  = _new_snapshot(final_dir)
+    cat_path  = catalog.catalog_path(cfg["root_dir"])
+    sigcat    = catalog.SignatureCatalog(cat_path) \
+                if cfg.get("signature_catalog", False) and cat_path.exists() else None
+
+    engine    = cfg.get("consolidation_engine", "pandas")
+    fopts     = final_options(cfg)
+    index_dir = Path(cfg["root_dir"]) / "state" / "row_index" if cfg.get("row_index", False) else None
+    con       = _duck_connect(cfg) if engine == "duckdb" or index_dir else None
+    added     = {}
+    written   = set()
+    if tables is None:
+        dirs  = [d for d in sorted(proc_dir.iterdir()) if d.is_dir()]
+        names = (d.name for d in dirs)
+    else:
+        seen  = set()
+        names = itertools.chain(tables, _unbuilt(proc_dir, prev_dir, seen))
+    try:
+        for n_done, name in enumerate(names, 1):
+            file_name_dir = proc_dir / name
+            if tables is not None:
+                seen.add(name)
+            if not file_name_dir.is_dir():
+                continue
+            t0   = time.perf_counter()
+            out  = snap_dir / f"{file_name_dir.name}_latest.parquet"
+            prev = prev_dir / out.name if prev_dir is not None else None
+            incremental = slices if slices is not None and prev is not None and prev.exists() else None
+            if engine == "duckdb":
+                stats = _duck_table(con, file_name_dir, prev, out, layout, parts, sigcat,
+                                    incremental, fopts)
+            elif incremental:
+                stats = _replace_slices(file_name_dir, prev, out, slices, layout, parts, sigcat, fopts)
+            else:
+                stats = _consolidate_table(file_name_dir, snap_dir, layout, parts, sigcat, fopts)
+            if out.exists():
+                written.add(out.stem)
+            if index_dir is not None:
+                # sin consolidado previo la tabla se reconstruyó: el índice también
+                new = _update_row_index(con, file_name_dir, index_dir, layout, parts, sigcat,
+                                        incremental)
+                if new:
+                    added[file_name_dir.name] = new
+            if metrics is not None and stats:
+                metrics.table(name, consolidate_s=round(time.perf_counter() - t0, 3),
+                              rows_new_content=sum(added.get(name, {}).values()), **stats)
+            if progress is not None and tables is None:
+                progress(n_done, len(dirs))
+        if prev_dir is not None:
+            _carry_over(prev_dir, snap_dir)
+        if cfg.get("serving_db", False) and any(snap_dir.glob("*.parquet")):
+            t0 = time.perf_counter()
+            _build_serving_db(cfg, prev_dir, snap_dir, written if slices is not None else None)
+            if metrics is not None:
+                metrics.extra(serving_db_s=round(time.perf_counter() - t0, 3))
+        publish_snapshot(final_dir, snap_dir.name)
+    except BaseException:
+        shutil.rmtree(snap_dir, ignore_errors=True)
+        raise
+    finally:
+        if sigcat is not None:
+            sigcat.close()
+        if con is not None:
+            con.close()
+    logging.info(f"Snapshot publicado: {snap_dir}")
+    _prune_snapshots(final_dir, int(cfg.get("snapshot_keep", 3)))
+    return added
+
+def _unbuilt(proc_dir, prev_dir, seen):
+    # tablas sin consolidado previo (p.ej. primera corrida): se construyen enteras
+    for d in sorted(proc_dir.iterdir()):
+        if d.is_dir() and d.name not in seen and not (
+                prev_dir is not None and (prev_dir / f"{d.name}_latest.parquet").exists()):
+            yield d.name
 
-        # Convertir object→string para no perder NAs
-        for col, dt in combined.dtypes.items():
-            if dt == "object":
-                combined[col] = combined[col].astype("string")
+def _build_serving_db(cfg, prev_dir, snap_dir, tables):
+    """
+    osce.duckdb del snapshot con tablas nativas para el agente (ver
+    nl2sql.sql_schema.build_database); en una corrida incremental parte de
+    la del snapshot anterior y solo recrea las tablas tocadas.
+    """
+    from nl2sql.sql_schema import SERVING_DB, build_database
+    base = prev_dir / SERVING_DB if prev_dir is not None and tables is not None else None
+    schema = build_database(snap_dir, snap_dir / SERVING_DB,
+                            index_columns=cfg.get("serving_index_columns", ["ocid"]),
+                            tables=tables, base_db=base,
+                            memory_limit=cfg.get("duckdb_memory_limit"))
+    logging.info(f"Base de servicio -> {snap_dir / SERVING_DB}  ({len(schema)} tablas)")
 
-        out = final_dir / f"{file_name_dir.name}_latest.parquet"
-        combined.to_parquet(out, index=False)
-        logging.info(f"Consolidado -> {out}  ({len(combined):,} filas)")
+def _consolidate_table(file_name_dir: Path, final_dir: Path, layout, parts, sigcat, fopts):
+    """Motor pandas (`consolidation_engine: pandas`): la tabla entera en memoria."""
+    if layout == "hive":
+        combined = _read_table(file_name_dir, parts, sigcat)
+    elif sigcat is not None:
+        try:
+            combined = _read_table(file_name_dir, parts, sigcat, hive=False)
+        except (pa.ArrowInvalid, OSError) as e:  # archivo dañado: lectura tolerante
+            logging.warning(f"{file_name_dir.name}: {e}; se lee archivo por archivo")
+            combined = _read_signatures(file_name_dir)
+    else:
+        combined = _read_signatures(file_name_dir)
+    if combined is None:
+        return
+    read     = len(combined)
+    combined = _sort(_clean(combined, file_name_dir.name), fopts)
+    table    = pa.Table.from_pandas(combined, preserve_index=False)
+
+    out  = final_dir / f"{file_name_dir.name}_latest.parquet"
+    rows = _write_final(out, table.schema, [[table]], fopts)
+    logging.info(f"Consolidado -> {out}  ({rows:,} filas)")
+    return _table_stats(read, rows, rows)
 
 if __name__ == "__main__":
-    import logging
+    import argparse, logging
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--list", action="store_true", help="Lista los snapshots de final/")
+    parser.add_argument("--use", metavar="SNAPSHOT",
+                        help="Publica un snapshot existente (p.ej. para volver atrás)")
+    args = parser.parse_args()
     logging.basicConfig(level=logging.INFO)
-    run_consolidation()
\ No newline at end of file
+
+    if args.list or args.use:
+        cfg = yaml.safe_load((Path(__file__).resolve().parent / "config.yaml").read_text(encoding="utf-8"))
+        final_dir = Path(cfg["root_dir"]) / "final"
+        if args.use:
+            publish_snapshot(final_dir, args.use)
+        current = current_snapshot(final_dir)
+        for name in list_snapshots(final_dir):
+            print(("* " if current is not None and current.name == name else "  ") + name)
+    else:
+        run_consolidation()
\ No newline at end of file
@@ -1,19 +1,92 @@
-import os, sqlite3, requests, hashlib, zipfile, argparse, datetime, logging, concurrent.futures, time, yaml, threading, shutil
+import os, sqlite3, requests, hashlib, zipfile, argparse, datetime, logging, concurrent.futures, time, yaml, threading, shutil, queue, json, collections, contextlib
 from pathlib import Path
 
-def md5sum(path, chunk=8192):
+from http_client import make_session, backoff_delay, AdaptiveLimiter, RetryScheduler
+
+CHUNK = 1024 * 1024        # 1 MB: buffers de red y disco (antes 8 KB)
+SLOT_WAIT = 0.25           # s: cada cuánto mira un reintento si su fuente tiene un hueco
+
+def _md5_of(path, chunk=CHUNK):
     h = hashlib.md5()
     with open(path, "rb") as f:
         for piece in iter(lambda: f.read(chunk), b""):
             h.update(piece)
-    return h.hexdigest()
+    return h
+
+def md5sum(path, chunk=CHUNK):
+    return _md5_of(path, chunk).hexdigest()
+
+class DownloadStats:
+    """
+    Contadores de la última ejecución (páginas, archivos, bytes, reintentos)
+    y tiempos por file_id (descarga, extracción, bytes del ZIP).
+    """
+    FIELDS = ("pages", "page_retries", "queued", "files", "unchanged", "failed", "bytes", "retries",
+              "throttled")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            for k in self.FIELDS:
+                setattr(self, k, 0)
+            self._files = {}
+
+    def add(self, field, n=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def as_dict(self):
+        with self._lock:
+            return {k: getattr(self, k) for k in self.FIELDS}
+
+    def file(self, file_id, **fields):
+        with self._lock:
+            self._files.setdefault(file_id, {}).update(fields)
+
+    def per_file(self):
+        with self._lock:
+            return {k: dict(v) for k, v in self._files.items()}
+
+STATS = DownloadStats()
+
+_UPSERT_SQL = """INSERT INTO files(file_id, source, zip_md5, updated_at_api, last_download,
+                                     etag, last_modified)
+                   VALUES(?,?,?,?,?,?,?)
+                   ON CONFLICT(file_id) DO UPDATE SET
+                     zip_md5        = excluded.zip_md5,
+                     updated_at_api = excluded.updated_at_api,
+                     last_download  = excluded.last_download,
+                     etag           = excluded.etag,
+                     last_modified  = excluded.last_modified"""
+
+_TOUCH_SQL = """UPDATE files SET updated_at_api=?,
+                                 etag=COALESCE(?, etag),
+                                 last_modified=COALESCE(?, last_modified)
+                WHERE file_id=?"""
 
 class Manifest:
-    def __init__(self, db_path):
+    """
+    Estado de descargas en SQLite.
+
+    Con `bulk=True` la tabla se carga una sola vez en memoria
+    (file_id → fila): `get` se sirve del dict sin lock y las escrituras se
+    acumulan y se graban en transacciones de `batch_size` filas sobre una
+    base en modo WAL.  Llamar a `close()` (o `flush()`) al terminar.
+    """
+    def __init__(self, db_path, bulk=False, batch_size=500):
         db_path = Path(db_path)
         db_path.parent.mkdir(parents=True, exist_ok=True)
         self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
         self.lock = threading.Lock()
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self._pending = []
+        if bulk:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
         self.conn.execute("""CREATE TABLE IF NOT EXISTS files(
             file_id TEXT PRIMARY KEY,
             source  TEXT,
@@ -21,51 +94,390 @@ class Manifest:
             updated_at_api TEXT,
             last_download TEXT
         )""")
+        # migración: validadores HTTP para descargas condicionales
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(files)")}
+        for col in ("etag", "last_modified"):
+            if col not in cols:
+                self.conn.execute(f"ALTER TABLE files ADD COLUMN {col} TEXT")
+        # cursor incremental por fuente (marca de agua del crawl)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS cursors(
+            source         TEXT PRIMARY KEY,
+            max_updated_at TEXT,
+            last_page      INTEGER,
+            last_full      TEXT,
+            updated        TEXT
+        )""")
         self.conn.commit()
 
+        self._cache = {}
+        if bulk:
+            rows = self.conn.execute(
+                "SELECT file_id, zip_md5, updated_at_api, etag, last_modified FROM files"
+            )
+            self._cache = {r[0]: tuple(r[1:]) for r in rows}
+            logging.info(f"Manifest: {len(self._cache):,} archivos cargados en memoria")
+
     def get(self, file_id):
+        """(zip_md5, updated_at_api, etag, last_modified) o None."""
+        if self.bulk:
+            return self._cache.get(file_id)        # lectura sin lock
+        with self.lock:
+            c = self.conn.execute(
+                "SELECT zip_md5, updated_at_api, etag, last_modified FROM files WHERE file_id=?",
+                (file_id,)
+            )
+            return c.fetchone()
+
+    def upsert(self, file_id, source, md5, updated_at, etag=None, last_modified=None):
+        now = datetime.datetime.utcnow().isoformat(timespec="seconds")
+        params = (file_id, source, md5, updated_at, now, etag, last_modified)
+        if self.bulk:
+            self._cache[file_id] = (md5, updated_at, etag, last_modified)
+            self._queue(_UPSERT_SQL, params)
+            return
+        with self.lock:
+            self.conn.execute(_UPSERT_SQL, params)
+            self.conn.commit()
+
+    def touch(self, file_id, updated_at, etag=None, last_modified=None):
+        """Solo refresca updated_at_api (y validadores HTTP): contenido idéntico al ya procesado."""
+        params = (updated_at, etag, last_modified, file_id)
+        if self.bulk:
+            old = self._cache.get(file_id)
+            if old is not None:
+                self._cache[file_id] = (old[0], updated_at, etag or old[2], last_modified or old[3])
+            self._queue(_TOUCH_SQL, params)
+            return
+        with self.lock:
+            self.conn.execute(_TOUCH_SQL, params)
+            self.conn.commit()
+
+    def get_cursor(self, source):
+        """(max_updated_at, last_page, last_full) del último crawl completo o None."""
         with self.lock:
             c = self.conn.execute(
-                "SELECT zip_md5, updated_at_api FROM files WHERE file_id=?", (file_id,)
+                "SELECT max_updated_at, last_page, last_full FROM cursors WHERE source=?", (source,)
             )
             return c.fetchone()
 
-    def upsert(self, file_id, source, md5, updated_at):
+    def set_cursor(self, source, max_updated_at, last_page, full):
         now = datetime.datetime.utcnow().isoformat(timespec="seconds")
         with self.lock:
+            # el cursor nunca se graba por delante de las filas del manifest
+            # que aún esperan en el lote (modo bulk)
+            self._flush_locked()
             self.conn.execute(
-                """INSERT INTO files(file_id, source, zip_md5, updated_at_api, last_download)
+                """INSERT INTO cursors(source, max_updated_at, last_page, last_full, updated)
                    VALUES(?,?,?,?,?)
-                   ON CONFLICT(file_id) DO UPDATE SET
-                     zip_md5        = excluded.zip_md5,
-                     updated_at_api = excluded.updated_at_api,
-                     last_download  = excluded.last_download""",
-                (file_id, source, md5, updated_at, now)
+                   ON CONFLICT(source) DO UPDATE SET
+                     max_updated_at = excluded.max_updated_at,
+                     last_page      = excluded.last_page,
+                     last_full      = COALESCE(excluded.last_full, cursors.last_full),
+                     updated        = excluded.updated""",
+                (source, max_updated_at, last_page, now if full else None, now)
             )
             self.conn.commit()
 
-def download_zip(url, out_path, retries=3):
+    def _queue(self, sql, params):
+        with self.lock:
+            self._pending.append((sql, params))
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with self.conn:                            # una transacción por lote
+            for sql, params in self._pending:
+                self.conn.execute(sql, params)
+        self._pending.clear()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+Download = collections.namedtuple("Download", "md5 etag last_modified not_modified")
+
+def _read_part_meta(meta):
+    try:
+        return json.loads(meta.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _if_range(meta):
+    """Validador fuerte del .part en curso (los ETag débiles no sirven para If-Range)."""
+    info = _read_part_meta(meta)
+    etag = info.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return info.get("last_modified")
+
+def _range_start(content_range):
+    # "bytes 1000-1999/2000" → 1000
+    try:
+        return int(content_range.split()[1].split("-")[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def download_zip(url, out_path, retries=3, chunk=CHUNK, session=None,
+                 etag=None, last_modified=None, backoff=1.0, backoff_max=60.0):
+    """
+    Descarga en streaming a `<out_path>.part` calculando el MD5 mientras
+    llegan los bytes; al terminar renombra a `out_path`.
+
+    * Con `etag`/`last_modified` hace una petición condicional: un 304
+      devuelve Download(not_modified=True) sin tocar el disco.
+    * Si queda un `.part` de un intento (o ejecución) anterior se reanuda con
+      `Range` + `If-Range`; si el servidor responde 200 se empieza de cero.
+    * Entre intentos espera con backoff exponencial y jitter.
+
+    Devuelve Download(md5, etag, last_modified, not_modified) o None si falló.
+    """
+    http     = session or requests
+    out_path = Path(out_path)
+    part     = out_path.with_name(out_path.name + ".part")
+    meta     = out_path.with_name(out_path.name + ".part.json")
     for attempt in range(1, retries + 1):
         try:
-            with requests.get(url, stream=True, timeout=30) as r:
+            headers = {}
+            offset  = part.stat().st_size if part.exists() else 0
+            validator = _if_range(meta) if offset else None
+            if validator:
+                headers["Range"]    = f"bytes={offset}-"
+                headers["If-Range"] = validator
+            else:
+                offset = 0
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+
+            with http.get(url, stream=True, timeout=30, headers=headers) as r:
+                if r.status_code == 304:
+                    part.unlink(missing_ok=True)
+                    meta.unlink(missing_ok=True)
+                    return Download(None, etag, last_modified, True)
+                if r.status_code == 416:
+                    part.unlink(missing_ok=True)
+                    raise IOError("rango no satisfacible; se reinicia la descarga")
                 r.raise_for_status()
-                with open(out_path, "wb") as f:
-                    for chunk in r.iter_content(8192):
-                        f.write(chunk)
-            if zipfile.is_zipfile(out_path):
-                return True
-            raise zipfile.BadZipFile
+
+                if r.status_code == 206:
+                    if _range_start(r.headers.get("Content-Range")) != offset:
+                        part.unlink(missing_ok=True)
+                        raise IOError("Content-Range inesperado; se reinicia la descarga")
+                    logging.info(f"Reanudando {url} desde {offset:,} bytes")
+                    h, mode = _md5_of(part, chunk), "ab"
+                else:
+                    h, mode = hashlib.md5(), "wb"
+                    meta.write_text(json.dumps({
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                    }), encoding="utf-8")
+
+                info = _read_part_meta(meta)
+                with open(part, mode, buffering=chunk) as f:
+                    for piece in r.iter_content(chunk):
+                        h.update(piece)
+                        f.write(piece)
+                        STATS.add("bytes", len(piece))
+            if not zipfile.is_zipfile(part):        # solo lee la cola del archivo
+                part.unlink(missing_ok=True)
+                raise zipfile.BadZipFile("descarga truncada o corrupta")
+            os.replace(part, out_path)
+            meta.unlink(missing_ok=True)
+            return Download(h.hexdigest(), info.get("etag"), info.get("last_modified"), False)
         except Exception as e:
             logging.warning(f"Intento {attempt}/{retries} falló al descargar {url}: {e}")
-            time.sleep(5)
-    logging.error(f"No se pudo descargar {url}")
-    return False
+            if attempt < retries:
+                time.sleep(backoff_delay(attempt, backoff, backoff_max))
+    # el .part se conserva para reanudar en la próxima ejecución
+    logging.warning(f"No se pudo descargar {url}")
+    return None
+
+def extract_zip(zip_path, target_folder, chunk=CHUNK):
+    """
+    Valida y extrae el ZIP en una sola pasada hacia una carpeta temporal que
+    luego reemplaza a `target_folder` (la entrada del normalizador).
+    Lanza zipfile.BadZipFile si el archivo no es un ZIP válido.
+    """
+    target_folder = Path(target_folder)
+    tmp_folder    = target_folder.with_name(target_folder.name + ".tmp")
+    if tmp_folder.exists():
+        shutil.rmtree(tmp_folder)
+    tmp_folder.mkdir(parents=True)
+
+    try:
+        with zipfile.ZipFile(zip_path) as z:       # lee solo el directorio central
+            for info in z.infolist():
+                if info.is_dir():
+                    continue
+                parts = [p for p in Path(info.filename.replace("\\", "/")).parts
+                         if p not in ("", ".", "..") and not Path(p).anchor]
+                if not parts:
+                    continue
+                dest = tmp_folder.joinpath(*parts)
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                with z.open(info) as src, open(dest, "wb", buffering=chunk) as dst:
+                    shutil.copyfileobj(src, dst, chunk)   # CRC verificado al leer
+    except Exception:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        raise
+
+    # Si ya existía el folder, lo eliminamos por completo para evitar residuos
+    if target_folder.exists():
+        shutil.rmtree(target_folder)
+    os.replace(tmp_folder, target_folder)
+
+_END = object()
+
+def iter_pages(endpoint, source, depth=2, session=None, start=1,
+               retries=5, backoff=1.0, backoff_max=60.0):
+    """
+    Generador de (nº_página, datos) del API desde la página `start`.  Un hilo
+    productor pide las páginas por adelantado y las deja en una cola acotada
+    a `depth`, de modo que el listado se solapa con las descargas.  Si el
+    consumidor deja de iterar, el productor se detiene.  Cada página se
+    reintenta hasta `retries` veces con backoff antes de abortar la fuente.
+    """
+    http  = session or requests
+    pages = queue.Queue(maxsize=max(1, depth))
+    stop  = threading.Event()
+
+    def _put(obj):
+        while not stop.is_set():
+            try:
+                pages.put(obj, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _get_page(page):
+        params = {"page": page, "source": source}
+        for attempt in range(1, retries + 1):
+            try:
+                r = http.get(endpoint, params=params, timeout=60)
+                r.raise_for_status()
+                return r.json()
+            except Exception as e:
+                if attempt == retries or stop.is_set():
+                    raise
+                delay = backoff_delay(attempt, backoff, backoff_max)
+                STATS.add("page_retries")
+                logging.warning(f"{source}: página {page} falló ({e}); reintento en {delay:.1f}s")
+                stop.wait(delay)
+
+    def _producer():
+        page = start
+        try:
+            while not stop.is_set():
+                logging.info(f"{source}: solicitando página {page}")
+                data = _get_page(page)
+                STATS.add("pages")
+                _put((page, data))
+                if not data.get("pagination", {}).get("has_next"):
+                    break
+                page = data["pagination"]["next_page_number"]
+        except Exception as e:
+            _put(e)
+        finally:
+            _put(_END)
+
+    threading.Thread(target=_producer, name=f"pages-{source}", daemon=True).start()
+    try:
+        while True:
+            obj = pages.get()
+            if obj is _END:
+                return
+            if isinstance(obj, Exception):
+                raise obj
+            yield obj
+    finally:
+        stop.set()
+
+def _fetch_item(source, file_id, zip_url, updated_at, manifest, raw_dir, extract_dir,
+                prev=None, session=None, cfg=None, limiter=None):
+    """
+    Descarga, hashea y extrae un archivo. Devuelve el file_id, None si el
+    contenido no cambió (304 o mismo MD5 que `prev`: el hash manda, solo se
+    refresca updated_at_api y no se vuelve a extraer ni normalizar) o False
+    si falló.  `prev` es la fila del manifest (zip_md5, updated_at_api, etag,
+    last_modified).  Hace un único intento: los reintentos los programa el
+    llamador (cola de reintentos) para no bloquear al worker.
+    """
+    old_md5, _, old_etag, old_lm = prev or (None, None, None, None)
+    zip_path = raw_dir / f"{file_id}.zip"
+    t0 = time.perf_counter()
+    with limiter.slot() if limiter is not None else contextlib.nullcontext():
+        dl = download_zip(zip_url, zip_path, retries=1, session=session,
+                          etag=old_etag if old_md5 else None,
+                          last_modified=old_lm if old_md5 else None)
+    STATS.file(file_id, download_s=round(time.perf_counter() - t0, 3))
+    if dl is None:
+        return False
+
+    if dl.not_modified or (old_md5 is not None and dl.md5 == old_md5):
+        zip_path.unlink(missing_ok=True)
+        manifest.touch(file_id, updated_at, dl.etag, dl.last_modified)
+        STATS.add("unchanged")
+        motivo = "304" if dl.not_modified else "mismo MD5"
+        logging.info(f"{source}: {file_id} sin cambios ({motivo}), se omite")
+        return None
+
+    try:
+        STATS.file(file_id, bytes=zip_path.stat().st_size)
+        t0 = time.perf_counter()
+        extract_zip(zip_path, extract_dir / file_id)
+        STATS.file(file_id, extract_s=round(time.perf_counter() - t0, 3))
+        logging.info(f"{source}: extraído {file_id}")
+    except zipfile.BadZipFile as e:
+        logging.error(f"{source}: ZIP inválido {file_id}: {e}")
+        return False
+    finally:
+        zip_path.unlink(missing_ok=True)
+
+    manifest.upsert(file_id, source, dl.md5, updated_at, dl.etag, dl.last_modified)
+    STATS.add("files")
+    return file_id
 
-def crawl_source(source, cfg, manifest, window_days):
+def _parse_ts(updated_at):
+    ts = updated_at.rstrip("Z")
+    if updated_at.endswith("Z"):
+        ts = updated_at[:-1] + "+00:00"
+    dt = datetime.datetime.fromisoformat(ts)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+def crawl_source(source, cfg, manifest, window_days, pool=None, session=None, full=False,
+                 limiter=None, retry=None, on_new=None):
+    """
+    Recorre las páginas del API y entrega cada archivo nuevo/cambiado a `pool`
+    (ThreadPoolExecutor compartido). El límite por fuente lo da
+    `per_source_workers`; si no se pasa `pool` (o `session`) se crea uno propio.
+
+    Crawl incremental (`incremental_crawl`): con el cursor del último crawl
+    completo de la fuente,
+      * `crawl_order: desc` (lo más nuevo primero) deja de paginar tras
+        `cursor_stale_pages` páginas seguidas sin nada posterior al cursor;
+      * `crawl_order: asc` salta directamente a la última página conocida.
+    `full=True`, o un último crawl completo con más de `full_crawl_every_days`
+    días, fuerza el recorrido de todas las páginas.
+
+    Los ZIPs fallidos pasan a la cola de reintentos `retry` (RetryScheduler)
+    con backoff exponencial, hasta `download_retries` intentos.
+
+    `on_new(file_id)` se llama (desde el hilo del worker) en cuanto un
+    archivo queda extraído; si bloquea, frena las descargas de ese worker.
+    """
     logging.info(f"{source}: iniciando crawl_source")
     endpoint   = cfg["api_endpoint"]
-    page       = 1
     new_ids    = []
+    failures   = 0
     threshold  = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=window_days)
 
     raw_dir     = Path(cfg["root_dir"]) / "raw_zips"      / source
@@ -73,78 +485,197 @@ def crawl_source(source, cfg, manifest, window_days):
     raw_dir.mkdir(parents=True, exist_ok=True)
     extract_dir.mkdir(exist_ok=True)
 
-    while True:
-        logging.info(f"{source}: solicitando página {page}")
-        params = {"page": page, "source": source}
-        data   = requests.get(endpoint, params=params, timeout=60).json()
-
-        for item in data.get("results", []):
-            file_id  = item["id"]
-            zip_url  = item["files"].get("csv")
-            updated_at = item.get("timestamp") or item.get("updated_at") or item.get("created_at")
-            if not updated_at:
-                logging.warning(f"Sin timestamp en item {item.get('id')}, se omite.")
-                continue
+    # ── cursor incremental ───────────────────────────────────
+    cursor = None if full or not cfg.get("incremental_crawl", True) else manifest.get_cursor(source)
+    if cursor is not None:
+        last_full = cursor[2]
+        every     = cfg.get("full_crawl_every_days", 7)
+        if not cursor[0] or not last_full or (
+            datetime.datetime.utcnow() - datetime.datetime.fromisoformat(last_full)
+        ).days >= every:
+            cursor = None
+    full        = cursor is None
+    cursor_dt   = _parse_ts(cursor[0]) if cursor else None
+    order       = cfg.get("crawl_order", "desc")
+    start_page  = cursor[1] if cursor and order == "asc" and cursor[1] else 1
+    stale_limit = cfg.get("cursor_stale_pages", 2)
+    stale_pages = 0
+    max_seen    = cursor[0] if cursor else None
+    last_page   = start_page
+    if cursor:
+        logging.info(f"{source}: crawl incremental desde {cursor[0]} ({order}, página {start_page})")
 
-            # normalizamos la fecha
+    per_source = cfg.get("per_source_workers", 4)
+    own_pool   = pool is None
+    if own_pool:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=per_source)
+    if session is None:
+        session = make_session(per_source + 1)
+    own_retry = retry is None
+    if own_retry:
+        retry = RetryScheduler()
+    # Semáforo por fuente: evita que una fuente acapare el pool global
+    slots = threading.BoundedSemaphore(per_source)
+
+    # ── seguimiento de tareas (incluye las que esperan reintento) ──
+    max_attempts = cfg.get("download_retries", 5)
+    backoff      = cfg.get("retry_backoff", 1.0)
+    backoff_max  = cfg.get("retry_backoff_max", 60.0)
+    done         = threading.Condition()
+    pending      = 0
+
+    def _submit(args, attempt):
+        # quien llama ya tomó un hueco de `slots`; _finished lo libera
+        nonlocal pending
+        with done:
+            pending += 1
+        try:
+            fut = pool.submit(_fetch_item, *args, session, cfg, limiter)
+        except BaseException:
+            with done:
+                pending -= 1
+                done.notify_all()
+            raise
+        fut.add_done_callback(lambda f: _finished(f, args, attempt))
+
+    def _finished(fut, args, attempt):
+        nonlocal pending, failures
+        slots.release()
+        try:
+            result = fut.result()
+        except Exception as e:
+            logging.error(f"{source}: fallo procesando {args[1]}: {e}")
+            result = False
+        with done:
             try:
-                ts = updated_at.rstrip("Z")
-                if updated_at.endswith("Z"):
-                    ts = updated_at[:-1] + "+00:00"
-                updated_dt = datetime.datetime.fromisoformat(ts)
+                if result:
+                    new_ids.append(result)
+                elif result is False and attempt < max_attempts:
+                    delay = backoff_delay(attempt, backoff, backoff_max)
+                    logging.info(f"{source}: {args[1]} a la cola de reintentos "
+                                 f"(intento {attempt + 1}/{max_attempts} en {delay:.1f}s)")
+                    pending += 1               # sigue pendiente mientras espera
+                    STATS.add("retries")
+                    retry.schedule(delay, _resubmit, args, attempt + 1)
+                elif result is False:
+                    logging.error(f"{source}: {args[1]} descartado tras {attempt} intentos")
+                    STATS.add("failed")
+                    failures += 1
+            finally:
+                pending -= 1
+                done.notify_all()
+        if result and on_new is not None:
+            try:
+                on_new(result)
             except Exception as e:
-                logging.warning(f"Timestamp inválido '{updated_at}' en {item.get('id')}: {e}")
-                continue
+                logging.error(f"{source}: on_new({result}) falló: {e}")
 
-            if updated_dt < threshold:
-                continue
+    def _resubmit(args, attempt):
+        nonlocal pending, failures
+        # el reintento también respeta el tope de la fuente; sin hueco vuelve
+        # a la cola (sin bloquear el hilo de reintentos) y sigue pendiente
+        if not slots.acquire(blocking=False):
+            retry.schedule(SLOT_WAIT, _resubmit, args, attempt, count=False)
+            return
+        try:
+            _submit(args, attempt)
+        except Exception as e:
+            slots.release()
+            logging.error(f"{source}: no se pudo reintentar {args[1]}: {e}")
+            with done:
+                failures += 1
+        finally:
+            with done:
+                pending -= 1
+                done.notify_all()
 
-            db_row = manifest.get(file_id)
-            needs_download = False
-            if db_row is None:
-                needs_download = True
-            else:
-                _, db_updated = db_row
-                if db_updated is None or db_updated < updated_at:
-                    needs_download = True
+    try:
+        pages = iter_pages(endpoint, source, cfg.get("page_prefetch", 2), session, start_page,
+                           cfg.get("page_retries", 5), backoff, backoff_max)
+        for page, data in pages:
+            last_page  = page
+            page_fresh = False
+            for item in data.get("results", []):
+                file_id  = item["id"]
+                zip_url  = item["files"].get("csv")
+                updated_at = item.get("timestamp") or item.get("updated_at") or item.get("created_at")
+                if not updated_at:
+                    logging.warning(f"Sin timestamp en item {item.get('id')}, se omite.")
+                    continue
 
-            if not needs_download:
-                continue
+                # normalizamos la fecha
+                try:
+                    updated_dt = _parse_ts(updated_at)
+                except Exception as e:
+                    logging.warning(f"Timestamp inválido '{updated_at}' en {item.get('id')}: {e}")
+                    continue
 
-            zip_path = raw_dir / f"{file_id}.zip"
-            if not download_zip(zip_url, zip_path):
-                continue
+                if max_seen is None or updated_dt > _parse_ts(max_seen):
+                    max_seen = updated_at
+                if cursor_dt is None or updated_dt > cursor_dt:
+                    page_fresh = True
 
-            md5_local = md5sum(zip_path)
-            target_folder = extract_dir / file_id
+                if updated_dt < threshold:
+                    continue
 
-            # Si ya existía el folder, lo eliminamos por completo para evitar residuos
-            if target_folder.exists():
-                shutil.rmtree(target_folder)
-            target_folder.mkdir(parents=True, exist_ok=True)
+                db_row = manifest.get(file_id)
+                needs_download = False
+                if db_row is None:
+                    needs_download = True
+                else:
+                    _, db_updated, _, _ = db_row
+                    if db_updated is None or db_updated < updated_at:
+                        needs_download = True
+
+                if not needs_download:
+                    continue
 
-            with zipfile.ZipFile(zip_path) as z:
-                z.extractall(target_folder)
-                logging.info(f"{source}: extraído {file_id}")
-            zip_path.unlink()
+                slots.acquire()          # bloquea el crawl si la fuente ya está al tope
+                try:
+                    _submit((source, file_id, zip_url, updated_at, manifest,
+                             raw_dir, extract_dir, db_row), 1)
+                    STATS.add("queued")
+                except BaseException:
+                    slots.release()
+                    raise
 
-            manifest.upsert(file_id, source, md5_local, updated_at)
-            new_ids.append(file_id)
+            if cursor_dt is not None and order == "desc":
+                stale_pages = 0 if page_fresh else stale_pages + 1
+                if stale_pages >= stale_limit:
+                    logging.info(f"{source}: {stale_pages} páginas sin cambios tras el cursor; fin del crawl")
+                    break
+    finally:
+        with done:
+            while pending:
+                done.wait()
+        if own_retry:
+            retry.close()
+        if own_pool:
+            pool.shutdown()
 
-        if not data.get("pagination", {}).get("has_next"):
-            break
-        page = data["pagination"]["next_page_number"]
+    # El cursor solo avanza si no quedó nada pendiente (los fallos se reintentan)
+    if failures:
+        logging.warning(f"{source}: {failures} archivos fallidos; el cursor no avanza")
+    elif max_seen:
+        manifest.set_cursor(source, max_seen, last_page, full)
 
     return new_ids
 
-def run_download(window_days):
+def run_download(window_days, full=False, cfg=None, on_new=None):
+    """
+    Descarga todas las fuentes y devuelve los file_id nuevos/cambiados.
+    `cfg` permite inyectar otra configuración (p.ej. el benchmark contra el
+    API simulado); por defecto se lee config.yaml.  Los contadores quedan en
+    `downloader.STATS`.  `on_new(file_id)` recibe cada archivo nuevo en
+    cuanto se extrae (ver crawl_source), p.ej. para normalizarlo ya.
+    """
     from pathlib import Path
-    CONFIG = Path(__file__).resolve().with_suffix(".yaml")     # downloader.yaml → config.yaml?
-    # si el YAML está al lado de downloader.py:
-    CONFIG = Path(__file__).resolve().parent / "config.yaml"
-
-    with open(CONFIG, encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
+    if cfg is None:
+        # si el YAML está al lado de downloader.py:
+        CONFIG = Path(__file__).resolve().parent / "config.yaml"
+        with open(CONFIG, encoding="utf-8") as f:
+            cfg = yaml.safe_load(f)
+    STATS.reset()
 
     log_file = Path(cfg["root_dir"]) / "logs" / f'download_{datetime.date.today()}.log'
     log_file.parent.mkdir(parents=True, exist_ok=True)
@@ -154,15 +685,37 @@ def run_download(window_days):
         handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
     )
 
-    manifest     = Manifest(Path(cfg["root_dir"]) / "state" / "manifest.sqlite")
+    manifest     = Manifest(Path(cfg["root_dir"]) / "state" / "manifest.sqlite",
+                            bulk=cfg.get("manifest_bulk", True),
+                            batch_size=cfg.get("manifest_batch", 500))
     all_new_ids  = []
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"]) as pool:
-        futures = {pool.submit(crawl_source, s, cfg, manifest, window_days): s for s in cfg["sources"]}
-        for fut in concurrent.futures.as_completed(futures):
-            new_ids = fut.result()
-            all_new_ids.extend(new_ids)
-            logging.info(f"{futures[fut]} -> {len(new_ids)} archivos nuevos/cambiados")
+    # Un hilo de crawl por fuente + un pool global de descarga/extracción
+    # (`max_workers` = límite global, `per_source_workers` = límite por fuente)
+    sources = cfg["sources"]
+    limiter = AdaptiveLimiter(rate=cfg.get("rate_limit", 10),
+                              max_rate=cfg.get("rate_limit_max", 50),
+                              concurrency=cfg.get("concurrency_start", 2),
+                              max_concurrency=cfg["max_workers"],
+                              slow_secs=cfg.get("slow_response_secs", 15))
+    session = make_session(cfg["max_workers"] + len(sources), limiter)
+    retry   = RetryScheduler()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"]) as files_pool, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=len(sources)) as crawl_pool:
+            futures = {crawl_pool.submit(crawl_source, s, cfg, manifest, window_days, files_pool, session, full,
+                                          limiter, retry, on_new): s
+                       for s in sources}
+            for fut in concurrent.futures.as_completed(futures):
+                new_ids = fut.result()
+                all_new_ids.extend(new_ids)
+                logging.info(f"{futures[fut]} -> {len(new_ids)} archivos nuevos/cambiados")
+        STATS.add("throttled", limiter.throttled)
+        logging.info(f"Reintentos programados: {retry.count} · frenadas del limiter: {limiter.throttled}")
+    finally:
+        retry.close()
+        session.close()
+        manifest.close()                           # graba el último lote pendiente
 
     logging.info(f"TOTAL nuevos/cambiados: {len(all_new_ids)}")
     return all_new_ids
@@ -170,5 +723,6 @@ def run_download(window_days):
 if __name__ == "__main__":
     argp = argparse.ArgumentParser()
     argp.add_argument("--window-days", type=int, default=120)
+    argp.add_argument("--full", action="store_true", help="Ignora el cursor incremental y recorre todas las páginas")
     args = argp.parse_args()
-    run_download(args.window_days)
\ No newline at end of file
+    run_download(args.window_days, args.full)
\ No newline at end of file
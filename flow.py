@@ -1,24 +1,234 @@
 import argparse
+import collections
+import concurrent.futures
 import datetime
 import logging
+import queue
+import threading
 import yaml
 from pathlib import Path
 from typing import Callable, Optional
 
+import downloader
+import normalizer
+import runlock
+from journal import RunJournal, DOWNLOADED, NORMALIZED, CONSOLIDATED
+from metrics import RunMetrics
 from downloader import run_download
 from normalizer import run_normalization
 from consolidator import run_consolidation
 
 
+class StageProgress:
+    """
+    Traduce el avance real de cada etapa (hechas/total) a un % de la barra:
+    descarga 40 puntos, normalización 30 y consolidación 20 (los 10 finales
+    quedan para quien llama, p.ej. la recarga del modelo en la web).
+
+    Como las etapas pueden solaparse y su total crece mientras la anterior
+    sigue descubriendo trabajo, la fracción de cada etapa se escala por la
+    de la anterior.  La barra nunca retrocede.
+    """
+    STAGES = (("download", 40), ("normalize", 30), ("consolidate", 20))
+
+    def __init__(self, callback: Callable[[int, str], None]):
+        self.callback = callback
+        self.frac = {name: 0.0 for name, _ in self.STAGES}
+        self.pct  = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, stage: str, done: int, total: int, msg: str) -> None:
+        with self.lock:
+            self.frac[stage] = min(done, total) / total if total else 0.0
+            pct, prev = 0.0, 1.0
+            for name, width in self.STAGES:
+                prev *= self.frac[name]
+                pct  += width * prev
+            self.pct = max(self.pct, int(pct))
+            self.callback(self.pct, msg)
+
+    def download(self, *_):
+        st   = downloader.STATS.as_dict()
+        done = st["files"] + st["unchanged"] + st["failed"]
+        self("download", done, st["queued"],
+             f"Descargando… {done}/{st['queued']} archivos ({st['files']} nuevos)")
+
+
+def _added_rows(added) -> int:
+    return sum(n for per_file in added.values() for n in per_file.values())
+
+def _failed_files(results) -> list[str]:
+    """file_ids con alguna tarea de normalización fallida."""
+    return sorted({r["file_id"] for r in results if r["status"] != "ok"})
+
+def _normalization_error(failed) -> RuntimeError:
+    # quedan como descargados en el diario: la próxima corrida (que retoma
+    # esta) los vuelve a normalizar; si la corrida terminara bien se
+    # perderían, porque el manifest ya tiene su MD5 nuevo
+    return RuntimeError(f"Falló la normalización de {len(failed)} archivo(s): "
+                        f"{', '.join(failed)}")
+
+
+def _run_pipelined(journal: RunJournal, cfg: dict, bar: StageProgress,
+                   logger: logging.Logger, metrics: RunMetrics) -> None:
+    """
+    Etapas solapadas: cada file_id pasa a normalizarse en cuanto se extrae
+    (cola acotada a `pipeline_queue` ids: si la normalización se atrasa, la
+    descarga espera) y cada tabla se consolida en cuanto terminan todas sus
+    tareas de normalización, mientras el resto sigue normalizándose.
+    Al reanudar, los ids ya descargados entran primero a la cola.  Una tabla
+    con alguna tarea fallida no se consolida (queda la del snapshot
+    anterior) y la corrida termina en error.
+    """
+    _END    = object()
+    ids_q   = queue.Queue(maxsize=max(1, cfg.get("pipeline_queue", 8)))
+    ready_q = queue.Queue()
+    lock    = threading.Lock()
+    pending = collections.Counter()        # tabla → tareas sin terminar
+    left    = collections.Counter()        # file_id → tareas sin terminar
+    failed  = set()                        # file_id con alguna tarea fallida
+    results = collections.defaultdict(list)
+    counts  = {"done": 0, "total": 0}
+    downloaded = False
+    workers = normalizer.normalize_workers(cfg)
+    slots   = threading.BoundedSemaphore(workers * 2)   # tareas en vuelo
+    abort   = threading.Event()
+
+    def _put(obj):
+        # bloquea al worker de descarga si la cola está llena (salvo si se abortó)
+        while not abort.is_set():
+            try:
+                ids_q.put(obj, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _on_new(file_id):
+        journal.downloaded(file_id)
+        _put(file_id)
+        bar.download()
+
+    def _download():
+        for file_id in journal.ids(DOWNLOADED):    # de una corrida interrumpida
+            _put(file_id)
+        if journal.download_done:
+            return None
+        with metrics.stage("download"):
+            ids = run_download(journal.window_days, journal.full_crawl, cfg, _on_new)
+        journal.mark(ids, DOWNLOADED)
+        journal.download_finished()
+        return ids
+
+    def _normalized(task, tbl, fut):
+        slots.release()
+        res = normalizer.task_result(fut, task)
+        metrics.normalized(res)
+        metrics.end("normalize")
+        with lock:
+            results[tbl].append(res)
+            pending[tbl] -= 1
+            left[res["file_id"]] -= 1
+            if res["status"] != "ok":
+                failed.add(res["file_id"])
+            file_done = not left[res["file_id"]] and res["file_id"] not in failed
+            counts["done"] += 1
+            if downloaded and not pending[tbl]:
+                ready_q.put(tbl)
+            done, total = counts["done"], counts["total"]
+        if file_done:
+            journal.mark([res["file_id"]], NORMALIZED)
+        bar("normalize", done, total, f"Normalizando… {done}/{total} CSV")
+
+    def _ready(n_tables):
+        for i in range(n_tables):
+            tbl = ready_q.get()
+            if _failed_files(results[tbl]):
+                logger.warning("No se consolida %s: falló la normalización de %s",
+                               tbl, ", ".join(_failed_files(results[tbl])))
+                continue
+            normalizer.compact_results(results[tbl], cfg)
+            bar("consolidate", i, n_tables, f"Consolidando {tbl} ({i + 1}/{n_tables})…")
+            yield tbl
+        bar("consolidate", n_tables, n_tables, "Consolidación terminada.")
+
+    # normalizados en una corrida interrumpida: sus tablas aún se consolidan
+    for file_id in journal.ids(NORMALIZED):
+        for tbl in normalizer.file_tables(cfg, file_id):
+            pending.setdefault(tbl, 0)
+
+    logger.info("Modo pipelined: %d procesos de normalización", workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=1) as dl_pool:
+        dl = dl_pool.submit(_download)
+        dl.add_done_callback(lambda _: _put(_END))
+        try:
+            while (file_id := ids_q.get()) is not _END:
+                tasks = normalizer.normalization_tasks([file_id], cfg)
+                if not tasks:
+                    journal.mark([file_id], NORMALIZED)
+                with lock:
+                    left[file_id] += len(tasks)
+                for task in tasks:
+                    tbl = task[3].replace(".csv", "")
+                    slots.acquire()
+                    metrics.begin("normalize")
+                    with lock:
+                        pending[tbl] += 1
+                        counts["total"] += 1
+                    fut = pool.submit(normalizer.normalize_csv, *task)
+                    fut.add_done_callback(lambda f, t=task, n=tbl: _normalized(t, n, f))
+        except BaseException:
+            abort.set()                    # la descarga deja de esperar a la cola
+            raise
+
+        new_ids = dl.result()              # relanza el error de la descarga, si lo hubo
+        if new_ids is not None:
+            metrics.download(downloader.STATS.as_dict(), downloader.STATS.per_file())
+            logger.info("TOTAL nuevos/cambiados: %d", len(new_ids))
+        bar("download", 1, 1, "Descarga lista")
+        run_ids = journal.pending(CONSOLIDATED)
+        if not run_ids:
+            logger.info("Sin archivos con contenido nuevo; se omite la consolidación.")
+            return
+        with lock:
+            downloaded = True
+            for tbl, n in pending.items():
+                if not n:
+                    ready_q.put(tbl)
+            n_tables = len(pending)
+        with metrics.stage("consolidate"):
+            added = run_consolidation(run_ids, cfg, tables=_ready(n_tables), metrics=metrics)
+        if failed:
+            # ninguno pasa a consolidado: la próxima corrida repite sus particiones
+            raise _normalization_error(sorted(failed))
+        journal.mark(run_ids, CONSOLIDATED)
+    if added:
+        logger.info("Filas con contenido nuevo: %d", _added_rows(added))
+
+
 # ─────────────────────────────────────────────────────────────
 def run_flow(
     window_days: int | None = None,
-    progress: Optional[Callable[[int, str], None]] = None
-) -> None:
+    progress: Optional[Callable[[int, str], None]] = None,
+    full_crawl: bool = False,
+    fresh: bool = False,
+    owner: str = "flow"
+) -> dict:
     """
     Ejecuta todo el pipeline.  
     Si se pasa `progress(pct:int, msg:str)` se irá llamando para
     actualizar la barra en la web.
+    `full_crawl=True` ignora el cursor incremental del downloader.
+    Devuelve el registro de métricas de la corrida (ver metrics.py), que
+    también queda en root_dir/state/runs/<run_id>.json.
+
+    Con `resume_runs` (por defecto) una corrida interrumpida se retoma donde
+    quedó según el diario (journal.py), con su ventana original; `fresh=True`
+    la abandona y empieza de cero.
+
+    Solo corre un ETL a la vez por root_dir (runlock.py): si hay otro en
+    curso lanza runlock.EtlBusy sin tocar nada.  `owner` queda anotado en el
+    candado (quién lo tiene) y en las métricas.
     """
     if progress is None:
         progress = lambda *_: None
@@ -29,6 +239,13 @@ def run_flow(
         cfg = yaml.safe_load(f)
     window = window_days if window_days is not None else cfg["window_days"]
 
+    # antes que el diario: un segundo ETL no debe abandonar la corrida del primero
+    with runlock.etl_lock(cfg["root_dir"], owner):
+        return _locked_flow(cfg, window, progress, full_crawl, fresh, owner)
+
+
+def _locked_flow(cfg: dict, window: int, progress: Callable[[int, str], None],
+                 full_crawl: bool, fresh: bool, owner: str) -> dict:
     # 2) Prepara logging (igual que en __main__)
     log_dir = Path(cfg["root_dir"]) / "logs"
     log_dir.mkdir(parents=True, exist_ok=True)
@@ -53,21 +270,101 @@ def run_flow(
     root.addHandler(sh)
     logger.propagate = False
     # ──────────────────────────────────────────────────────────
+    try:
+        return _run_stages(cfg, window, progress, full_crawl, fresh, owner, logger)
+    finally:
+        # un proceso de larga vida (web, scheduler) llama run_flow muchas veces
+        for h in (fh, sh):
+            root.removeHandler(h)
+            logger.removeHandler(h)
+        fh.close()
 
-    # 3) Pipeline con checkpoints de progreso
-    progress(0,  "Descargando archivos…")
-    logger.info("ETL OSCE — INICIO")
 
-    new_ids = run_download(window)
-    logger.info("TOTAL nuevos/cambiados: %d", len(new_ids))
-    progress(40, f"Descarga lista ({len(new_ids)} nuevos). Normalizando…")
+def _run_stages(cfg: dict, window: int, progress: Callable[[int, str], None],
+                full_crawl: bool, fresh: bool, owner: str, logger: logging.Logger) -> dict:
 
-    run_normalization(new_ids)
-    progress(70, "Normalización completa. Consolidando…")
+    # 3) Pipeline con el avance real de cada etapa y métricas de la corrida
+    bar     = StageProgress(progress)
+    mode    = cfg.get("flow_mode", "sequential")
+    metrics = RunMetrics(cfg["root_dir"], mode)
+    journal = RunJournal.open(cfg["root_dir"], metrics.run_id, window, full_crawl,
+                              resume=cfg.get("resume_runs", True) and not fresh)
+    progress(0,  "Descargando archivos…")
+    logger.info("ETL OSCE — INICIO (%s, corrida %s, %s)", mode, metrics.run_id, owner)
+    metrics.extra(owner=owner)
+    if journal.resumed:
+        logger.info("Reanudando la corrida %s (window_days=%s, descarga %s): %s",
+                    journal.run_id, journal.window_days,
+                    "completa" if journal.download_done else "pendiente", journal.counts())
+        metrics.extra(resumed_run=journal.run_id)
 
-    run_consolidation()
+    run = _run_pipelined if mode == "pipelined" else _run_sequential
+    try:
+        run(journal, cfg, bar, logger, metrics)
+    except BaseException as e:
+        journal.fail(f"{type(e).__name__}: {e}")
+        journal.close()
+        path = metrics.save("error", f"{type(e).__name__}: {e}")
+        logger.error("ETL OSCE — ERROR (métricas en %s; se reanuda en la próxima ejecución)", path)
+        raise
+    journal.finish()
+    journal.close()
+    path = metrics.save()
+    logger.info("Métricas de la corrida en %s", path)
     progress(90, "Consolidación terminada.")
     logger.info("ETL OSCE — TERMINADO")
+    return metrics.record
+
+
+def _run_sequential(journal: RunJournal, cfg: dict, bar: StageProgress,
+                    logger: logging.Logger, metrics: RunMetrics) -> None:
+    """Una etapa tras otra; cada una trabaja solo sobre lo que el diario tiene pendiente."""
+    def _on_new(file_id):
+        journal.downloaded(file_id)
+        bar.download()
+
+    if not journal.download_done:
+        with metrics.stage("download"):
+            new_ids = run_download(journal.window_days, journal.full_crawl, cfg, on_new=_on_new)
+        journal.mark(new_ids, DOWNLOADED)
+        journal.download_finished()
+        metrics.download(downloader.STATS.as_dict(), downloader.STATS.per_file())
+        logger.info("TOTAL nuevos/cambiados: %d", len(new_ids))
+    bar("download", 1, 1, "Descarga lista. Normalizando…")
+
+    to_normalize, failed = journal.ids(DOWNLOADED), []
+    if to_normalize:
+        with metrics.stage("normalize"):
+            results = run_normalization(
+                to_normalize, cfg,
+                progress=lambda done, total: bar("normalize", done, total,
+                                                 f"Normalizando… {done}/{total} CSV"),
+                on_file=lambda file_id: journal.mark([file_id], NORMALIZED))
+        # sin CSV que normalizar (carpeta vacía o ausente): nada que esperar
+        journal.mark(sorted(set(to_normalize) - {r["file_id"] for r in results}), NORMALIZED)
+        for res in results:
+            metrics.normalized(res)
+        failed = _failed_files(results)
+
+    # solo los normalizados por completo; los fallidos siguen como descargados
+    to_consolidate = journal.ids(NORMALIZED)
+    if not to_consolidate:
+        if failed:
+            raise _normalization_error(failed)
+        # El MD5 manda: sin contenido nuevo no hay nada que normalizar ni consolidar
+        logger.info("Sin archivos con contenido nuevo; se omiten normalización y consolidación.")
+        return
+
+    with metrics.stage("consolidate"):
+        added = run_consolidation(to_consolidate, cfg, metrics=metrics,
+                                  progress=lambda done, total: bar(
+                                      "consolidate", done, total,
+                                      f"Consolidando… {done}/{total} tablas"))
+    journal.mark(to_consolidate, CONSOLIDATED)
+    if added:                           # solo las particiones de los ids nuevos
+        logger.info("Filas con contenido nuevo: %d", _added_rows(added))
+    if failed:
+        raise _normalization_error(failed)
 
 
 if __name__ == "__main__":
@@ -78,5 +375,19 @@ if __name__ == "__main__":
         default=None,
         help="Override del window_days de config.yaml"
     )
+    parser.add_argument(
+        "--full-crawl",
+        action="store_true",
+        help="Recorre todas las páginas del API (ignora el cursor incremental)"
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="No retoma una corrida interrumpida: la abandona y empieza de cero"
+    )
     args = parser.parse_args()
-    run_flow(args.window_days)
+    try:
+        run_flow(args.window_days, full_crawl=args.full_crawl, fresh=args.fresh,
+                 owner="flow.py")
+    except runlock.EtlBusy as e:
+        parser.exit(1, f"{e}\n")
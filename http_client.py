@@ -0,0 +1,184 @@
+"""
+Capa HTTP compartida por el downloader:
+
+* Session con pool de conexiones keep-alive (una por ejecución).
+* Backoff exponencial con *jitter* para los reintentos.
+* AdaptiveLimiter: token bucket + concurrencia AIMD según la salud del servidor.
+* RetryScheduler: reintentos diferidos que no ocupan workers.
+"""
+import contextlib
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "OSCE_PIPELINE/1.0"
+
+def make_session(pool_size: int = 10, limiter: "AdaptiveLimiter | None" = None) -> requests.Session:
+    """
+    Session reutilizable entre hilos con `pool_size` conexiones por host.
+    Con `limiter` cada petición espera su token y le informa del resultado.
+    """
+    s = _LimitedSession(limiter) if limiter is not None else requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers["User-Agent"] = USER_AGENT
+    return s
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Espera para el intento `attempt` (1, 2, …): full jitter sobre base·2^(n-1)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+# ─────────────────────────────────────────────────────────────
+class AdaptiveLimiter:
+    """
+    Token bucket + límite de concurrencia compartidos por páginas y ZIPs.
+
+    Ajuste AIMD: cada respuesta sana sube la tasa (+`step` req/s) y, cada
+    `concurrency` respuestas sanas seguidas, un hueco de concurrencia; un
+    429/5xx, un error de red o una latencia por encima de `slow_secs` la
+    divide a la mitad (y respeta `Retry-After`).
+    """
+    def __init__(self, rate=10.0, min_rate=0.5, max_rate=50.0,
+                 concurrency=4, max_concurrency=16, slow_secs=15.0, step=0.5):
+        self.rate            = float(rate)
+        self.min_rate        = float(min_rate)
+        self.max_rate        = float(max_rate)
+        self.concurrency     = int(concurrency)
+        self.max_concurrency = int(max_concurrency)
+        self.slow_secs       = float(slow_secs)
+        self.step            = float(step)
+        self._tokens   = 1.0
+        self._last     = time.monotonic()
+        self._paused   = 0.0          # monotonic hasta el que no se envía nada
+        self._in_use   = 0
+        self._healthy  = 0
+        self._last_cut = 0.0          # evita encadenar recortes por una misma ráfaga
+        self._cond     = threading.Condition()
+        self.throttled = 0            # nº de frenadas (para métricas)
+
+    # -- tasa -------------------------------------------------
+    def acquire(self):
+        """Bloquea hasta disponer de un token."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(max(1.0, self.rate),
+                                   self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                wait = self._paused - now
+                if wait <= 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                if wait <= 0:
+                    wait = (1 - self._tokens) / self.rate
+                self._cond.wait(wait)
+
+    # -- concurrencia ----------------------------------------
+    @contextlib.contextmanager
+    def slot(self):
+        """Hueco de concurrencia para una transferencia completa."""
+        with self._cond:
+            while self._in_use >= self.concurrency:
+                self._cond.wait()
+            self._in_use += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify_all()
+
+    # -- retroalimentación -----------------------------------
+    def feedback(self, status=None, latency=None, retry_after=None):
+        """Ajusta tasa y concurrencia según la respuesta (status=None ⇒ error de red)."""
+        bad = status is None or status == 429 or status >= 500 or \
+              (latency is not None and latency > self.slow_secs)
+        with self._cond:
+            if bad:
+                self._healthy = 0
+                now = time.monotonic()
+                if now - self._last_cut >= 1.0:
+                    self.rate        = max(self.min_rate, self.rate / 2)
+                    self.concurrency = max(1, self.concurrency // 2)
+                    self._last_cut   = now
+                    self.throttled  += 1
+                    logging.info(f"Limiter: frenando a {self.rate:.1f} req/s, "
+                                 f"{self.concurrency} en paralelo (status={status})")
+                try:
+                    pause = float(retry_after) if retry_after else 0.0
+                except ValueError:                 # Retry-After como fecha HTTP
+                    pause = 0.0
+                if pause:
+                    self._paused = max(self._paused, now + min(pause, 300))
+            else:
+                self.rate = min(self.max_rate, self.rate + self.step)
+                self._healthy += 1
+                if self._healthy >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._healthy = 0
+            self._cond.notify_all()
+
+class _LimitedSession(requests.Session):
+    """Session cuyas peticiones pasan por el AdaptiveLimiter."""
+    def __init__(self, limiter):
+        super().__init__()
+        self.limiter = limiter
+
+    def request(self, *args, **kwargs):
+        self.limiter.acquire()
+        try:
+            r = super().request(*args, **kwargs)
+        except requests.RequestException:
+            self.limiter.feedback(None)
+            raise
+        self.limiter.feedback(r.status_code, r.elapsed.total_seconds(),
+                              r.headers.get("Retry-After"))
+        return r
+
+# ─────────────────────────────────────────────────────────────
+class RetryScheduler:
+    """
+    Cola de reintentos diferidos: `schedule(delay, fn, *args)` ejecuta `fn`
+    en un hilo propio cuando vence la espera, sin bloquear a ningún worker.
+    `count=False` no lo cuenta como reintento (p.ej. una espera de turno).
+    """
+    def __init__(self):
+        self._heap   = []
+        self._seq    = itertools.count()
+        self._cond   = threading.Condition()
+        self._closed = False
+        self.count   = 0              # reintentos programados (para métricas)
+        threading.Thread(target=self._run, name="retry-scheduler", daemon=True).start()
+
+    def schedule(self, delay, fn, *args, count=True):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), fn, args))
+            self.count += count
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (
+                    not self._heap or self._heap[0][0] > time.monotonic()
+                ):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                _, _, fn, args = heapq.heappop(self._heap)
+            try:
+                fn(*args)
+            except Exception as e:
+                logging.error(f"RetryScheduler: fallo al reprogramar: {e}")
@@ -0,0 +1,186 @@
+"""
+Diario de corridas del ETL (root_dir/state/journal.sqlite).
+
+Cada corrida anota qué file_id quedó descargado, normalizado y consolidado,
+y qué etapas terminó.  Si run_flow se interrumpe (error, corte de luz,
+proceso matado), la siguiente ejecución retoma esa misma corrida: no vuelve
+a pedir los archivos ya descargados, normaliza solo los pendientes y
+consolida lo que faltaba.
+
+    python journal.py            # últimas corridas y su avance
+"""
+from __future__ import annotations
+
+import datetime
+import sqlite3
+import threading
+from pathlib import Path
+
+DOWNLOADED, NORMALIZED, CONSOLIDATED = 1, 2, 3
+STAGES = {DOWNLOADED: "downloaded", NORMALIZED: "normalized", CONSOLIDATED: "consolidated"}
+
+
+def journal_path(root_dir) -> Path:
+    return Path(root_dir) / "state" / "journal.sqlite"
+
+def _now():
+    return datetime.datetime.utcnow().isoformat(timespec="seconds")
+
+
+class RunJournal:
+    """
+    Diario ligado a una corrida.  Usar RunJournal.open(): retoma la última
+    corrida sin terminar (si `resume`) o empieza una nueva.  Los métodos son
+    seguros entre hilos y cada anotación se graba al momento.
+    """
+    def __init__(self, db_path, run_id):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS runs(
+            run_id      TEXT PRIMARY KEY,
+            started     TEXT,
+            finished    TEXT,
+            status      TEXT,               -- running | failed | done
+            window_days INTEGER,
+            full_crawl  INTEGER,
+            download_done INTEGER DEFAULT 0,
+            error       TEXT,
+            files       INTEGER)""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS items(
+            run_id  TEXT,
+            file_id TEXT,
+            stage   INTEGER,                -- 1 descargado · 2 normalizado · 3 consolidado
+            updated TEXT,
+            PRIMARY KEY(run_id, file_id))""")
+        self.conn.commit()
+        self.run_id = run_id
+        self.resumed = False
+        self.window_days = self.full_crawl = None
+        self.download_done = False
+
+    @classmethod
+    def open(cls, root_dir, run_id, window_days, full_crawl, resume=True):
+        """
+        Retoma la última corrida `running`/`failed` (con su ventana y modo de
+        crawl) o registra `run_id` como corrida nueva.
+        """
+        j   = cls(journal_path(root_dir), run_id)
+        row = j.conn.execute("""SELECT run_id, window_days, full_crawl, download_done FROM runs
+                                WHERE status IN ('running', 'failed')
+                                ORDER BY started DESC LIMIT 1""").fetchone() if resume else None
+        with j.lock:
+            if row is not None:
+                j.run_id, j.window_days, full, done = row
+                j.full_crawl, j.download_done, j.resumed = bool(full), bool(done), True
+                j.conn.execute("UPDATE runs SET status='running', error=NULL WHERE run_id=?",
+                               (j.run_id,))
+            else:
+                # una corrida sin terminar que no se retoma queda abandonada
+                j.conn.execute("""UPDATE runs SET status='abandoned', finished=?
+                                  WHERE status IN ('running', 'failed')""", (_now(),))
+                j.window_days, j.full_crawl = window_days, full_crawl
+                j.conn.execute("""INSERT INTO runs(run_id, started, status, window_days, full_crawl)
+                                  VALUES(?,?,?,?,?)""",
+                               (run_id, _now(), "running", window_days, int(full_crawl)))
+            j.conn.commit()
+        return j
+
+    # ── anotaciones ─────────────────────────────────────────
+    def mark(self, file_ids, stage):
+        """Sube `file_ids` a la etapa `stage` (nunca la baja)."""
+        rows = [(self.run_id, f, stage, _now()) for f in file_ids]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany("""INSERT INTO items(run_id, file_id, stage, updated)
+                                     VALUES(?,?,?,?)
+                                     ON CONFLICT(run_id, file_id) DO UPDATE SET
+                                       stage   = MAX(stage, excluded.stage),
+                                       updated = excluded.updated""", rows)
+            self.conn.commit()
+
+    def downloaded(self, file_id):
+        self.mark([file_id], DOWNLOADED)
+
+    def download_finished(self):
+        with self.lock:
+            self.conn.execute("UPDATE runs SET download_done=1 WHERE run_id=?", (self.run_id,))
+            self.conn.commit()
+        self.download_done = True
+
+    def ids(self, stage=None):
+        """file_ids de la corrida; con `stage`, solo los que están exactamente en esa etapa."""
+        sql, args = "SELECT file_id FROM items WHERE run_id=?", [self.run_id]
+        if stage is not None:
+            sql += " AND stage=?"
+            args.append(stage)
+        with self.lock:
+            return [r[0] for r in self.conn.execute(sql + " ORDER BY file_id", args)]
+
+    def pending(self, stage):
+        """file_ids que todavía no llegaron a `stage`."""
+        with self.lock:
+            return [r[0] for r in self.conn.execute(
+                "SELECT file_id FROM items WHERE run_id=? AND stage<? ORDER BY file_id",
+                (self.run_id, stage))]
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT stage, COUNT(*) FROM items WHERE run_id=? GROUP BY stage",
+                                     (self.run_id,)).fetchall()
+        return {STAGES[s]: n for s, n in rows}
+
+    # ── cierre ──────────────────────────────────────────────
+    def finish(self):
+        """Corrida completa: se guarda el total y se borran sus items."""
+        with self.lock:
+            n = self.conn.execute("SELECT COUNT(*) FROM items WHERE run_id=?",
+                                  (self.run_id,)).fetchone()[0]
+            self.conn.execute("UPDATE runs SET status='done', finished=?, files=? WHERE run_id=?",
+                              (_now(), n, self.run_id))
+            self.conn.execute("DELETE FROM items WHERE run_id=?", (self.run_id,))
+            self.conn.commit()
+
+    def fail(self, error):
+        with self.lock:
+            self.conn.execute("UPDATE runs SET status='failed', error=? WHERE run_id=?",
+                              (str(error)[:2000], self.run_id))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def main(argv=None) -> None:
+    import argparse, yaml
+    ap = argparse.ArgumentParser(description="Diario de corridas del ETL")
+    ap.add_argument("--last", type=int, default=10, help="cuántas corridas mostrar")
+    args = ap.parse_args(argv)
+
+    cfg  = yaml.safe_load((Path(__file__).resolve().parent / "config.yaml").read_text(encoding="utf-8"))
+    path = journal_path(cfg["root_dir"])
+    if not path.exists():
+        print(f"No existe el diario {path}")
+        return
+    conn = sqlite3.connect(path)
+    try:
+        runs = conn.execute("""SELECT run_id, status, started, finished, download_done, files, error
+                               FROM runs ORDER BY started DESC LIMIT ?""", (args.last,)).fetchall()
+        for run_id, status, started, finished, dl_done, files, error in runs:
+            stages = dict(conn.execute("SELECT stage, COUNT(*) FROM items WHERE run_id=? GROUP BY stage",
+                                       (run_id,)).fetchall())
+            avance = files if status == "done" else \
+                ", ".join(f"{STAGES[s]}={n}" for s, n in sorted(stages.items())) or "sin archivos"
+            print(f"{run_id}  {status:<9} {started} → {finished or '…'}  "
+                  f"descarga {'completa' if dl_done else 'en curso'}  {avance}")
+            if error:
+                print(f"    {error}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
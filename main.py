@@ -1,4 +1,7 @@
-from webapp.app import app
-
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    # importar dentro del guard: los workers del ETL (spawn) re-importan este
+    # módulo como __mp_main__ y no deben cargar la web ni el modelo
+    from webapp.app import app, start_warm_up
+
+    start_warm_up()
+    app.run()
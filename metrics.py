@@ -0,0 +1,306 @@
+"""
+Métricas estructuradas de cada corrida del ETL.
+
+RunMetrics acumula tiempos por etapa y por file_id, bytes descargados,
+filas leídas/escritas/duplicadas por tabla, reintentos y la memoria
+residente muestreada durante cada etapa, y al terminar los guarda en
+root_dir/state/runs/<run_id>.json.  Los registros se consultan entre
+corridas con load_runs() o desde la línea de comandos:
+
+    python metrics.py                         # una línea por corrida
+    python metrics.py --table records         # una tabla en cada corrida
+    python metrics.py 20250301T020000123456Z  # detalle (JSON)
+"""
+from __future__ import annotations
+
+import contextlib
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+def runs_dir(root_dir) -> Path:
+    return Path(root_dir) / "state" / "runs"
+
+def peak_rss_mb() -> dict:
+    """
+    Pico de memoria residente (MB) del proceso y del mayor de sus hijos ya
+    terminados, desde que arrancó el proceso: solo sirve para procesos de
+    una sola medición (p.ej. bench/etl_bench.py); las corridas del ETL usan
+    el muestreo de RunMetrics.
+    """
+    try:
+        import resource
+    except ImportError:                        # Windows: solo el proceso actual
+        return {"self": _win_peak_mb(), "children": None}
+    scale = 1 / (1 << 20) if sys.platform == "darwin" else 1 / 1024   # bytes vs KB
+    return {"self":     round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+            "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1)}
+
+def rss_mb() -> float | None:
+    """
+    Memoria residente actual (MB) del proceso más la de sus hijos vivos (p.ej.
+    el pool de normalización) si psutil está instalado; sin psutil, solo la
+    del proceso.
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            me = psutil.Process()
+            rss = me.memory_info().rss
+            for child in me.children(recursive=True):
+                with contextlib.suppress(psutil.Error):
+                    rss += child.memory_info().rss
+            return round(rss / (1 << 20), 1)
+        except psutil.Error:
+            return None
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20), 1)
+    except (OSError, ValueError, AttributeError):
+        return _win_peak_mb("WorkingSetSize")
+
+def _win_peak_mb(field="PeakWorkingSetSize"):
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class _Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + \
+                       [(n, ctypes.c_size_t) for n in (
+                           "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                           "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                           "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+        c = _Counters()
+        c.cb = ctypes.sizeof(c)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(c), c.cb)
+        return round(getattr(c, field) / (1 << 20), 1)
+    except Exception:
+        return None
+
+
+def _new_run_id(folder: Path, now: datetime.datetime) -> str:
+    """
+    Id de corrida (también clave del diario, journal.py): con microsegundos,
+    porque una corrida sin cambios dura décimas de segundo y el programador
+    encadena la siguiente enseguida; sufijo -k si aun así ya existe.
+    """
+    name = now.strftime("%Y%m%dT%H%M%S%fZ")
+    run_id, k = name, 1
+    while (folder / f"{run_id}.json").exists():
+        run_id, k = f"{name}-{k}", k + 1
+    return run_id
+
+
+class RunMetrics:
+    """
+    Registro de una corrida.  Es seguro entre hilos (los callbacks del
+    pipeline anotan desde varios a la vez).
+
+      * stage(nombre) / begin / end: inicio, fin y segundos de cada etapa,
+        en segundos desde el inicio de la corrida (en modo pipelined las
+        etapas se solapan), y la memoria residente (rss_mb) al empezar, al
+        terminar y el pico muestreado cada SAMPLE_S segundos mientras dura.
+        Es memoria de esta corrida aunque el proceso (web, scheduler) viva
+        muchas.
+      * file(file_id, …) y table(tabla, …): campos por archivo y por tabla;
+        los numéricos se suman si se anotan varias veces.
+      * save(status): escribe el JSON (de forma atómica) y devuelve la ruta.
+    """
+    SAMPLE_S = 0.5
+
+    def __init__(self, root_dir, mode="sequential"):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.dir    = runs_dir(root_dir)
+        self.run_id = _new_run_id(self.dir, now)
+        self._t0    = time.perf_counter()
+        self._lock  = threading.Lock()
+        self.record = {"run_id": self.run_id, "started": now.isoformat(timespec="seconds"),
+                       "mode": mode, "status": "running", "seconds": None,
+                       "stages": {}, "download": {}, "files": {}, "tables": {}, "extra": {},
+                       "rss_peak_mb": None}
+        self._sampling = threading.Event()
+        self._sampler  = None
+
+    def _now(self):
+        return round(time.perf_counter() - self._t0, 3)
+
+    def begin(self, stage):
+        with self._lock:
+            if stage in self.record["stages"]:
+                return
+            rss = rss_mb()
+            self.record["stages"][stage] = {"start": self._now(), "end": None, "seconds": None,
+                                            "rss_start_mb": rss, "rss_peak_mb": rss,
+                                            "rss_end_mb": None}
+            self._peak(rss)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+
+    def end(self, stage, **fields):
+        self.begin(stage)
+        rss = rss_mb()
+        with self._lock:
+            st = self.record["stages"][stage]
+            st["end"]     = self._now()
+            st["seconds"] = round(st["end"] - st["start"], 3)
+            st["rss_end_mb"] = rss
+            self._peak(rss, [st])
+            st.update(fields)
+
+    def _peak(self, rss, stages=()):
+        if rss is None:
+            return
+        for st in (self.record, *stages):
+            if st["rss_peak_mb"] is None or rss > st["rss_peak_mb"]:
+                st["rss_peak_mb"] = rss
+
+    def _sample(self):
+        while not self._sampling.wait(self.SAMPLE_S):
+            rss = rss_mb()
+            with self._lock:
+                self._peak(rss, [st for st in self.record["stages"].values()
+                                 if st["end"] is None])
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.begin(name)
+        try:
+            yield self
+        finally:
+            self.end(name)
+
+    @staticmethod
+    def _merge(dst, fields):
+        for k, v in fields.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and \
+                    isinstance(dst.get(k), (int, float)):
+                dst[k] = round(dst[k] + v, 3)
+            else:
+                dst[k] = v
+
+    def file(self, file_id, **fields):
+        with self._lock:
+            self._merge(self.record["files"].setdefault(file_id, {}), fields)
+
+    def table(self, name, **fields):
+        with self._lock:
+            self._merge(self.record["tables"].setdefault(name, {}), fields)
+
+    def extra(self, **fields):
+        with self._lock:
+            self.record["extra"].update(fields)
+
+    def download(self, stats: dict, per_file: dict):
+        """Contadores de downloader.STATS (as_dict / per_file) de la corrida."""
+        with self._lock:
+            self.record["download"] = dict(stats)
+        for file_id, fields in per_file.items():
+            self.file(file_id, **fields)
+
+    def normalized(self, res: dict):
+        """Anota un resultado de normalizer.normalize_csv."""
+        tbl = res["csv"].replace(".csv", "")
+        self.file(res["file_id"], normalize_s=res.get("seconds", 0.0), csv_rows=res["rows"],
+                  csv_bytes=res.get("bytes", 0), csv_errors=int(res["status"] != "ok"))
+        self.table(tbl, csv_files=1, csv_rows=res["rows"], csv_bytes=res.get("bytes", 0),
+                   normalize_s=res.get("seconds", 0.0))
+
+    def save(self, status="ok", error=None) -> Path:
+        self._sampling.set()
+        with self._lock:
+            rec = self.record
+            rec["status"]  = status
+            rec["error"]   = error
+            rec["seconds"] = self._now()
+            for st in rec["stages"].values():
+                if st["end"] is None:                  # etapa cortada por un error
+                    st["end"] = rec["seconds"]
+                    st["seconds"] = round(st["end"] - st["start"], 3)
+            for t in rec["tables"].values():
+                if t.get("consolidate_s"):
+                    t["rows_s"] = round(t.get("rows_read", 0) / t["consolidate_s"], 1)
+            if rec["stages"].get("download", {}).get("seconds"):
+                rec["download"]["mb_s"] = round(rec["download"].get("bytes", 0) / (1 << 20)
+                                                / rec["stages"]["download"]["seconds"], 2)
+            self.dir.mkdir(parents=True, exist_ok=True)
+            path = self.dir / f"{self.run_id}.json"
+            tmp  = path.with_name(f".{path.name}.tmp")
+            tmp.write_text(json.dumps(rec, indent=2, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+        return path
+
+
+def load_runs(root_dir, last: int | None = None) -> list[dict]:
+    """Registros de corridas, de la más antigua a la más reciente (`last`: solo las últimas)."""
+    paths = sorted(runs_dir(root_dir).glob("*.json"))
+    if last:
+        paths = paths[-last:]
+    runs = []
+    for p in paths:
+        try:
+            runs.append(json.loads(p.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return runs
+
+def summary(run: dict) -> dict:
+    """Una fila por corrida: segundos por etapa, volumen y memoria."""
+    stages = run.get("stages", {})
+    tables = run.get("tables", {}).values()
+    return {
+        "run_id":      run["run_id"],
+        "status":      run.get("status"),
+        "mode":        run.get("mode"),
+        "seconds":     run.get("seconds"),
+        **{f"{s}_s": stages.get(s, {}).get("seconds")
+           for s in ("download", "normalize", "consolidate")},
+        "files":       run.get("download", {}).get("files", 0),
+        "mb":          round(run.get("download", {}).get("bytes", 0) / (1 << 20), 1),
+        "retries":     run.get("download", {}).get("retries", 0),
+        "csv_rows":    sum(t.get("csv_rows", 0) for t in tables),
+        "duplicates":  sum(t.get("duplicates", 0) for t in tables),
+        "rows_written": sum(t.get("rows_written", 0) for t in tables),
+        "rss_peak_mb": run.get("rss_peak_mb"),
+    }
+
+def main(argv=None) -> None:
+    import argparse, yaml
+    ap = argparse.ArgumentParser(description="Métricas de las corridas del ETL")
+    ap.add_argument("run_id", nargs="?", help="corrida a mostrar completa")
+    ap.add_argument("--last", type=int, default=20, help="cuántas corridas listar")
+    ap.add_argument("--table", help="evolución de una tabla entre corridas")
+    ap.add_argument("--json", action="store_true", help="salida JSON")
+    args = ap.parse_args(argv)
+
+    cfg  = yaml.safe_load((Path(__file__).resolve().parent / "config.yaml").read_text(encoding="utf-8"))
+    if args.run_id:
+        path = runs_dir(cfg["root_dir"]) / f"{args.run_id}.json"
+        print(path.read_text(encoding="utf-8") if path.exists() else f"No existe {path}")
+        return
+    runs = load_runs(cfg["root_dir"], args.last)
+    if args.table:
+        rows = [{"run_id": r["run_id"], **r.get("tables", {}).get(args.table, {})} for r in runs
+                if args.table in r.get("tables", {})]
+    else:
+        rows = [summary(r) for r in runs]
+    if args.json:
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+        return
+    if not rows:
+        print("Sin corridas registradas")
+        return
+    import pandas as pd
+    print(pd.DataFrame(rows).to_string(index=False, na_rep="-"))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
-import re, textwrap, duckdb, yaml, pandas as pd, hashlib, enum
+import re, textwrap, duckdb, yaml, pandas as pd, hashlib, enum, threading
 from pathlib import Path
 from typing import Dict, List
 
-from .sql_schema   import build_views, schema_markdown
+from .sql_schema   import (SERVING_DB, build_views, current_snapshot,
+                            load_schema, schema_markdown)
 from .llm_backend  import get_backend
 from .templates    import PROMPT_TEMPLATE, SUMMARY_TEMPLATE
 
@@ -51,11 +52,34 @@ class NL2SQLAgent:
             cfg = yaml.safe_load(f)
 
         self.cfg      = cfg
-        self.con      = duckdb.connect()
-        self.schema   = build_views(self.con, Path(cfg["parquet_dir"]))
+        self.con      = None
+        self.snapshot = None
+        self._db_lock = threading.Lock()       # la conexión DuckDB no es segura entre hilos
+        self._refresh()
         self.backend  = get_backend(cfg)
         self.verbose  = verbose
 
+    def _refresh(self) -> None:
+        """
+        Abre el snapshot publicado (final/CURRENT) si cambió desde la última
+        consulta: un ETL de otro proceso (scheduler.py) publica snapshots
+        nuevos y borra los viejos sin avisar a la web.
+        """
+        parquet_dir = Path(self.cfg["parquet_dir"])
+        snap = current_snapshot(parquet_dir)
+        if snap == self.snapshot and self.con is not None:
+            return
+        # base nativa del snapshot (consolidator, serving_db) o vistas sobre Parquet
+        db_path = snap / SERVING_DB
+        if self.cfg.get("use_serving_db", True) and db_path.exists():
+            con    = duckdb.connect(str(db_path), read_only=True)
+            schema = load_schema(con)
+        else:
+            con    = duckdb.connect()
+            schema = build_views(con, snap)
+        old, self.con, self.schema, self.snapshot = self.con, con, schema, snap
+        if old is not None:
+            old.close()
         self.schema_md   = schema_markdown(self.schema, self.con)
         self.schema_hash = hashlib.md5(self.schema_md.encode()).hexdigest()[:8]
 
@@ -98,6 +122,8 @@ class NL2SQLAgent:
         if max_retries is None:
             max_retries = 2 if "openai" in self.cfg.get("model_type", "") else 3
 
+        with self._db_lock:
+            self._refresh()
         error, sql, resp = None, "", ""
         for attempt in range(1, max_retries + 1):
 
@@ -130,7 +156,8 @@ class NL2SQLAgent:
                 continue
 
             try:
-                df = self.con.sql(sql.replace("`", '"')).df()
+                with self._db_lock:
+                    df = self.con.sql(sql.replace("`", '"')).df()
                 break          # ✔️ éxito
             except Exception as e:
                 error = str(e) + f"\nSQL fallido:\n{sql}"
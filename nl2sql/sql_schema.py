@@ -5,12 +5,15 @@ Genera las VIEW s DuckDB a partir de los *.parquet* garantizando:
 2.  Desambiguación automática de nombres comunes como id, date, title…
 3.  Colisiones resueltas con sufijos _1, _2, …
 4.  Year y month siempre salen como INTEGER.
+
+Con build_database las mismas columnas se materializan como tablas nativas
+en un archivo .duckdb (formato de servicio, se abre en solo lectura).
 """
 
 from __future__ import annotations
-import re, textwrap, duckdb, pyarrow.parquet as pq
+import os, re, shutil, textwrap, duckdb, pyarrow.parquet as pq
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List, Tuple
 from .utils import clean_identifier
 
 # ---------------------------------------------------------------------
@@ -32,6 +35,7 @@ _PREFIX_MAP = {
     "ten_tenderers":     "tenderer",
 }
 _SANITIZE = re.compile(r"[^A-Za-z0-9_]")
+SERVING_DB = "osce.duckdb"          # base nativa dentro de cada snapshot
 
 def _tokenize(path: str) -> List[str]:
     """Divide ‘compiledRelease/awards/0/value/amount’ → ['awards','value','amount']."""
@@ -55,61 +59,145 @@ def _colname(path: str, tbl_prefix: str) -> str:
     return name or f"{tbl_prefix}_col"
 
 # ---------------------------------------------------------------------
-def build_views(con: duckdb.DuckDBPyConnection,
-                parquet_dir: Path) -> Dict[str, List[str]]:
+def current_snapshot(parquet_dir: Path) -> Path:
     """
-    Recorre el directorio, crea/actualiza VIEWs y devuelve
-    {tabla: [lista_columnas_limpias]} para el prompt.
-    Si no hay archivos Parquet → FileNotFoundError.
+    Directorio con los Parquet publicados: si `parquet_dir` tiene un
+    puntero CURRENT (snapshots del consolidador) se usa
+    snapshots/<CURRENT>; si no, el propio directorio (layout anterior).
     """
-    schema: Dict[str, List[str]] = {}
-
-    # --- NUEVO BLOQUE DE VALIDACIÓN ---
+    ptr = parquet_dir / "CURRENT"
+    if ptr.exists():
+        snap = parquet_dir / "snapshots" / ptr.read_text(encoding="utf-8").strip()
+        if snap.is_dir():
+            return snap
+    return parquet_dir
+
+def table_columns(pq_file: Path) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Nombre de tabla y pares (columna Parquet, columna limpia) de un
+    *_latest.parquet, con las colisiones resueltas con sufijos _1, _2, …
+    """
+    table_raw = pq_file.stem.lower().replace("_latest", "")
+    table     = clean_identifier(table_raw)
+    if table.startswith("com_"):
+        table = table[4:]
+    tbl_prefix = _PREFIX_MAP.get(table, table.split("_", 1)[0])
+
+    meta      = pq.read_metadata(pq_file)
+    raw_cols  = meta.schema.names
+
+    pairs, clean_cols = [], []
+    for raw in raw_cols:
+        clean = _colname(raw, tbl_prefix)
+
+        # si ya existe ⇒ añade sufijo incremental
+        base, k = clean, 1
+        while clean in clean_cols:
+            clean = f"{base}_{k}"
+            k += 1
+
+        clean_cols.append(clean)
+        pairs.append((raw, clean))
+    return table, pairs
+
+def _select_sql(pairs: List[Tuple[str, str]]) -> str:
+    select_parts = []
+    for raw, clean in pairs:
+        # 🔄  Casteo automático de year / month a INTEGER
+        if clean in {"year", "month"}:
+            select_parts.append(f'CAST("{raw}" AS INTEGER) AS "{clean}"')
+        else:
+            select_parts.append(f'"{raw}" AS "{clean}"')
+    return ", ".join(select_parts)
+
+def _parquet_files(parquet_dir: Path) -> List[Path]:
     pq_files = list(parquet_dir.glob("*.parquet"))
     if not pq_files:
         raise FileNotFoundError(
             f"No se encontraron archivos *.parquet en {parquet_dir}. "
             "Ejecuta el ETL antes de construir las vistas."
         )
-    # ----------------------------------
+    return pq_files
 
-    for pq_file in pq_files:
-        table_raw = pq_file.stem.lower().replace("_latest", "")
-        table     = clean_identifier(table_raw)
-        if table.startswith("com_"):
-            table = table[4:]
-        tbl_prefix = _PREFIX_MAP.get(table, table.split("_", 1)[0])
-
-        meta      = pq.read_metadata(pq_file)
-        raw_cols  = meta.schema.names
-
-        select_parts, clean_cols = [], []
-
-        for raw in raw_cols:
-            clean = _colname(raw, tbl_prefix)
-
-            # si ya existe ⇒ añade sufijo incremental
-            base, k = clean, 1
-            while clean in clean_cols:
-                clean = f"{base}_{k}"
-                k += 1
-
-            clean_cols.append(clean)
-
-            # 🔄  Casteo automático de year / month a INTEGER
-            if clean in {"year", "month"}:
-                select_parts.append(f'CAST("{raw}" AS INTEGER) AS "{clean}"')
-            else:
-                select_parts.append(f'"{raw}" AS "{clean}"')
+def build_views(con: duckdb.DuckDBPyConnection,
+                parquet_dir: Path) -> Dict[str, List[str]]:
+    """
+    Recorre el snapshot publicado del directorio (ver current_snapshot),
+    crea/actualiza VIEWs y devuelve {tabla: [lista_columnas_limpias]}
+    para el prompt.
+    Si no hay archivos Parquet → FileNotFoundError.
+    """
+    schema: Dict[str, List[str]] = {}
+    parquet_dir = current_snapshot(parquet_dir)
 
+    for pq_file in _parquet_files(parquet_dir):
+        table, pairs = table_columns(pq_file)
         view_sql = f"""
         CREATE OR REPLACE VIEW "{table}" AS
-        SELECT {", ".join(select_parts)}
+        SELECT {_select_sql(pairs)}
         FROM read_parquet('{pq_file.as_posix()}');
         """
         con.sql(textwrap.dedent(view_sql))
-        schema[table] = clean_cols
+        schema[table] = [clean for _, clean in pairs]
+
+    return schema
 
+def build_database(parquet_dir: Path, db_path: Path,
+                   index_columns: Iterable[str] = ("ocid",),
+                   tables: Iterable[str] | None = None,
+                   base_db: Path | None = None,
+                   memory_limit: str | None = None) -> Dict[str, List[str]]:
+    """
+    Materializa cada *_latest.parquet de `parquet_dir` como tabla nativa de
+    `db_path` (mismos nombres y casteos que build_views) con un índice ART
+    en las columnas de `index_columns` que existan.  Con `base_db` se parte
+    de una copia de esa base y solo se recrean las tablas de `tables`
+    (stems de Parquet, p.ej. "com_awards_latest").  Se escribe a un .tmp y
+    se renombra al final.  Devuelve {tabla: columnas}.
+    """
+    tmp = db_path.with_name(f".{db_path.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    wanted = set(tables) if tables is not None else None
+    if wanted is not None and base_db is not None and base_db.exists():
+        shutil.copy2(base_db, tmp)
+    else:
+        wanted = None                          # sin base: se construye entera
+
+    schema: Dict[str, List[str]] = {}
+    con = duckdb.connect(str(tmp))
+    try:
+        if memory_limit:
+            con.execute(f"SET memory_limit='{memory_limit}'")
+        for pq_file in sorted(_parquet_files(parquet_dir)):
+            table, pairs = table_columns(pq_file)
+            cols = [clean for _, clean in pairs]
+            schema[table] = cols
+            if wanted is not None and pq_file.stem not in wanted:
+                continue
+            con.execute(f"""CREATE OR REPLACE TABLE "{table}" AS
+                SELECT {_select_sql(pairs)}
+                FROM read_parquet('{pq_file.as_posix()}')""")
+            for col in index_columns:
+                if col in cols:
+                    con.execute(f'CREATE INDEX "{table}_{col}_idx" ON "{table}"("{col}")')
+        con.execute("CHECKPOINT")
+    except BaseException:
+        con.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    con.close()
+    os.replace(tmp, db_path)
+    return schema
+
+def load_schema(con: duckdb.DuckDBPyConnection) -> Dict[str, List[str]]:
+    """{tabla: columnas} de una base ya construida con build_database."""
+    rows = con.execute(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = 'main' ORDER BY table_name, ordinal_position"
+    ).fetchall()
+    schema: Dict[str, List[str]] = {}
+    for table, col in rows:
+        schema.setdefault(table, []).append(col)
     return schema
 
 # ---------------------------------------------------------------------
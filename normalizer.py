@@ -1,6 +1,9 @@
-import pandas as pd, hashlib, yaml, logging
+import pandas as pd, hashlib, yaml, logging, os, concurrent.futures, csv, uuid, time, collections
+import pyarrow as pa, pyarrow.csv as pacsv, pyarrow.parquet as pq, pyarrow.dataset as ds, pyarrow.compute as pc
 from pathlib import Path
 
+import catalog
+
 EXPECTED = [
   "com_awa_ite_additionalClassific.csv","com_awa_ite_tot_exchangeRates.csv","com_awa_items.csv",
   "com_awa_suppliers.csv","com_awa_val_exchangeRates.csv","com_awards.csv","com_con_documents.csv",
@@ -13,22 +16,318 @@ EXPECTED = [
 def signature(cols:list) -> str:
     return hashlib.md5("|".join(cols).encode()).hexdigest()
 
-def run_normalization(file_ids=None):
-    from pathlib import Path
-    CFG = Path(__file__).resolve().parent / "config.yaml"   # mismo directorio que el .py
-    with open(CFG, encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
-    root = Path(cfg["root_dir"])
-    proc = root / "processed" / "signatures"
-    proc.mkdir(parents=True, exist_ok=True)
+def _csv_header(path):
+    """Cabecera del CSV con los mismos nombres que daría pandas (duplicados → 'x.1', vacíos → 'Unnamed: i')."""
+    with open(path, newline="", encoding="utf-8-sig") as f:     # sin BOM, como pandas
+        header = next(csv.reader(f), [])
+    names, seen = [], {}
+    for i, col in enumerate(header):
+        col = col or f"Unnamed: {i}"
+        if col in seen:
+            seen[col] += 1
+            col = f"{col}.{seen[col]}"
+        else:
+            seen[col] = 0
+        names.append(col)
+    return names
 
-    if file_ids is None:
-        file_ids = [p.name for p in (root / "extracted_csv").iterdir() if p.is_dir()]
+def _ordered(names, order=None):
+    """`names` en el orden del superconjunto de la tabla; las columnas nuevas, al final."""
+    if not order:
+        return list(names)
+    pos = {n: i for i, n in enumerate(order)}
+    return sorted(names, key=lambda n: (pos.get(n, len(pos)), names.index(n)))
 
-    if not file_ids:
-        logging.info("No hay IDs para normalizar.")
-        return
+class _Demoted(Exception):
+    """Un bloque posterior no encajó en los tipos registrados ({columna: tipo más ancho})."""
+    def __init__(self, changes):
+        super().__init__(", ".join(f"{c}→{t}" for c, t in changes.items()))
+        self.changes = changes
+
+def _write_arrow(path, out_file, names, extra, block_size, resolve_types=None,
+                 drop=(), metadata=None, write_kw=None, order=None, hashed=False):
+    """
+    Lee el CSV por bloques de `block_size` bytes con el lector incremental de
+    Arrow y escribe cada bloque como row group; la memoria queda acotada por
+    el bloque y no por el tamaño del archivo.  Devuelve el nº de filas.
+    `resolve_types(primer_batch)` devuelve los tipos de la firma (o None
+    para dejar todo como string); si un bloque no encaja lanza _Demoted.
+    `drop` son columnas de partición que no se escriben (layout hive) y
+    `order` el orden de columnas del superconjunto de la tabla.  Con
+    `hashed` se añade la columna catalog.HASH_COL (catalog.row_hash).
+    """
+    write_kw = dict(write_kw or {})
+    rg_rows  = write_kw.pop("row_group_size", None)
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(column_names=names, skip_rows=1, block_size=block_size),
+        # descripciones OCDS con saltos de línea entre comillas (como pandas)
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(column_types={n: pa.string() for n in names},
+                                             strings_can_be_null=True),
+    )
+    batches = iter(reader)
+    first   = next(batches, None)
+    types   = resolve_types(first if first is not None else reader.schema.empty_table()) \
+              if resolve_types else None
+    hcol    = [catalog.HASH_COL] if hashed else []
+    keep    = _ordered([n for n in names + list(extra) + hcol if n not in drop], order)
+    schema  = catalog.target_schema(keep, types or {}).with_metadata(metadata)
+
+    rows, tmp = 0, out_file.with_name(out_file.name + ".tmp")
+    try:
+        with pq.ParquetWriter(tmp, schema, **write_kw) as writer:
+            for batch in _chain(first, batches):
+                n = batch.num_rows
+                cols = list(batch.columns) + [pa.array([v] * n, pa.string()) for v in extra.values()]
+                batch = pa.RecordBatch.from_arrays(cols, names=names + list(extra))
+                if types is not None:
+                    batch, demoted = catalog.apply_types(batch, types)
+                    if demoted:
+                        raise _Demoted(demoted)
+                if hashed:
+                    batch = batch.append_column(catalog.HASH_COL, catalog.row_hash(batch))
+                batch = batch.select(keep).cast(schema)
+                writer.write_batch(batch, row_group_size=rg_rows)
+                rows += n
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, out_file)
+    return rows
+
+def _null_columns(path):
+    """Columnas sin ningún valor en el Parquet `path` (según las estadísticas de sus row groups)."""
+    meta  = pq.read_metadata(path)
+    nulls = collections.Counter()
+    for i in range(meta.num_row_groups):
+        rg = meta.row_group(i)
+        for j in range(rg.num_columns):
+            col   = rg.column(j)
+            stats = col.statistics
+            if stats is None or not stats.has_null_count:
+                nulls[col.path_in_schema] -= 1 << 62      # sin estadísticas: no se sabe
+            else:
+                nulls[col.path_in_schema] += stats.null_count
+    return {c for c in meta.schema.names if nulls[c] == meta.num_rows}
+
+def _chain(first, rest):
+    if first is not None:
+        yield first
+    yield from rest
+
+def _write_pandas(df, out_file, resolve_types=None, drop=(), metadata=None, write_kw=None,
+                  order=None, hashed=False):
+    """Escribe el DataFrame completo con los tipos de la firma (si los hay)."""
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):      # object con tipos mezclados
+        obj = df.select_dtypes("object").columns
+        table = pa.Table.from_pandas(df.astype({c: "string" for c in obj}), preserve_index=False)
+    if resolve_types is not None:
+        table, demoted = catalog.apply_types(table, resolve_types(table))
+        if demoted:
+            raise _Demoted(demoted)
+    if hashed:
+        table = table.append_column(catalog.HASH_COL, catalog.row_hash(table))
+    table = table.select(_ordered([n for n in table.schema.names if n not in drop], order))
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **(metadata or {})})
+    tmp = out_file.with_name(out_file.name + ".tmp")
+    pq.write_table(table, tmp, **(write_kw or {}))
+    os.replace(tmp, out_file)
+    return table.num_rows
+
+def normalize_csv(proc_dir, folder, file_id, csv_name, opts=None):
+    """
+    Normaliza un CSV de un file_id →
+      layout "signatures": processed/signatures/<csv>/signature_<md5>/<file_id>.parquet
+      layout "hive":       processed/tables/<csv>/version=…/year=…/month=…/<file_id>.parquet
+                           (las columnas de partición van en la ruta, no en el archivo)
+
+    `opts`:
+      * engine      "arrow" usa el lector en streaming de PyArrow (memoria
+                    acotada por `block_size`); "pandas" carga el CSV completo.
+      * block_size  bytes por bloque del lector Arrow.
+      * types_db    ruta del catálogo de tipos; si se da, cada firma se
+                    escribe con sus tipos registrados (inferidos la 1ª vez).
+      * catalog_db  ruta del catálogo de firmas; si se da, el archivo se
+                    escribe en el orden de columnas del superconjunto de la
+                    tabla y queda registrado (columnas, tipos, filas).
+      * row_hash    añade la columna catalog.HASH_COL con el hash de
+                    contenido de cada fila (deduplicación en la consolidación).
+      * layout, partitions, write_kw (compression, row_group_size…).
+
+    Se ejecuta en procesos hijos: no registra nada, devuelve un dict con el
+    resultado (`status` ok|error, filas, bytes del CSV, segundos) para que el
+    proceso padre lo registre.
+    """
+    t0   = time.perf_counter()
+    opts = opts or {}
+    engine, block_size = opts.get("engine", "pandas"), opts.get("block_size", 16 << 20)
+    proc_dir, path = Path(proc_dir), Path(folder) / csv_name
+    version, year, month = file_id.split("-")
+    extra = {"version": version, "year": year, "month": month}
+    tbl   = csv_name.replace(".csv", "")
+    res = {"file_id": file_id, "csv": csv_name, "status": "ok", "out": None, "rows": 0,
+           "error": None, "demoted": [], "bytes": 0, "seconds": 0.0}
+
+    try:
+        res["bytes"] = path.stat().st_size
+        if engine == "arrow":
+            names = _csv_header(path)
+            df = None
+        else:
+            df = pd.read_csv(path, low_memory=False)
+            names = list(df.columns)
+    except Exception as e:
+        res.update(status="error", error=f"Error leyendo {path}: {e}",
+                   seconds=round(time.perf_counter() - t0, 3))
+        return res
+
+    base_cols = sorted(c for c in names if c not in extra)
+    sig = signature(base_cols)
+
+    if opts.get("layout") == "hive":
+        drop    = tuple(opts.get("partitions", extra))
+        out_dir = proc_dir / tbl
+        for k in drop:
+            out_dir = out_dir / f"{k}={extra[k]}"
+    else:
+        drop    = ()
+        out_dir = proc_dir / tbl / f"signature_{sig}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_file = out_dir / f"{file_id}.parquet"
+    sigcat   = catalog.SignatureCatalog(opts["catalog_db"]) if opts.get("catalog_db") else None
+    superset = sigcat.table_schema(tbl) if sigcat is not None else None
+    write    = {"drop": drop, "metadata": {"osce.signature": sig}, "write_kw": opts.get("write_kw"),
+                "order": superset.names if superset is not None else None,
+                "hashed": bool(opts.get("row_hash"))}
+
+    registry = catalog.TypeRegistry(opts["types_db"]) if opts.get("types_db") else None
+    known    = {}
+    def resolve_types(sample):
+        if "types" not in known:
+            types = registry.get(tbl, sig) or {}
+            # firma nueva o columnas que hasta ahora solo vinieron vacías
+            fresh = [n for n in sample.schema.names
+                     if n not in types and n not in catalog.PARTITION_COLS]
+            if fresh:
+                types = registry.register(tbl, sig, catalog.infer_types(sample.select(fresh)))
+            known["types"] = types
+        return known["types"]
+
+    try:
+        out_file.unlink(missing_ok=True)
+        if df is not None:
+            df["version"], df["year"], df["month"] = version, year, month
+        for _ in range(len(names) + 1):
+            try:
+                if df is None:
+                    rows = _write_arrow(path, out_file, [n for n in names if n not in extra],
+                                        extra, block_size, registry and resolve_types, **write)
+                else:
+                    rows = _write_pandas(df, out_file, registry and resolve_types, **write)
+                break
+            except _Demoted as d:                  # reintenta con las columnas ensanchadas
+                known["types"] = registry.widen(tbl, sig, d.changes)
+                res["demoted"] += [c for c in d.changes if known["types"][c] == "string"]
+        res.update(out=str(out_file), rows=rows)
+        if opts.get("layout") != "hive":
+            # el file_id cambió de firma: fuera la versión anterior
+            for old in (proc_dir / tbl).glob(f"signature_*/{file_id}.parquet"):
+                if old != out_file:
+                    old.unlink()
+        if sigcat is not None:
+            sigcat.record(tbl, sig, pq.read_schema(out_file), file_id, rows,
+                          _null_columns(out_file))
+    except Exception as e:
+        res.update(status="error", error=f"No se grabó {out_file}: {e}")
+    finally:
+        if registry is not None:
+            registry.close()
+        if sigcat is not None:
+            sigcat.close()
+    res["seconds"] = round(time.perf_counter() - t0, 3)
+    return res
+
+def _parquet_files(part_dir):
+    return sorted(p for p in Path(part_dir).glob("*.parquet") if p.is_file())
+
+def compact_partition(part_dir, write_kw=None):
+    """
+    Fusiona todos los Parquet de una partición hive en un único
+    `compacted-<uuid>.parquet` (row groups y compresión de `write_kw`).
+    Devuelve cuántos archivos se fusionaron (0 si no hacía falta).
+    """
+    files = _parquet_files(part_dir)
+    if len(files) < 2:
+        return 0
+    schema = catalog.unify_schemas([pq.read_schema(f) for f in files])
+    table  = ds.dataset(files, schema=schema, format="parquet").to_table()
+    name   = f"compacted-{uuid.uuid4().hex[:12]}.parquet"
+    tmp    = Path(part_dir) / f".{name}.tmp"
+    pq.write_table(table, tmp, **(write_kw or {}))
+    os.replace(tmp, Path(part_dir) / name)
+    for f in files:
+        f.unlink()
+    return len(files)
 
+def _purge_compacted(part_dir, values, write_kw=None):
+    """
+    Quita de los `compacted-*.parquet` de una partición las filas de un
+    file_id que se va a re-normalizar (`values` = columnas de datos del id,
+    p.ej. {"month": "03"} si se particiona solo por version/year).
+    """
+    for f in Path(part_dir).glob("compacted-*.parquet"):
+        table = pq.read_table(f)
+        if not all(k in table.schema.names for k in values):
+            continue
+        mask = None
+        for k, v in values.items():
+            m = pc.equal(table[k].cast(pa.string()), v)
+            mask = m if mask is None else pc.and_(mask, m)
+        mask = pc.fill_null(mask, False)
+        if not pc.any(mask).as_py():
+            continue
+        rest = table.filter(pc.invert(mask))
+        if rest.num_rows == 0:
+            f.unlink()
+            continue
+        tmp = f.with_name(f".{f.name}.tmp")
+        pq.write_table(rest, tmp, **(write_kw or {}))
+        os.replace(tmp, f)
+
+def _log_result(res):
+    if res["status"] == "ok":
+        logging.info(f"OK  {res['out']}")
+        if res.get("demoted"):
+            logging.warning(f"{res['csv']}: columnas degradadas a string: {', '.join(res['demoted'])}")
+    else:
+        logging.error(res["error"])
+
+def normalization_tasks(file_ids, cfg):
+    """
+    Tareas (proc_dir, carpeta, file_id, csv, opts) de `file_ids` según `cfg`.
+    En layout hive limpia antes lo compactado de las particiones más gruesas
+    que el file_id.
+    """
+    root   = Path(cfg["root_dir"])
+    layout = cfg.get("processed_layout", "signatures")
+    proc   = root / "processed" / ("tables" if layout == "hive" else "signatures")
+    proc.mkdir(parents=True, exist_ok=True)
+
+    opts = {
+        "engine":     cfg.get("normalize_engine", "pandas"),
+        "block_size": int(cfg.get("csv_block_mb", 16) * 1024 * 1024),
+        "types_db":   str(catalog.catalog_path(root)) if cfg.get("typed_columns", False) else None,
+        "catalog_db": str(catalog.catalog_path(root)) if cfg.get("signature_catalog", False) else None,
+        "row_hash":   cfg.get("row_hash", False),
+        "layout":     layout,
+        "partitions": list(cfg.get("hive_partitions", ["version", "year", "month"])),
+        "write_kw":   write_options(cfg),
+    }
+
+    tasks = []
     for file_id in file_ids:
         folder = root / "extracted_csv" / file_id
         if not folder.exists():
@@ -39,36 +338,115 @@ def run_normalization(file_ids=None):
         if len(parts) != 3:
             logging.warning(f"Formato de id desconocido: {file_id}")
             continue
-        version, year, month = parts
 
+        extra = dict(zip(("version", "year", "month"), parts))
         for csv_name in EXPECTED:
-            path = folder / csv_name
-            if not path.exists():
-                continue
+            if (folder / csv_name).exists():
+                tasks.append((str(proc), str(folder), file_id, csv_name, opts))
+                if layout == "hive":
+                    # partición más gruesa que el file_id: limpiar lo compactado antes
+                    part_dir = proc / csv_name.replace(".csv", "")
+                    for k in opts["partitions"]:
+                        part_dir = part_dir / f"{k}={extra[k]}"
+                    rest = {k: v for k, v in extra.items() if k not in opts["partitions"]}
+                    if rest and part_dir.is_dir():
+                        _purge_compacted(part_dir, rest, opts["write_kw"])
+    return tasks
 
-            try:
-                df = pd.read_csv(path, low_memory=False)
-            except Exception as e:
-                logging.error(f"Error leyendo {path}: {e}")
-                continue
+def file_tables(cfg, file_id):
+    """Tablas que aporta un file_id ya extraído (sus CSV esperados presentes)."""
+    folder = Path(cfg["root_dir"]) / "extracted_csv" / file_id
+    return [c.replace(".csv", "") for c in EXPECTED if (folder / c).exists()]
 
-            df["version"], df["year"], df["month"] = version, year, month
-            base_cols = sorted(c for c in df.columns if c not in ("version", "year", "month"))
-            sig = signature(base_cols)
+def write_options(cfg):
+    return {"compression":    cfg.get("parquet_compression", "snappy"),
+            "row_group_size": cfg.get("row_group_rows", 1_000_000)}
 
-            out_dir  = proc / csv_name.replace(".csv", "") / f"signature_{sig}"
-            out_dir.mkdir(parents=True, exist_ok=True)
-            out_file = out_dir / f"{file_id}.parquet"
+def normalize_workers(cfg, n_tasks=None):
+    workers = cfg.get("normalize_workers", 1)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if n_tasks is not None:
+        workers = min(workers, n_tasks)
+    return workers or 1
 
-            try:
-                out_file.unlink(missing_ok=True)
-                df.to_parquet(out_file, index=False)
-                logging.info(f"OK  {out_file}")
-            except Exception as e:
-                logging.error(f"No se grabó {out_file}: {e}")
+def task_result(fut, task):
+    """Resultado (ya registrado en el log) de una tarea enviada a un pool."""
+    _, _, file_id, csv_name, *_ = task
+    try:
+        res = fut.result()
+    except Exception as e:                         # p.ej. proceso hijo caído
+        res = {"file_id": file_id, "csv": csv_name, "status": "error", "out": None,
+               "rows": 0, "error": f"Fallo en proceso hijo ({file_id}/{csv_name}): {e}"}
+    _log_result(res)
+    return res
+
+def compact_results(results, cfg):
+    """(hive, `compact`) fusiona los Parquet de las particiones tocadas por `results`."""
+    if cfg.get("processed_layout", "signatures") != "hive" or not cfg.get("compact", True):
+        return
+    touched = {Path(r["out"]).parent for r in results if r["status"] == "ok"}
+    for part_dir in sorted(touched):
+        n = compact_partition(part_dir, write_options(cfg))
+        if n:
+            logging.info(f"Compactados {n} archivos en {part_dir}")
+
+def run_normalization(file_ids=None, cfg=None, progress=None, on_file=None):
+    """
+    Normaliza los CSV de `file_ids` (todos los de extracted_csv si es None).
+    Con `normalize_workers` > 1 las tareas (file_id, csv) se reparten en un
+    pool de procesos (0 ⇒ un proceso por núcleo).  `progress(hechas, total)`
+    se llama tras cada tarea y `on_file(file_id)` cuando terminan bien todas
+    las de un file_id (si alguna falló no se llama).  Devuelve la lista de
+    resultados por tarea.
+    """
+    from pathlib import Path
+    if cfg is None:
+        CFG = Path(__file__).resolve().parent / "config.yaml"   # mismo directorio que el .py
+        with open(CFG, encoding="utf-8") as f:
+            cfg = yaml.safe_load(f)
+    root = Path(cfg["root_dir"])
+
+    if file_ids is None:
+        file_ids = [p.name for p in (root / "extracted_csv").iterdir() if p.is_dir()]
+
+    if not file_ids:
+        logging.info("No hay IDs para normalizar.")
+        return []
+
+    tasks   = normalization_tasks(file_ids, cfg)
+    workers = normalize_workers(cfg, len(tasks))
+    left    = collections.Counter(t[2] for t in tasks)    # tareas pendientes por file_id
+    failed  = set()
+    results = []
+
+    def _done(res):
+        results.append(res)
+        if progress is not None:
+            progress(len(results), len(tasks))
+        left[res["file_id"]] -= 1
+        if res["status"] != "ok":
+            failed.add(res["file_id"])
+        if on_file is not None and not left[res["file_id"]] and res["file_id"] not in failed:
+            on_file(res["file_id"])
+
+    if workers == 1:
+        for t in tasks:
+            res = normalize_csv(*t)
+            _log_result(res)
+            _done(res)
+    else:
+        logging.info(f"Normalizando {len(tasks)} CSV en {workers} procesos")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(normalize_csv, *t): t for t in tasks}
+            for fut in concurrent.futures.as_completed(futures):
+                _done(task_result(fut, futures[fut]))
+
+    compact_results(results, cfg)
+    return results
 
 if __name__ == "__main__":
     import json, sys, logging
     logging.basicConfig(level=logging.INFO)
     ids = json.loads(sys.stdin.read() or "[]")
-    run_normalization(ids if ids else None)
\ No newline at end of file
+    run_normalization(ids if ids else None)
@@ -0,0 +1,175 @@
+"""
+Candado entre procesos para el ETL y pedidos de corrida.
+
+Solo un run_flow a la vez por root_dir, venga de la web, de flow.py o del
+programador (scheduler.py): el candado es un lock del sistema operativo sobre
+root_dir/state/etl.lock (fcntl en Linux/macOS, msvcrt en Windows), así que
+se libera solo si el proceso muere y nunca queda "pegado".
+
+Si el programador está activo (lo indica su propio candado,
+root_dir/state/scheduler.lock), los pedidos de corrida que llegan mientras
+hay un ETL en curso se anotan en root_dir/state/etl.trigger y él los junta
+en una sola corrida de seguimiento.
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import socket
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:                            # Windows
+    fcntl = None
+    import msvcrt
+
+# msvcrt bloquea un rango de bytes: se usa uno muy lejos del inicio para que
+# los demás procesos puedan leer quién tiene el candado
+_WIN_LOCK_OFFSET = 1 << 30
+
+
+def lock_path(root_dir) -> Path:
+    return Path(root_dir) / "state" / "etl.lock"
+
+def trigger_path(root_dir) -> Path:
+    return Path(root_dir) / "state" / "etl.trigger"
+
+def scheduler_lock_path(root_dir) -> Path:
+    return Path(root_dir) / "state" / "scheduler.lock"
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+class EtlBusy(RuntimeError):
+    """Ya hay un ETL corriendo sobre el mismo root_dir."""
+    def __init__(self, holder: dict | None):
+        self.holder = holder or {}
+        who = ", ".join(f"{k}={v}" for k, v in self.holder.items()) or "otro proceso"
+        super().__init__(f"Ya hay un ETL en curso ({who})")
+
+
+class FileLock:
+    """
+    Lock exclusivo y no bloqueante sobre un archivo.  acquire() devuelve
+    False si otro proceso (u otro FileLock del mismo proceso) lo tiene; al
+    tomarlo se escribe en el archivo quién lo tiene (pid, host, owner, desde).
+    Como context manager lanza EtlBusy si está ocupado.
+    """
+    def __init__(self, path, owner: str = ""):
+        self.path  = Path(path)
+        self.owner = owner
+        self._fh   = None
+        self._mutex = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._mutex:
+            if self._fh is not None:
+                return False
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fh = open(self.path, "a+b")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    fh.seek(_WIN_LOCK_OFFSET)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                fh.close()
+                return False
+            info = {"pid": os.getpid(), "host": socket.gethostname(),
+                    "owner": self.owner, "since": _now()}
+            fh.seek(0)
+            fh.truncate()
+            fh.write(json.dumps(info).encode("utf-8"))
+            fh.flush()
+            self._fh = fh
+            return True
+
+    def release(self) -> None:
+        with self._mutex:
+            fh, self._fh = self._fh, None
+            if fh is None:
+                return
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                else:
+                    fh.seek(_WIN_LOCK_OFFSET)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                fh.close()
+
+    @property
+    def locked(self) -> bool:
+        return self._fh is not None
+
+    def holder(self) -> dict | None:
+        """Quién tiene el candado (None si está libre)."""
+        probe = FileLock(self.path)
+        if probe.acquire():
+            probe.release()
+            return None
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8") or "{}")
+        except (OSError, ValueError):
+            return {}
+
+    def __enter__(self):
+        if not self.acquire():
+            raise EtlBusy(self.holder())
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def etl_lock(root_dir, owner: str = "") -> FileLock:
+    return FileLock(lock_path(root_dir), owner)
+
+def running(root_dir) -> dict | None:
+    """Datos del ETL en curso sobre root_dir, o None si no hay ninguno."""
+    return etl_lock(root_dir).holder()
+
+def scheduler_active(root_dir) -> bool:
+    """¿Hay un programador (scheduler.py) atendiendo los pedidos de root_dir?"""
+    return FileLock(scheduler_lock_path(root_dir)).holder() is not None
+
+
+# ── pedidos de corrida ──────────────────────────────────────
+def request_run(root_dir, reason: str = "manual") -> None:
+    """
+    Pide una corrida al programador (una línea por pedido en etl.trigger).
+    Solo la atiende un programador activo (ver scheduler_active).
+    """
+    path = trigger_path(root_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"at": _now(), "reason": reason}) + "\n")
+
+def take_requests(root_dir) -> list[dict]:
+    """
+    Consume los pedidos pendientes (todos juntos: se atienden con una sola
+    corrida).  El archivo se renombra antes de leerlo, así que un pedido
+    que llega mientras tanto queda para la próxima vuelta.
+    """
+    path = trigger_path(root_dir)
+    taken = path.with_name(f"{path.name}.{os.getpid()}")
+    try:
+        os.replace(path, taken)
+    except FileNotFoundError:
+        return []
+    try:
+        lines = taken.read_text(encoding="utf-8").splitlines()
+    finally:
+        taken.unlink(missing_ok=True)
+    reqs = []
+    for line in lines:
+        try:
+            reqs.append(json.loads(line))
+        except ValueError:
+            reqs.append({"at": None, "reason": line.strip() or "manual"})
+    return reqs or [{"at": None, "reason": "manual"}]
@@ -0,0 +1,221 @@
+"""
+Programador del ETL: corre run_flow cada `schedule_every_minutes` bajo el
+candado de runlock.py, para mantener los datos al día con corridas
+incrementales pequeñas en vez de recargas largas esporádicas.
+
+Los pedidos que llegan mientras corre un ETL (de la web, de
+`python scheduler.py --trigger` o de este mismo programador) se juntan en
+una única corrida de seguimiento.  El resultado de cada corrida queda como
+una línea JSON en root_dir/state/schedule.jsonl.
+
+    python scheduler.py              # daemon (Ctrl+C o SIGTERM para salir)
+    python scheduler.py --once       # una sola corrida y termina
+    python scheduler.py --trigger    # pide una corrida al daemon
+    python scheduler.py --status     # ETL en curso, pedidos y últimos resultados
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import logging
+import signal
+import threading
+import time
+from pathlib import Path
+
+import yaml
+
+import metrics
+import runlock
+
+log = logging.getLogger("scheduler")
+
+
+def outcomes_path(root_dir) -> Path:
+    return Path(root_dir) / "state" / "schedule.jsonl"
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def load_outcomes(root_dir, last: int | None = None) -> list[dict]:
+    """Resultados registrados, del más antiguo al más reciente."""
+    path = outcomes_path(root_dir)
+    if not path.exists():
+        return []
+    rows = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            continue
+    return rows[-last:] if last else rows
+
+
+class Scheduler:
+    """
+    Bucle del daemon.  En cada vuelta (cada `schedule_poll_seconds`) junta
+    los motivos para correr: la cadencia vencida, los pedidos de etl.trigger
+    y los de trigger(); si hay alguno corre run_flow una vez para todos.
+
+      * Tras un error se reintenta a los `schedule_retry_minutes` (la
+        corrida se retoma donde quedó, ver journal.py).
+      * Si otro proceso tiene el candado los motivos quedan pendientes y se
+        atienden con una sola corrida cuando se libere.
+      * La cadencia se cuenta desde el fin de la última corrida correcta,
+        también entre reinicios del daemon (se lee de schedule.jsonl).
+    """
+    def __init__(self, cfg: dict, window_days: int | None = None, run=None):
+        if run is None:
+            from flow import run_flow as run
+        self.cfg     = cfg
+        self.root    = cfg["root_dir"]
+        self.window  = window_days
+        self.run     = run
+        self.every   = 60 * float(cfg.get("schedule_every_minutes", 60))
+        self.retry   = 60 * float(cfg.get("schedule_retry_minutes", 10))
+        self.poll    = float(cfg.get("schedule_poll_seconds", 15))
+        self.stop_ev = threading.Event()
+        self._lock   = threading.Lock()
+        self._asked  = []                      # pedidos en proceso (trigger())
+        self._pending = []                     # motivos a la espera del candado
+        self._busy_logged = False
+        self.next_due = self._first_due()
+
+    def _first_due(self) -> float:
+        for row in reversed(load_outcomes(self.root)):
+            if row.get("status") in ("ok", "error"):
+                ends  = datetime.datetime.fromisoformat(row["finished"])
+                delay = self.every if row["status"] == "ok" else self.retry
+                return time.time() + max(0.0, delay - (_utcnow() - ends).total_seconds())
+        return time.time()
+
+    # ── disparadores ────────────────────────────────────────
+    def trigger(self, reason: str = "manual") -> None:
+        with self._lock:
+            self._asked.append({"at": _utcnow().isoformat(timespec="seconds"), "reason": reason})
+
+    def stop(self, *_) -> None:
+        self.stop_ev.set()
+
+    def _reasons(self) -> list[dict]:
+        with self._lock:
+            reasons, self._asked = self._pending + self._asked, []
+            self._pending = []
+        reasons += runlock.take_requests(self.root)
+        if time.time() >= self.next_due and all(r["reason"] != "cadence" for r in reasons):
+            reasons.append({"at": _utcnow().isoformat(timespec="seconds"), "reason": "cadence"})
+        return reasons
+
+    # ── corrida ─────────────────────────────────────────────
+    def run_once(self, reasons: list[dict] | None = None) -> dict:
+        """Corre el ETL una vez y registra el resultado (status ok | error | busy)."""
+        reasons = reasons or [{"at": _utcnow().isoformat(timespec="seconds"), "reason": "manual"}]
+        outcome = {"started": _utcnow().isoformat(timespec="seconds"),
+                   "reasons": sorted({r["reason"] for r in reasons}),
+                   "requests": len(reasons)}
+        t0 = time.perf_counter()
+        try:
+            record = self.run(self.window, owner="scheduler")
+        except runlock.EtlBusy as e:
+            outcome.update(status="busy", holder=e.holder)
+        except Exception as e:
+            log.exception("Fallo la corrida programada")
+            outcome.update(status="error", error=f"{type(e).__name__}: {e}")
+        else:
+            outcome["status"] = "ok"
+            if isinstance(record, dict) and "run_id" in record:
+                outcome.update({k: v for k, v in metrics.summary(record).items()
+                                if k not in ("status", "seconds")})
+        outcome["finished"] = _utcnow().isoformat(timespec="seconds")
+        outcome["seconds"]  = round(time.perf_counter() - t0, 3)
+
+        if outcome["status"] == "busy":
+            # se reintenta en la próxima vuelta, juntando todo lo que llegue
+            with self._lock:
+                self._pending = reasons + self._pending
+            if self._busy_logged:
+                return outcome
+            self._busy_logged = True
+        else:
+            self._busy_logged = False
+            self.next_due = time.time() + (self.every if outcome["status"] == "ok" else self.retry)
+        self._record(outcome)
+        return outcome
+
+    def _record(self, outcome: dict) -> None:
+        path = outcomes_path(self.root)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(outcome, ensure_ascii=False) + "\n")
+        log.info("Corrida programada: %s (%s) en %.1f s", outcome["status"],
+                 ", ".join(outcome["reasons"]), outcome["seconds"])
+
+    def serve(self) -> None:
+        """Bucle hasta stop(); una corrida en curso siempre se deja terminar."""
+        log.info("Programador activo: cada %.0f min, primera corrida %s",
+                 self.every / 60,
+                 datetime.datetime.fromtimestamp(self.next_due).isoformat(timespec="seconds"))
+        while not self.stop_ev.is_set():
+            reasons = self._reasons()
+            if reasons and self.run_once(reasons)["status"] != "busy":
+                continue                       # lo que llegó durante la corrida, enseguida
+            self.stop_ev.wait(max(1.0, min(self.poll, self.next_due - time.time())))
+        log.info("Programador detenido")
+
+
+def _load_cfg() -> dict:
+    return yaml.safe_load((Path(__file__).resolve().parent / "config.yaml").read_text(encoding="utf-8"))
+
+def _status(cfg: dict, last: int) -> None:
+    holder = runlock.running(cfg["root_dir"])
+    print(f"ETL en curso: {holder}" if holder is not None else "Sin ETL en curso")
+    trig = runlock.trigger_path(cfg["root_dir"])
+    if trig.exists():
+        print(f"Pedidos pendientes: {len(trig.read_text(encoding='utf-8').splitlines()) or 1}")
+    for row in load_outcomes(cfg["root_dir"], last):
+        extra = row.get("run_id") or row.get("error") or row.get("holder") or ""
+        print(f"{row['started']}  {row['status']:<6} {row['seconds']:>9.1f} s  "
+              f"{','.join(row['reasons']):<20} {extra}")
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Corre el ETL periódicamente bajo un candado entre procesos")
+    ap.add_argument("--once", action="store_true", help="una sola corrida y termina")
+    ap.add_argument("--trigger", action="store_true", help="pide una corrida al daemon y termina")
+    ap.add_argument("--status", action="store_true", help="estado y últimos resultados")
+    ap.add_argument("--last", type=int, default=10, help="(--status) cuántos resultados mostrar")
+    ap.add_argument("--window-days", type=int, default=None, help="override del window_days de config.yaml")
+    args = ap.parse_args(argv)
+
+    cfg = _load_cfg()
+    if args.trigger:
+        if not runlock.scheduler_active(cfg["root_dir"]):
+            raise SystemExit("No hay un programador activo: usa --once o lanza el daemon")
+        runlock.request_run(cfg["root_dir"], "cli")
+        print("Corrida pedida" + (" (se hará al terminar la actual)"
+                                  if runlock.running(cfg["root_dir"]) else ""))
+        return
+    if args.status:
+        _status(cfg, args.last)
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    sched = Scheduler(cfg, args.window_days)
+    if args.once:
+        out = sched.run_once()
+        raise SystemExit(0 if out["status"] == "ok" else 1)
+
+    # un solo daemon por root_dir (el candado del ETL lo toma cada corrida)
+    daemon = runlock.FileLock(runlock.scheduler_lock_path(cfg["root_dir"]), "scheduler")
+    if not daemon.acquire():
+        raise SystemExit(f"Ya hay un programador activo: {daemon.holder()}")
+    signal.signal(signal.SIGTERM, sched.stop)
+    try:
+        sched.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.release()
+
+if __name__ == "__main__":
+    main()
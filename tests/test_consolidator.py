@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import yaml
+
+import consolidator
+import normalizer
+
+CFG = yaml.safe_load((Path(__file__).resolve().parents[1] / "config.yaml").read_text(encoding="utf-8"))
+
+
+def _month(cfg, file_id, n_rows):
+    folder = Path(cfg["root_dir"]) / "extracted_csv" / file_id
+    folder.mkdir(parents=True, exist_ok=True)
+    rows = "".join(f"ocds-{i},{i * 10}\n" for i in range(n_rows))
+    (folder / "records.csv").write_text("ocid,value/amount\n" + rows, encoding="utf-8")
+    results = normalizer.run_normalization([file_id], cfg)
+    assert [r["status"] for r in results] == ["ok"]
+    return consolidator.run_consolidation([file_id], cfg)
+
+
+def test_changed_file_reports_only_its_new_rows(tmp_path):
+    cfg = dict(CFG, root_dir=str(tmp_path), normalize_workers=1)
+    assert _month(cfg, "seace_v3-2025-01", 150) == {"records": {"seace_v3-2025-01": 150}}
+    # el mes se vuelve a descargar con una fila más
+    assert _month(cfg, "seace_v3-2025-01", 151) == {"records": {"seace_v3-2025-01": 1}}
+    # sin cambios no hay filas nuevas, y el índice no pierde las anteriores
+    assert _month(cfg, "seace_v3-2025-01", 151) == {"records": {"seace_v3-2025-01": 0}}
@@ -0,0 +1,106 @@
+import csv
+
+import pyarrow.parquet as pq
+
+import catalog
+import normalizer
+
+FILE_ID = "seace_v3-2025-03"
+
+
+def _normalize(tmp_path, engine, **opts):
+    res = normalizer.normalize_csv(tmp_path / f"proc_{engine}", tmp_path / "csv", FILE_ID,
+                                   "records.csv", {"engine": engine, **opts})
+    assert res["status"] == "ok", res["error"]
+    return res, pq.read_table(res["out"])
+
+
+def test_arrow_multiline_values_across_blocks(tmp_path):
+    (tmp_path / "csv").mkdir()
+    with open(tmp_path / "csv" / "records.csv", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["ocid", "compiledRelease/tender/description"])
+        for i in range(2000):
+            w.writerow([f"ocds-{i}", f"línea 1 de {i}\nlínea 2, \"citada\"\nlínea 3"])
+
+    res, table = _normalize(tmp_path, "arrow", block_size=4096)
+    _, expected = _normalize(tmp_path, "pandas")
+    assert res["rows"] == 2000
+    desc = "compiledRelease/tender/description"
+    assert table[desc].to_pylist() == expected[desc].to_pylist()
+    assert table[desc][5].as_py() == 'línea 1 de 5\nlínea 2, "citada"\nlínea 3'
+
+
+def test_bom_header_same_columns_in_both_engines(tmp_path):
+    (tmp_path / "csv").mkdir()
+    (tmp_path / "csv" / "records.csv").write_text("id,ocid\n1,ocds-1\n2,ocds-2\n",
+                                                  encoding="utf-8-sig")
+
+    _, arrow  = _normalize(tmp_path, "arrow")
+    _, pandas = _normalize(tmp_path, "pandas")
+    assert arrow.schema.names == pandas.schema.names
+    assert arrow.schema.names[0] == "id"
+    assert arrow.schema.metadata[b"osce.signature"] == pandas.schema.metadata[b"osce.signature"]
+
+
+def _write(tmp_path, file_id, text):
+    folder = tmp_path / "csv" / file_id
+    folder.mkdir(parents=True)
+    (folder / "com_awards.csv").write_text(text, encoding="utf-8")
+    return folder
+
+
+def _typed(tmp_path, file_id, text, engine="arrow"):
+    folder = _write(tmp_path, file_id, text)
+    opts = {"engine": engine, "types_db": str(tmp_path / "catalog.sqlite"),
+            "catalog_db": str(tmp_path / "catalog.sqlite")}
+    res = normalizer.normalize_csv(tmp_path / "proc", folder, file_id, "com_awards.csv", opts)
+    assert res["status"] == "ok", res["error"]
+    return res, pq.read_schema(res["out"])
+
+
+HEADER = "id,value/amount,date\n"
+
+
+def test_int_column_widens_to_float(tmp_path):
+    _, first = _typed(tmp_path, "seace_v3-2025-01", HEADER + "1,100,2025-01-02T10:00:00Z\n")
+    res, second = _typed(tmp_path, "seace_v3-2025-02", HEADER + "2,250.5,2025-02-03\n")
+    assert str(first.field("value/amount").type) == "int64"
+    assert str(second.field("value/amount").type) == "double"
+    # fecha sin zona en una columna con zona: se lee como UTC, no pasa a string
+    assert str(second.field("date").type) == "timestamp[us, tz=UTC]"
+    assert res["demoted"] == []
+
+
+def test_empty_first_file_does_not_fix_string_types(tmp_path):
+    _, empty = _typed(tmp_path, "seace_v3-2025-01", HEADER)
+    _, full  = _typed(tmp_path, "seace_v3-2025-02",
+                      HEADER + "1,100.5,2025-02-03T10:00:00Z\n2,7,2025-02-04T10:00:00Z\n")
+    assert [str(f.type) for f in empty if f.name in ("id", "value/amount", "date")] == \
+           ["string"] * 3
+    assert [str(full.field(c).type) for c in ("id", "value/amount", "date")] == \
+           ["int64", "double", "timestamp[us, tz=UTC]"]
+
+    cat = catalog.SignatureCatalog(tmp_path / "catalog.sqlite")
+    superset = cat.table_schema("com_awards")
+    cat.close()
+    assert str(superset.field("value/amount").type) == "double"
+
+
+def test_all_null_column_stays_unregistered(tmp_path):
+    _typed(tmp_path, "seace_v3-2025-01", HEADER + "1,,2025-01-02T10:00:00Z\n", engine="pandas")
+    _, second = _typed(tmp_path, "seace_v3-2025-02", HEADER + "2,99.9,2025-02-03T10:00:00Z\n",
+                       engine="pandas")
+    assert str(second.field("value/amount").type) == "double"
+
+
+def test_zero_padded_code_is_never_cast_to_int(tmp_path):
+    header = "id,buyer/ubigeo\n"
+    _, first = _typed(tmp_path, "seace_v3-2025-01", header + "1,150101\n2,150102\n")
+    res, second = _typed(tmp_path, "seace_v3-2025-02",
+                         header + "3,010101\n4,12345678901234567890\n")
+    assert str(first.field("buyer/ubigeo").type) == "int64"
+    assert str(second.field("buyer/ubigeo").type) == "string"
+    assert res["demoted"] == ["buyer/ubigeo"]
+    assert pq.read_table(res["out"])["buyer/ubigeo"].to_pylist() == \
+           ["010101", "12345678901234567890"]
@@ -11,6 +11,8 @@ from pathlib import Path
 from flask import Flask, jsonify, render_template, send_file, url_for, request
 from flask_socketio import SocketIO, join_room
 
+import runlock
+
 # ────────────────────────────────────
 #  Agente NL2SQL  (carga diferida)
 # ────────────────────────────────────
@@ -20,6 +22,8 @@ import traceback, sys
 AGENT: NL2SQLAgent | None = None
 _LOAD_ERR: Exception | None = None
 _RELOADING = False
+_WARM_LOCK = threading.Lock()
+_WARMING   = False
 
 def _create_agent() -> NL2SQLAgent:
     """Construye y devuelve el agente NL2SQL (puede tardar)."""
@@ -38,8 +42,22 @@ def _warm_up():
         print(f"❌  [warm-up] Error al precargar: {exc!r}", file=sys.stderr)
         traceback.print_exc()
 
+def start_warm_up() -> None:
+    """
+    Precarga el agente en un hilo (una sola vez).  No se lanza al importar
+    el módulo: los procesos hijos del ETL (spawn en Windows) re-importan
+    __main__ y cargarían el modelo en cada worker.
+    """
+    global _WARMING
+    with _WARM_LOCK:
+        if _WARMING:
+            return
+        _WARMING = True
+    threading.Thread(target=_warm_up, daemon=True).start()
+
 def get_agent() -> NL2SQLAgent:
     if AGENT is None:
+        start_warm_up()                    # p.ej. app servida sin main.py
         raise RuntimeError("El motor NL2SQL todavía no está listo")
     return AGENT
 
@@ -69,9 +87,6 @@ def reset_agent() -> None:
 app = Flask(__name__)
 socketio = SocketIO(app, async_mode="threading")          # instancia única
 
-# Lanza el warm-up nada más definir la app
-threading.Thread(target=_warm_up, daemon=True).start()
-
 # -------- SocketIO events ----------
 @socketio.on("join")
 def handle_join(job_id: str):
@@ -100,6 +115,15 @@ def start_etl():
     data   = request.get_json(silent=True) or {}
     window = data.get("window_days", DEFAULT_WINDOW)  # ① usa POST, ② cfg, ③ 120
 
+    # un ETL a la vez (runlock.py): si hay otro en curso y el programador
+    # (scheduler.py) está activo, él hará una corrida de seguimiento
+    holder = runlock.running(_CFG["root_dir"])
+    if holder is not None:
+        if runlock.scheduler_active(_CFG["root_dir"]):
+            runlock.request_run(_CFG["root_dir"], "web")
+            return jsonify({"queued": True, "running": holder, "window_days": window})
+        return jsonify({"busy": True, "running": holder, "window_days": window}), 409
+
     job_id = str(uuid.uuid4())
     from .tasks import run_etl
     threading.Thread(
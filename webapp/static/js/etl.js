@@ -71,9 +71,24 @@ btn.addEventListener("click", async () => {
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify(body)
     });
-    if (!resp.ok) throw new Error(await resp.text());
-
-    const { job_id, window_days } = await resp.json();
+    if (!resp.ok && resp.status !== 409) throw new Error(await resp.text());
+
+    const { job_id, window_days, queued, busy, running } = await resp.json();
+
+    /* ya hay un ETL en curso: con el programador activo queda pedida una
+       corrida de seguimiento; sin él, hay que esperar a que termine */
+    if (queued || busy) {
+      addLog(`⏳  Ya hay un ETL en curso (${running.owner || "otro proceso"} ` +
+             `desde ${running.since || "?"})` +
+             (queued ? "; se pidió una corrida de seguimiento."
+                     : ". Vuelve a lanzarlo cuando termine."));
+      blockLeave = false;
+      setTimeout(() => {
+        ov.classList.add("hidden");
+        btn.disabled = false;
+      }, 2500);
+      return;
+    }
     addLog(`🚀  ETL lanzado (ventana = ${window_days} días)`);
 
     /* únete a la sala de WebSocket */
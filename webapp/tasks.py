@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from .app import reset_agent
+from .app import reset_agent, _CFG
 
 from typing import TYPE_CHECKING
 
@@ -10,6 +10,7 @@ if TYPE_CHECKING:
     from flask_socketio import SocketIO
 
 from flow import run_flow
+import runlock
 
 import logging
 
@@ -49,7 +50,8 @@ def run_etl(socketio, job_id: str, window_days: int | None = None):
             window_days,
             progress=lambda pct, msg: socketio.emit(
                 "progress", {"msg": msg, "pct": pct}, room=job_id
-            )
+            ),
+            owner="web"
         )
 
         # Una vez consolidado, recarga el agente con datos frescos
@@ -59,6 +61,15 @@ def run_etl(socketio, job_id: str, window_days: int | None = None):
         socketio.emit("progress", {"msg": "✔️ ETL terminado", "pct": 100}, room=job_id)
         logging.info("ETL %s — FIN OK", job_id)
 
+    except runlock.EtlBusy as exc:
+        # otro ETL tomó el candado entre /start_etl y este hilo
+        msg = f"⚠️ {exc}"
+        if runlock.scheduler_active(_CFG["root_dir"]):
+            runlock.request_run(_CFG["root_dir"], "web")
+            msg += ": se pidió una corrida de seguimiento"
+        socketio.emit("progress", {"msg": msg, "pct": -1}, room=job_id)
+        logging.info("ETL %s — ocupado (%s)", job_id, exc)
+
     except Exception as exc:
         socketio.emit("progress", {"msg": f"⚠️ Error: {exc}", "pct": -1}, room=job_id)
         logging.exception("Fallo inesperado en ETL %s", job_id)